@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Compare la latence des lectures par numéro d'entreprise : requêtes Mongo directes et API
+locale (kbo_scraper/api.py) avec son cache, à l'unité et par lots.
+Les numéros sont tirés avec une distribution de Zipf (quelques entreprises très demandées),
+parmi les entreprises de la collection.
+Usage:
+  python benchmarks/bench_api.py --mongo-uri mongodb://localhost:27017 --requests 5000
+  python benchmarks/bench_api.py --mongo-db kbo_bench --seed 20000   # collection synthétique
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pymongo
+
+from kbo_scraper.api import HIDDEN_FIELDS, ReadAPI
+from kbo_scraper.enterprise_numbers import dotted
+
+
+def seed_collection(collection, count):
+    """Documents synthétiques au format du pipeline (numéros valides, clé de contrôle comprise)"""
+    import numpy as np
+
+    bases = np.arange(2_000_000, 2_000_000 + count, dtype=np.int64)  # 0200.000.0xx...
+    values = bases * 100 + (97 - bases % 97)
+    collection.delete_many({})
+    collection.insert_many([
+        {
+            "enterprise_number": number,
+            "company_name": f"Entreprise {i}",
+            "status": "Actif",
+            "functions": [{"role": "Administrateur", "name": f"Nom {j}", "date": None} for j in range(8)],
+            "moniteur_publications": [{"title": f"Statuts {j}", "publication_number": str(j)} for j in range(5)],
+            "deposits": [{"title": "Modèle complet", "reference": f"2025-{i:08d}"}],
+        }
+        for i, number in enumerate(dotted(values))
+    ])
+    collection.create_index("enterprise_number", unique=True)
+
+
+def zipf_sample(numbers, count, exponent, rng):
+    weights = [1 / (rank + 1) ** exponent for rank in range(len(numbers))]
+    return rng.choices(numbers, weights=weights, k=count)
+
+
+def measure(func, items):
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - t0)
+    return time.perf_counter() - start, latencies
+
+
+def report(label, elapsed, latencies, unit=1):
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"{label:<28} {len(latencies) * unit / elapsed:>10.0f} {quantiles[49] * 1000:>9.3f} "
+          f"{quantiles[94] * 1000:>9.3f} {quantiles[98] * 1000:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de l'API de lecture locale contre Mongo direct")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--mongo-db", default="kbo_db")
+    parser.add_argument("--seed", type=int, help="Remplacer la collection par N documents synthétiques")
+    parser.add_argument("--requests", type=int, default=5000, help="Lectures par mesure")
+    parser.add_argument("--batch", type=int, default=50, help="Numéros par lot")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Exposant de la distribution des numéros")
+    parser.add_argument("--cache-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    client = pymongo.MongoClient(args.mongo_uri)
+    collection = client[args.mongo_db].entreprises
+    if args.seed:
+        seed_collection(collection, args.seed)
+    numbers = [doc["enterprise_number"] for doc in collection.find({"enterprise_number": {"$gt": ""}},
+                                                                  {"enterprise_number": 1, "_id": 0})]
+    if not numbers:
+        print("Collection vide : utiliser --seed N")
+        return
+
+    rng = random.Random(42)
+    rng.shuffle(numbers)
+    lookups = zipf_sample(numbers, args.requests, args.zipf, rng)
+    batches = [zipf_sample(numbers, args.batch, args.zipf, rng) for _ in range(max(args.requests // args.batch, 1))]
+
+    api = ReadAPI(collection, port=0, cache_size=args.cache_size)
+    host, port = api.server.server_address[:2]
+    api.start()
+    connection = http.client.HTTPConnection(host, port)
+
+    def read(response):
+        body = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status}: {body[:200]!r}")
+        return body
+
+    def api_get(number):
+        connection.request("GET", f"/enterprises/{number}")
+        read(connection.getresponse())
+
+    def api_batch(batch):
+        body = json.dumps({"numbers": batch})
+        connection.request("POST", "/enterprises/batch", body, {"Content-Type": "application/json"})
+        read(connection.getresponse())
+
+    print(f"{len(numbers)} entreprises, {args.requests} lectures (Zipf {args.zipf}), lots de {args.batch}")
+    print(f"{'mode':<28} {'numéros/s':>10} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9}")
+    report("mongo find_one", *measure(lambda n: collection.find_one({"enterprise_number": n}, HIDDEN_FIELDS),
+                                      lookups))
+    report("api (1er passage)", *measure(api_get, lookups))
+    report("api (2e passage)", *measure(api_get, lookups))
+    report(f"mongo $in x{args.batch}", *measure(
+        lambda b: list(collection.find({"enterprise_number": {"$in": b}}, HIDDEN_FIELDS)), batches), args.batch)
+    report(f"api lot x{args.batch}", *measure(api_batch, batches), args.batch)
+    print(f"cache: {api.cache.stats()}")
+
+    connection.close()
+    api.shutdown()
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
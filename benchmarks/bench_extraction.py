@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Compare l'extraction HTML dans le callback (thread du réacteur) et dans un pool de
+processus, sur les pages du cache HTTP (.scrapy/httpcache).
+Usage:
+  python benchmarks/bench_extraction.py --repeat 20 --workers 1 2 4
+"""
+import argparse
+import glob
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kbo_scraper import extractors
+
+CACHE_DIR = os.path.join(ROOT, ".scrapy", "httpcache")
+
+# spider -> (fonction exécutée dans le pool, arguments après body/url/encoding)
+CASES = {
+    "kbo_spider": (extractors.extract_enterprise_from_body, ()),
+    "ejustice_spider": (extractors.extract_publication_list_from_body, ("0000.000.000",)),
+}
+
+
+def cached_pages(spider):
+    """(url, body) des réponses 200 du cache de `spider`"""
+    pages = []
+    for entry in sorted(glob.glob(os.path.join(CACHE_DIR, spider, "*", "*"))):
+        with open(os.path.join(entry, "pickled_meta"), "rb") as f:
+            meta = pickle.load(f)
+        if meta["status"] != 200:
+            continue
+        with open(os.path.join(entry, "response_body"), "rb") as f:
+            pages.append((meta["url"], f.read()))
+    return pages
+
+
+def run_inline(func, pages, args):
+    start = time.perf_counter()
+    for url, body in pages:
+        func(body, url, "utf-8", *args)
+    return time.perf_counter() - start
+
+
+def run_pooled(func, pages, args, workers):
+    """Durée totale et temps passé par l'appelant à soumettre (ce que le réacteur bloque)"""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Démarrage des workers et import des extracteurs hors mesure
+        list(executor.map(func, [pages[0][1]] * workers, [pages[0][0]] * workers,
+                          ["utf-8"] * workers, *([a] * workers for a in args)))
+        start = time.perf_counter()
+        futures = [executor.submit(func, body, url, "utf-8", *args) for url, body in pages]
+        submitted = time.perf_counter() - start
+        for future in futures:
+            future.result()
+        return time.perf_counter() - start, submitted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de l'extraction HTML en ligne / en pool")
+    parser.add_argument("--repeat", type=int, default=20, help="Nombre de passages sur les pages du cache")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Tailles de pool à mesurer")
+    args = parser.parse_args()
+
+    print(f"{'spider':<16} {'mode':<10} {'pages':>6} {'pages/s':>9} {'réacteur bloqué (ms/page)':>27}")
+    for spider, (func, extra) in CASES.items():
+        pages = cached_pages(spider) * args.repeat
+        if not pages:
+            print(f"{spider:<16} aucune page en cache")
+            continue
+
+        elapsed = run_inline(func, pages, extra)
+        print(f"{spider:<16} {'inline':<10} {len(pages):>6} {len(pages) / elapsed:>9.1f} "
+              f"{elapsed / len(pages) * 1000:>27.2f}")
+
+        for workers in args.workers:
+            elapsed, submitted = run_pooled(func, pages, extra, workers)
+            print(f"{spider:<16} {f'pool x{workers}':<10} {len(pages):>6} {len(pages) / elapsed:>9.1f} "
+                  f"{submitted / len(pages) * 1000:>27.2f}")
+
+
+if __name__ == "__main__":
+    main()
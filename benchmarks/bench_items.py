@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Compare les items `scrapy.Item` aux items compacts (__slots__) sur le chemin chaud :
+mémoire par item en vol et CPU des pipelines (validation, déduplication, document Mongo).
+Usage:
+  python benchmarks/bench_items.py --count 20000 --repeat 5
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from itemadapter import ItemAdapter
+
+from kbo_scraper.items import (
+    ConsultRecord,
+    EnterpriseRecord,
+    KboScraperItem,
+    PublicationRecord,
+)
+from kbo_scraper.pipelines import MongoPipeline, PublicationDeduplicationPipeline, ValidationPipeline, item_to_document
+from kbo_scraper.schema import SCHEMA_VERSION
+
+ENTERPRISE_FIELDS = {
+    "status": "Actif",
+    "juridical_situation": "Situation normale",
+    "start_date": datetime(1960, 8, 9),
+    "company_name": "Intergemeentelijke Vereniging Veneco",
+    "abbreviation": "Veneco",
+    "headquarters_address": "Panhuisstraat 1 9070 Destelbergen",
+    "phone": None,
+    "email": None,
+    "website": None,
+    "entity_type": "Personne morale",
+    "legal_form": "Association prestataire de services (Région flamande)",
+    "establishment_units": 1,
+    "qualities": [{"name": "Employeur ONSS", "date": None}],
+    "functions": [{"role": "Administrateur", "name": "Doe, John", "date": None}] * 12,
+    "nace_codes": [{"version": "2025", "type": "TVA", "code": "68.121", "description": "Promotion", "date": None}],
+    "financial_data": {"capital": {"amount": Decimal("18550.00"), "currency": "EUR"}, "general_assembly": "mai",
+                       "fiscal_year_end": "31 décembre"},
+    "entity_links": None,
+    "external_links": [],
+    "entrepreneurial_capacities": [],
+    "authorizations": [],
+    "schema_version": SCHEMA_VERSION,
+}
+
+PUBLICATIONS = json.dumps([
+    {"enterprise_number": "0200.065.765", "title": f"Statuts {i}", "publication_number": str(i),
+     "publication_date": "2024-01-01", "publication_ref": str(i)}
+    for i in range(5)
+])
+
+DEPOSITS = [{"title": "Modèle complet", "reference": "2025-00277697", "language": "FR"}] * 5
+
+# (type, (classe scrapy.Item, classe compacte), fabrique de champs)
+CASES = {
+    "enterprise": (KboScraperItem, EnterpriseRecord, lambda i: dict(ENTERPRISE_FIELDS, enterprise_number=f"{i:010d}")),
+    "publication": (KboScraperItem, PublicationRecord,
+                    lambda i: {"enterprise_number": f"{i:010d}", "moniteur_publications": PUBLICATIONS}),
+    "consult": (KboScraperItem, ConsultRecord,
+                lambda i: {"enterprise_number": f"{i:010d}", "url": "https://consult.cbso.nbb.be", "deposits": DEPOSITS}),
+}
+
+SPIDER_NAMES = {"enterprise": "kbo_spider", "publication": "ejustice_spider", "consult": "consult_spider"}
+
+
+def measure_memory(cls, factory, count):
+    """Octets alloués par item (valeurs partagées : seul le conteneur est mesuré)"""
+    fields = [factory(i) for i in range(count)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = [cls(**f) for f in fields]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del items
+    return (after - before) / count
+
+
+def measure_pipelines(cls, factory, count, spider_name):
+    """Secondes CPU pour passer `count` items dans les pipelines (sans écriture Mongo), GC
+    suspendu : les collectes déclenchées par les autres mesures ne s'ajoutent pas à celle-ci"""
+    spider = SimpleNamespace(name=spider_name, logger=logging.getLogger("bench"))
+    validation = ValidationPipeline()
+    dedup = PublicationDeduplicationPipeline()
+    mongo = MongoPipeline(None, None)
+    items = [cls(**factory(i)) for i in range(count)]
+
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.process_time()
+        for item in items:
+            item = validation.process_item(item, spider)
+            item = dedup.process_item(item, spider)
+            document = item_to_document(ItemAdapter(item))
+            mongo.compute_fingerprint(document)
+        return time.process_time() - start
+    finally:
+        gc.enable()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des classes d'items")
+    parser.add_argument("--count", type=int, default=20000, help="Nombre d'items par mesure")
+    parser.add_argument("--repeat", type=int, default=5, help="Mesures CPU par classe (la meilleure est gardée)")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    print(f"{'type':<12} {'classe':<18} {'octets/item':>12} {'µs CPU/item':>12}")
+    for name, (item_cls, record_cls, factory) in CASES.items():
+        # Mesures des deux classes alternées : une variation de charge de la machine
+        # touche les deux, pas seulement celle mesurée à ce moment-là
+        cpu = {cls: [] for cls in (item_cls, record_cls)}
+        for _ in range(args.repeat):
+            for cls in cpu:
+                cpu[cls].append(measure_pipelines(cls, factory, args.count, SPIDER_NAMES[name]))
+        for cls, timings in cpu.items():
+            memory = measure_memory(cls, factory, args.count)
+            print(f"{name:<12} {cls.__name__:<18} {memory:>12.0f} {min(timings) / args.count * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
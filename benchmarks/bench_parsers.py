@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Compare les backends de parsing HTML (kbo_scraper/extractors.py, HTML_PARSER_BACKEND) sur
+les pages du cache HTTP (.scrapy/httpcache) : temps de parsing seul, temps parsing +
+extraction, octets parsés et pic mémoire Python par page (tracemalloc : hors allocations
+internes de libxml2).
+--verify vérifie d'abord que tous les backends donnent exactement le même résultat
+que "parsel" (code de sortie 1 sinon).
+Usage:
+  python benchmarks/bench_parsers.py --verify --repeat 50
+  python benchmarks/bench_parsers.py --encoding cp1252
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_extraction import cached_pages
+from kbo_scraper import extractors
+
+# spider -> (page, partie de l'URL des pages concernées, fonction d'extraction sur le body,
+# arguments entre encoding et backend)
+CASES = {
+    "kbo_spider": ("enterprise", "toonondernemingps", extractors.extract_enterprise_from_body, ()),
+    "ejustice_spider": ("publication_list", "list.pl", extractors.extract_publication_list_from_body,
+                        ("0000.000.000",)),
+}
+
+
+def verify(pages, page, func, extra, encoding):
+    """URLs dont le résultat diffère de celui de "parsel", par backend"""
+    differences = {}
+    for url, body in pages:
+        expected = func(body, url, encoding, *extra, "parsel")
+        for backend in extractors.PARSER_BACKENDS:
+            if func(body, url, encoding, *extra, backend) != expected:
+                differences.setdefault(backend, []).append(url)
+    return differences
+
+
+def timed(func, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for url, body in pages:
+            func(url, body)
+    return (time.perf_counter() - start) / (repeat * len(pages))
+
+
+def peak_memory(func, pages):
+    """Pic tracemalloc le plus haut sur une page (sélecteur gardé jusqu'à la fin de l'appel)"""
+    peak = 0
+    for url, body in pages:
+        tracemalloc.start()
+        func(url, body)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des backends de parsing HTML")
+    parser.add_argument("--repeat", type=int, default=20, help="Nombre de passages sur les pages du cache")
+    parser.add_argument("--encoding", default="utf-8", help="Encodage passé aux extracteurs")
+    parser.add_argument("--verify", action="store_true", help="Vérifier l'égalité des résultats entre backends")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'spider':<16} {'backend':<8} {'pages':>6} {'Ko parsés':>10} {'parse (ms)':>11} "
+          f"{'+ extraction (ms)':>18} {'pic Python (Ko)':>17}")
+    for spider, (page, url_part, func, extra) in CASES.items():
+        pages = [(url, body) for url, body in cached_pages(spider) if url_part in url]
+        if not pages:
+            print(f"{spider:<16} aucune page en cache")
+            continue
+
+        if args.verify:
+            differences = verify(pages, page, func, extra, args.encoding)
+            for backend, urls in differences.items():
+                failed = True
+                print(f"❌ {spider} / {backend} : {len(urls)} page(s) différente(s), ex. {urls[0]}")
+            if not differences:
+                print(f"✅ {spider} : résultats identiques sur {len(pages)} pages")
+
+        for backend in extractors.PARSER_BACKENDS:
+            def parse(url, body):
+                return extractors.page_selector(body, url, args.encoding, page, backend)
+
+            def extract(url, body):
+                return func(body, url, args.encoding, *extra, backend)
+
+            parsed = 0
+            for url, body in pages:
+                bounds = extractors.page_slice(body, page) if backend == "sliced" else None
+                parsed += bounds[1] - bounds[0] if bounds else len(body)
+            print(f"{spider:<16} {backend:<8} {len(pages):>6} {parsed / len(pages) / 1024:>10.1f} "
+                  f"{timed(parse, pages, args.repeat) * 1000:>11.3f} "
+                  f"{timed(extract, pages, args.repeat) * 1000:>18.3f} "
+                  f"{peak_memory(extract, pages) / 1024:>17.0f}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
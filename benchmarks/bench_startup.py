@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Mesure le coût de démarrage Python d'un crawl, par spider, dans un interpréteur neuf :
+import de Scrapy, chargement des spiders (SpiderLoader, tous les modules de
+SPIDER_MODULES) et initialisation du crawler (spider, extensions, middlewares,
+pipelines), sans requête ni connexion. Liste aussi les dépendances lourdes importées.
+Usage:
+  python benchmarks/bench_startup.py --runs 5
+  python benchmarks/bench_startup.py --spiders consult_spider --importtime   # détail par module
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SPIDERS = ["kbo_spider", "ejustice_spider", "consult_spider"]
+HEAVY_MODULES = ["pandas", "pymongo", "numpy", "pyarrow", "zstandard", "pypdf", "scrapy_playwright", "playwright"]
+PHASES = ["import_scrapy", "spider_loader", "crawler_init"]
+
+
+def child(spider_name):
+    """Exécuté dans le sous-processus : durées des phases et modules lourds chargés"""
+    timings = {}
+    start = time.perf_counter()
+    from scrapy.crawler import Crawler
+    from scrapy.spiderloader import SpiderLoader
+    from scrapy.utils.project import get_project_settings
+    timings["import_scrapy"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    settings = get_project_settings()
+    # Pas de fichier de log ni de cache HTTP pendant la mesure
+    settings.set("LOG_FILE", None)
+    settings.set("LOG_ENABLED", False)
+    settings.set("HTTPCACHE_ENABLED", False)
+    spidercls = SpiderLoader.from_settings(settings).load(spider_name)
+    timings["spider_loader"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    crawler = Crawler(spidercls, settings, init_reactor=True)
+    crawler.spider = crawler._create_spider(enterprise_numbers="0200.065.765")
+    crawler._apply_settings()
+    crawler.engine = crawler._create_engine()
+    timings["crawler_init"] = time.perf_counter() - start
+
+    print(json.dumps({"timings": timings, "heavy": [name for name in HEAVY_MODULES if name in sys.modules]}))
+
+
+def run_child(spider_name, importtime=False):
+    """Durée totale du processus (interpréteur compris) et mesures du sous-processus"""
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + [__file__, "--child", spider_name]
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True,
+                            env={**os.environ, "SCRAPY_SETTINGS_MODULE": "kbo_scraper.settings"})
+    total = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{spider_name} : {result.stderr.strip().splitlines()[-1]}")
+    return total, json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def print_importtime(stderr, top):
+    """Modules les plus coûteux (temps cumulé) d'après -X importtime"""
+    rows = []
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if not name.startswith("  "):
+                rows.append((int(cumulative), name.strip()))
+    for cumulative, name in sorted(rows, reverse=True)[:top]:
+        print(f"    {cumulative / 1000:>8.1f} ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du démarrage des spiders kbo_scraper")
+    parser.add_argument("--spiders", nargs="+", default=SPIDERS)
+    parser.add_argument("--runs", type=int, default=5, help="Processus lancés par spider (médiane)")
+    parser.add_argument("--importtime", action="store_true", help="Afficher les imports de premier niveau les plus coûteux")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    print(f"{'spider':<16} {'processus (ms)':>15} " + " ".join(f"{phase + ' (ms)':>18}" for phase in PHASES)
+          + "  modules lourds")
+    for spider_name in args.spiders:
+        totals, phases = [], {phase: [] for phase in PHASES}
+        for _ in range(args.runs):
+            total, measures, _ = run_child(spider_name)
+            totals.append(total)
+            for phase in PHASES:
+                phases[phase].append(measures["timings"][phase])
+        print(f"{spider_name:<16} {statistics.median(totals) * 1000:>15.0f} "
+              + " ".join(f"{statistics.median(phases[phase]) * 1000:>18.0f}" for phase in PHASES)
+              + f"  {', '.join(measures['heavy']) or '-'}")
+        if args.importtime:
+            print_importtime(run_child(spider_name, importtime=True)[2], top=12)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+# kbo_scraper/api.py
+"""API locale de lecture (HTTP/JSON) des entreprises, publications et dépôts.
+
+Les services internes interrogent ce service plutôt que la collection `entreprises`,
+que les crawls sollicitent déjà en écriture. Les documents lus sont gardés dans un
+cache en mémoire (LRU, durée de vie `ttl`), y compris les numéros absents ; un lot de
+numéros ne fait qu'une requête `$in` pour ceux qui manquent au cache.
+
+Invalidation : avec un journal des modifications (CHANGE_LOG_DIR, voir
+kbo_scraper/changes.py), un thread lit les nouveaux enregistrements écrits par
+`MongoPipeline` toutes les `poll_interval` secondes et retire du cache les numéros
+modifiés. Sans journal, la durée de vie borne l'ancienneté des réponses.
+
+Routes :
+  GET  /enterprises/<numéro>                  fiche (sans publications ni dépôts)
+  GET  /enterprises/<numéro>/publications     publications du Moniteur Belge
+  GET  /enterprises/<numéro>/deposits         dépôts de comptes annuels
+  GET  /enterprises?numbers=n1,n2[&include=publications,deposits]
+  POST /enterprises/batch  {"numbers": [...], "include": [...]}
+  GET  /search?q=texte[&field=name|address|publications][&mode=fuzzy|prefix][&limit=10]
+                                              recherche locale (avec un index, voir search.py)
+  GET  /graph/<numéro ou nom>[?hops=2][&kind=enterprise|person][&limit=1000]
+                                              voisins (hops=1) ou nœuds à k sauts (voir graph.py)
+  GET  /stats                                 compteurs du cache
+Numéros acceptés sous toute forme (0200.065.765, 200065765, BE0200065765).
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from kbo_scraper.changes import read_changes, read_head
+from kbo_scraper.enterprise_numbers import normalize, normalize_one
+from kbo_scraper.graph import KIND_NAMES, GraphIndex
+from kbo_scraper.search import FIELDS, SearchIndex
+
+logger = logging.getLogger(__name__)
+
+# Sections servies par leurs propres routes, exclues de la fiche
+SECTIONS = {"publications": "moniteur_publications", "deposits": "deposits"}
+
+# Champs internes jamais servis
+HIDDEN_FIELDS = {"_id": 0, "content_fingerprints": 0}
+
+MAX_BATCH = 1000
+
+MAX_SEARCH_RESULTS = 100
+
+MAX_GRAPH_HOPS = 4
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Cache LRU dont les entrées expirent après `ttl` secondes (partagé entre threads)"""
+
+    def __init__(self, maxsize=10_000, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key, default=_MISSING):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, keys):
+        with self.lock:
+            for key in keys:
+                if self.entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "invalidations": self.invalidations,
+            }
+
+
+class EnterpriseStore:
+    """Lectures de la collection `entreprises` à travers le cache"""
+
+    def __init__(self, collection, cache):
+        self.collection = collection
+        self.cache = cache
+
+    def get_many(self, numbers):
+        """{numéro pointé: document ou None} ; une seule requête pour les absents du cache"""
+        found = {}
+        missing = []
+        for number in numbers:
+            value = self.cache.get(number)
+            if value is _MISSING:
+                missing.append(number)
+            else:
+                found[number] = value
+        if missing:
+            fetched = {doc["enterprise_number"]: doc for doc in self.collection.find(
+                {"enterprise_number": {"$in": missing}}, HIDDEN_FIELDS
+            )}
+            for number in missing:
+                found[number] = fetched.get(number)
+                self.cache.put(number, found[number])
+        return found
+
+    def get(self, number):
+        return self.get_many([number])[number]
+
+
+def view(doc, section=None, include=()):
+    """Fiche sans sections, ou une section seule (liste)"""
+    if section is not None:
+        value = doc.get(SECTIONS[section]) or []
+        if isinstance(value, str):
+            value = json.loads(value)
+        return value
+    result = {k: v for k, v in doc.items() if k not in SECTIONS.values()}
+    for name in include:
+        result[name] = view(doc, name)
+    return result
+
+
+class ChangeFollower(threading.Thread):
+    """Retire du cache les numéros modifiés d'après le journal des modifications"""
+
+    def __init__(self, cache, directory, poll_interval=2.0):
+        super().__init__(name="api-invalidation", daemon=True)
+        self.cache = cache
+        self.directory = directory
+        self.poll_interval = poll_interval
+        # Le cache est vide au démarrage : seules les modifications suivantes comptent
+        self.position = read_head(directory)["next_offset"]
+        self.stopped = threading.Event()
+
+    def poll(self):
+        numbers = set()
+        for record in read_changes(self.directory, self.position):
+            numbers.add(record["enterprise_number"])
+            self.position = record["offset"] + 1
+        if numbers:
+            self.cache.invalidate(numbers)
+        return len(numbers)
+
+    def run(self):
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Lecture du journal des modifications impossible: {e}")
+
+    def stop(self):
+        self.stopped.set()
+
+
+class IndexRefresher(threading.Thread):
+    """Applique aux index locaux (recherche, graphe) les deltas écrits par les crawls en
+    cours, ou recharge une base reconstruite"""
+
+    def __init__(self, indexes, poll_interval=2.0):
+        super().__init__(name="api-index-refresh", daemon=True)
+        self.indexes = indexes
+        self.poll_interval = poll_interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.poll_interval):
+            for index in self.indexes:
+                try:
+                    index.refresh()
+                except Exception as e:
+                    logger.error(f"Rafraîchissement de l'index {index.directory} impossible: {e}")
+
+    def stop(self):
+        self.stopped.set()
+
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def make_handler(store, search_index=None, graph_index=None):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # En-têtes et corps partent en deux écritures : sans TCP_NODELAY, une connexion
+        # keep-alive attend l'ACK retardé du client (~40 ms) à chaque réponse
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            parts = [part for part in url.path.split("/") if part]
+            if parts == ["stats"]:
+                return self.send_json(200, store.cache.stats())
+            if parts == ["search"]:
+                return self.search(parse_qs(url.query))
+            if len(parts) == 2 and parts[0] == "graph":
+                return self.graph(unquote(parts[1]), parse_qs(url.query))
+            if parts == ["enterprises"]:
+                query = parse_qs(url.query)
+                numbers = [n for value in query.get("numbers", []) for n in value.split(",") if n]
+                include = [i for value in query.get("include", []) for i in value.split(",") if i]
+                return self.batch(numbers, include)
+            if len(parts) in (2, 3) and parts[0] == "enterprises":
+                section = parts[2] if len(parts) == 3 else None
+                if section is not None and section not in SECTIONS:
+                    return self.send_json(404, {"error": f"section inconnue: {section}"})
+                return self.single(unquote(parts[1]), section)
+            self.send_json(404, {"error": "route inconnue"})
+
+        def do_POST(self):
+            if urlsplit(self.path).path.rstrip("/") != "/enterprises/batch":
+                return self.send_json(404, {"error": "route inconnue"})
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except (ValueError, json.JSONDecodeError):
+                return self.send_json(400, {"error": "corps JSON invalide"})
+            # Objet avec des listes : une chaîne serait lue caractère par caractère
+            if not isinstance(payload, dict):
+                return self.send_json(400, {"error": "le corps doit être un objet JSON"})
+            numbers = payload.get("numbers") or []
+            include = payload.get("include") or []
+            if (not isinstance(numbers, list) or not isinstance(include, list)
+                    or not all(isinstance(name, str) for name in include)):
+                return self.send_json(400, {"error": "numbers et include doivent être des listes"})
+            self.batch(numbers, include)
+
+        def single(self, raw_number, section):
+            number = normalize_one(raw_number)
+            if number is None:
+                return self.send_json(400, {"error": f"numéro d'entreprise invalide: {raw_number}"})
+            doc = store.get(number)
+            if doc is None:
+                return self.send_json(404, {"error": f"entreprise inconnue: {number}"})
+            self.send_json(200, view(doc, section))
+
+        def batch(self, raw_numbers, include):
+            unknown = [name for name in include if name not in SECTIONS]
+            if unknown:
+                return self.send_json(400, {"error": f"section(s) inconnue(s): {', '.join(unknown)}"})
+            if len(raw_numbers) > MAX_BATCH:
+                return self.send_json(400, {"error": f"au plus {MAX_BATCH} numéros par lot"})
+            numbers = normalize([str(n) for n in raw_numbers])
+            docs = store.get_many([n for n in numbers if n is not None])
+            self.send_json(200, {
+                "results": {n: view(doc, include=include) for n, doc in docs.items() if doc is not None},
+                "not_found": [n for n, doc in docs.items() if doc is None],
+                "invalid": [raw for raw, n in zip(raw_numbers, numbers) if n is None],
+            })
+
+        def search(self, query):
+            if search_index is None:
+                return self.send_json(404, {"error": "pas d'index de recherche (--search-index)"})
+            text = (query.get("q") or [""])[0]
+            field = (query.get("field") or ["name"])[0]
+            mode = (query.get("mode") or ["fuzzy"])[0]
+            if not text.strip():
+                return self.send_json(400, {"error": "paramètre q manquant"})
+            if field not in FIELDS or mode not in ("fuzzy", "prefix"):
+                return self.send_json(400, {"error": f"champ ({', '.join(FIELDS)}) ou mode (fuzzy, prefix) inconnu"})
+            try:
+                limit = min(int((query.get("limit") or ["10"])[0]), MAX_SEARCH_RESULTS)
+            except ValueError:
+                return self.send_json(400, {"error": "limit doit être un entier"})
+            find = search_index.prefix if mode == "prefix" else search_index.search
+            self.send_json(200, {"results": find(text, field=field, limit=limit)})
+
+        def graph(self, key, query):
+            if graph_index is None:
+                return self.send_json(404, {"error": "pas d'index de graphe (--graph-index)"})
+            kind = (query.get("kind") or [None])[0]
+            try:
+                hops = int((query.get("hops") or ["1"])[0])
+                limit = int((query.get("limit") or ["1000"])[0])
+            except ValueError:
+                return self.send_json(400, {"error": "hops et limit doivent être des entiers"})
+            if not 1 <= hops <= MAX_GRAPH_HOPS or (kind is not None and kind not in KIND_NAMES):
+                return self.send_json(400, {"error": f"hops entre 1 et {MAX_GRAPH_HOPS}, kind: {', '.join(KIND_NAMES)}"})
+            if hops == 1 and kind is None:
+                results = graph_index.neighbors(key)
+            else:
+                results = graph_index.k_hop(key, hops, kind, limit)
+            if results is None:
+                return self.send_json(404, {"error": f"inconnu dans le graphe: {key}"})
+            self.send_json(200, {"results": results})
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False, default=_json_default).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class ReadAPI:
+    """Serveur HTTP de l'API, avec son cache et, si un journal est donné, son invalidation"""
+
+    def __init__(self, collection, host="127.0.0.1", port=8700, cache_size=10_000, ttl=300.0,
+                 change_log=None, poll_interval=2.0, search_index=None, graph_index=None):
+        self.cache = TTLCache(cache_size, ttl)
+        self.store = EnterpriseStore(collection, self.cache)
+        self.search_index = SearchIndex(search_index) if search_index else None
+        self.graph_index = GraphIndex(graph_index) if graph_index else None
+        self.server = ThreadingHTTPServer((host, port),
+                                          make_handler(self.store, self.search_index, self.graph_index))
+        self.server.daemon_threads = True
+        self.follower = ChangeFollower(self.cache, change_log, poll_interval) if change_log else None
+        indexes = [index for index in (self.search_index, self.graph_index) if index is not None]
+        self.refresher = IndexRefresher(indexes, poll_interval) if indexes else None
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start_threads(self):
+        for thread in (self.follower, self.refresher):
+            if thread is not None:
+                thread.start()
+
+    def start(self):
+        """Sert dans un thread (benchmarks, tests) ; retourne l'adresse"""
+        self.start_threads()
+        threading.Thread(target=self.server.serve_forever, name="api-http", daemon=True).start()
+        return self.address
+
+    def serve_forever(self):
+        self.start_threads()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        for thread in (self.follower, self.refresher):
+            if thread is not None:
+                thread.stop()
+        self.server.server_close()
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.close()
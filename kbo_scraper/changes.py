@@ -0,0 +1,292 @@
+# kbo_scraper/changes.py
+"""Journal des modifications de la collection `entreprises` (change data feed).
+
+`MongoPipeline` écrit par `$set` : l'ancienne version d'un document disparaît. Avec
+CHANGE_LOG_DIR, chaque écriture qui modifie un document ajoute un enregistrement au
+journal, avec l'ancienne et la nouvelle valeur des champs modifiés. Pour les
+publications du Moniteur et les dépôts BNB, l'enregistrement liste les entrées
+ajoutées (et les clés de celles qui ont disparu) plutôt que les deux listes complètes.
+L'ancienne version est renvoyée par l'écriture elle-même (`find_one_and_update`,
+ReturnDocument.BEFORE) : pas de lecture supplémentaire.
+
+Le journal est une suite de segments JSONL (`changes-<premier offset>.jsonl`), un
+enregistrement par ligne, numérotés par un offset croissant partagé par tous les
+processus (verrou sur le dossier). Un nouveau segment est ouvert au-delà de
+CHANGE_LOG_SEGMENT_BYTES. Le fichier HEAD donne le prochain offset : un lecteur ne lit
+jamais au-delà, donc jamais une ligne en cours d'écriture.
+
+Les abonnés lisent avec `ChangeConsumer` : position mémorisée par nom de consommateur
+dans la collection `change_offsets`, lecture à partir de cette position, puis `commit`.
+`purge_segments` supprime les segments déjà lus par tous les consommateurs.
+"""
+import json
+import os
+from bisect import bisect_right
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+CHANGE_OFFSETS_COLLECTION = "change_offsets"
+
+SEGMENT_PREFIX = "changes-"
+SEGMENT_SUFFIX = ".jsonl"
+
+# Listes comparées entrée par entrée, avec la clé qui identifie une entrée
+KEYED_LISTS = {
+    "moniteur_publications": lambda pub: "|".join(str(part) for part in (
+        pub.get("publication_number") or pub.get("publication_ref") or pub.get("publication_code") or "",
+        pub.get("publication_date") or "",
+    )),
+    "deposits": lambda deposit: str(deposit.get("reference") or ""),
+}
+
+
+# ============================
+# DIFFÉRENCES
+# ============================
+
+def canonical(value, ignored=frozenset()):
+    """Forme comparable d'une valeur (clés triées, champs ignorés retirés)"""
+    def strip(v):
+        if isinstance(v, dict):
+            return {k: strip(item) for k, item in v.items() if k not in ignored}
+        if isinstance(v, (list, tuple)):
+            return [strip(item) for item in v]
+        return v
+
+    return json.dumps(strip(value), sort_keys=True, ensure_ascii=False, default=str)
+
+
+def diff_list(old, new, key, ignored=frozenset()):
+    """Entrées ajoutées (complètes) et clés des entrées disparues"""
+    old_entries = {key(entry): canonical(entry, ignored) for entry in old or [] if isinstance(entry, dict)}
+    new_keys = set()
+    added = []
+    for entry in new or []:
+        if not isinstance(entry, dict):
+            continue
+        entry_key = key(entry)
+        new_keys.add(entry_key)
+        if old_entries.get(entry_key) != canonical(entry, ignored):
+            added.append(entry)
+    removed = sorted(k for k in old_entries if k not in new_keys)
+    return added, removed
+
+
+def diff_document(previous, document, ignored=frozenset()):
+    """Champs modifiés de `document` par rapport à `previous` (document Mongo ou None)"""
+    previous = previous or {}
+    fields = {}
+    lists = {}
+    for field, new in document.items():
+        # Le numéro d'entreprise est la clé de l'enregistrement, pas une modification
+        if field in ignored or field == "enterprise_number":
+            continue
+        old = previous.get(field)
+        if field in KEYED_LISTS:
+            added, removed = diff_list(old, new, KEYED_LISTS[field], ignored)
+            if added or removed:
+                lists[field] = {"added": added, "removed": removed}
+        elif canonical(old, ignored) != canonical(new, ignored):
+            fields[field] = {"old": old, "new": new}
+    return fields, lists
+
+
+def change_record(spider_name, enterprise_number, previous, document, ignored=frozenset(), now=None):
+    """Enregistrement du journal pour une écriture, ou None si rien n'a changé"""
+    fields, lists = diff_document(previous, document, ignored)
+    if not fields and not lists:
+        return None
+    record = {
+        "time": now or datetime.now(),
+        "spider": spider_name,
+        "enterprise_number": enterprise_number,
+        "op": "insert" if previous is None else "update",
+    }
+    if fields:
+        record["fields"] = fields
+    record.update(lists)
+    return record
+
+
+# ============================
+# SEGMENTS
+# ============================
+
+def segment_name(base_offset):
+    return f"{SEGMENT_PREFIX}{base_offset:020d}{SEGMENT_SUFFIX}"
+
+
+def list_segments(directory):
+    """[(offset de base, chemin)] triés"""
+    if not os.path.isdir(directory):
+        return []
+    segments = []
+    for name in os.listdir(directory):
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+            base = name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]
+            if base.isdigit():
+                segments.append((int(base), os.path.join(directory, name)))
+    return sorted(segments)
+
+
+def read_head(directory):
+    try:
+        with open(os.path.join(directory, "HEAD"), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"next_offset": 0, "segment": 0}
+
+
+def _write_head(directory, head):
+    path = os.path.join(directory, "HEAD")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(head, f)
+    os.replace(path + ".tmp", path)
+
+
+@contextmanager
+def directory_lock(directory):
+    """Verrou exclusif inter-processus sur le journal (workers d'un ou plusieurs spiders)"""
+    with open(os.path.join(directory, ".lock"), "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:  # pragma: no cover
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:  # pragma: no cover
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+class ChangeLog:
+    """Écriture du journal : enregistrements mis en lot, offsets attribués à l'écriture"""
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, batch_size=100, stats=None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.batch_size = batch_size
+        self.stats = stats
+        self.pending = []
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, record):
+        self.pending.append(record)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with directory_lock(self.directory):
+            head = read_head(self.directory)
+            offset = head["next_offset"]
+            path = os.path.join(self.directory, segment_name(head["segment"]))
+            if os.path.exists(path) and os.path.getsize(path) >= self.segment_bytes:
+                head["segment"] = offset
+                path = os.path.join(self.directory, segment_name(offset))
+
+            lines = []
+            for record in self.pending:
+                lines.append(json.dumps({"offset": offset, **record}, ensure_ascii=False,
+                                        default=_json_default) + "\n")
+                offset += 1
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+            # HEAD après les lignes : un lecteur ne voit que des enregistrements complets
+            head["next_offset"] = offset
+            _write_head(self.directory, head)
+
+        if self.stats is not None:
+            self.stats.inc_value("changes/records", len(self.pending))
+        self.pending = []
+
+    def close(self):
+        self.flush()
+
+
+def read_changes(directory, offset=0):
+    """Enregistrements à partir de `offset` (inclus), jusqu'au HEAD lu au départ"""
+    end = read_head(directory)["next_offset"]
+    segments = list_segments(directory)
+    if offset >= end or not segments:
+        return
+    start = max(bisect_right([base for base, _ in segments], offset) - 1, 0)
+    for _, path in segments[start:]:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["offset"] >= end:
+                    return
+                if record["offset"] >= offset:
+                    yield record
+
+
+def purge_segments(directory, offsets_collection):
+    """Supprime les segments entièrement lus par tous les consommateurs ; retourne leur nombre"""
+    positions = [doc["next_offset"] for doc in offsets_collection.find({}, {"next_offset": 1})]
+    if not positions:
+        return 0
+    low = min(positions)
+    segments = list_segments(directory)
+    purged = 0
+    with directory_lock(directory):
+        active = read_head(directory)["segment"]
+        # Un segment est lu en entier si le suivant commence avant la position la plus basse
+        for (base, path), (next_base, _) in zip(segments, segments[1:]):
+            if next_base <= low and base != active:
+                os.remove(path)
+                purged += 1
+    return purged
+
+
+class ChangeConsumer:
+    """Lecture incrémentale du journal par un abonné nommé"""
+
+    def __init__(self, directory, offsets_collection, name):
+        self.directory = directory
+        self.collection = offsets_collection
+        self.name = name
+
+    def position(self):
+        """Prochain offset à lire"""
+        doc = self.collection.find_one({"_id": self.name}, {"next_offset": 1})
+        return doc["next_offset"] if doc else 0
+
+    def poll(self, max_records=1000):
+        return list(islice(read_changes(self.directory, self.position()), max_records))
+
+    def commit(self, next_offset):
+        """Enregistre la position ; elle ne recule jamais (deux lecteurs du même nom)"""
+        from pymongo import ReturnDocument
+
+        doc = self.collection.find_one_and_update(
+            {"_id": self.name},
+            {"$max": {"next_offset": next_offset}, "$set": {"updated": datetime.now()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return doc["next_offset"]
+
+    def seek(self, offset):
+        """Repositionne le consommateur (relecture ou saut), y compris en arrière"""
+        self.collection.update_one(
+            {"_id": self.name}, {"$set": {"next_offset": offset, "updated": datetime.now()}}, upsert=True
+        )
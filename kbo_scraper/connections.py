@@ -0,0 +1,235 @@
+# kbo_scraper/connections.py
+"""Réutilisation des connexions vers les trois hôtes scrapés.
+
+- `PooledHTTPDownloadHandler` : gestionnaire HTTP/1.1 de Scrapy dont le pool garde des
+  connexions persistantes par hôte, avec une limite par hôte
+  (CONNECTION_POOL_MAX_PER_HOST) et une durée d'inactivité maximale
+  (CONNECTION_POOL_IDLE_TIMEOUT, à garder sous le keep-alive des serveurs) ;
+- `SessionResumingContextFactory` : un contexte TLS par hôte (au lieu d'un par
+  connexion, avec rechargement des paramètres à chaque fois) et reprise de session :
+  une nouvelle connexion présente la dernière session de l'hôte et évite l'échange
+  complet de certificats et de clés ;
+- `TTLCachingResolver` : cache DNS du processus avec durée de vie (DNS_CACHE_TTL).
+
+Stats par hôte : connections/new, connections/reused, connections/connect_seconds
+(DNS + TCP), tls/handshakes, tls/resumed, tls/handshake_seconds ; dns/cache_hit et
+dns/cache_miss pour le résolveur.
+"""
+import logging
+import time
+from collections import Counter
+
+from OpenSSL import SSL
+from scrapy.core.downloader.contextfactory import ScrapyClientContextFactory
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.core.downloader.tls import ScrapyClientTLSOptions
+from scrapy.resolver import CachingThreadedResolver
+from twisted.internet import defer
+from twisted.web.client import HTTPConnectionPool
+
+logger = logging.getLogger(__name__)
+
+try:
+    # Pas d'équivalent public dans pyOpenSSL pour savoir si la session a été reprise
+    from OpenSSL._util import lib as _openssl_lib
+except ImportError:  # pragma: no cover
+    _openssl_lib = None
+
+
+def host_of(key):
+    """Hôte d'une clé du pool Twisted : (scheme, host, port), ou clé de proxy"""
+    host = key[1] if len(key) > 1 else key
+    return host.decode("ascii") if isinstance(host, bytes) else str(host)
+
+
+def session_reused(connection):
+    if _openssl_lib is None:
+        return None
+    return bool(_openssl_lib.SSL_session_reused(connection._ssl))
+
+
+class ResumingTLSOptions(ScrapyClientTLSOptions):
+    """Options TLS d'un hôte : présente la dernière session connue et mesure la poignée de main"""
+
+    def __init__(self, hostname, ctx, verbose_logging=False, sessions=None, stats=None):
+        super().__init__(hostname, ctx, verbose_logging)
+        self.sessions = sessions if sessions is not None else {}
+        self.stats = stats
+
+    def clientConnectionForTLS(self, tlsProtocol):
+        connection = super().clientConnectionForTLS(tlsProtocol)
+        session = self.sessions.get(self._hostnameASCII)
+        if session is not None:
+            connection.set_session(session)
+        return connection
+
+    def _identityVerifyingInfoCallback(self, connection, where, ret):
+        if where & SSL.SSL_CB_HANDSHAKE_START and not hasattr(connection, "handshake_started"):
+            connection.handshake_started = time.perf_counter()
+        super()._identityVerifyingInfoCallback(connection, where, ret)
+        if where & SSL.SSL_CB_HANDSHAKE_DONE:
+            # TLS 1.2 : session disponible dès la fin de la poignée de main (en TLS 1.3, le
+            # ticket arrive après ; voir PooledHTTPDownloadHandler.remember_session)
+            self.sessions[self._hostnameASCII] = connection.get_session()
+            if not getattr(connection, "handshake_recorded", False):
+                connection.handshake_recorded = True
+                self.record_handshake(connection)
+
+    def record_handshake(self, connection):
+        if self.stats is None:
+            return
+        host = self._hostnameASCII
+        elapsed = time.perf_counter() - getattr(connection, "handshake_started", time.perf_counter())
+        self.stats.inc_value(f"tls/handshakes/{host}")
+        self.stats.inc_value(f"tls/handshake_seconds/{host}", elapsed)
+        if session_reused(connection):
+            self.stats.inc_value(f"tls/resumed/{host}")
+
+
+class SessionResumingContextFactory(ScrapyClientContextFactory):
+    """Une `ResumingTLSOptions` (et donc un contexte OpenSSL) par hôte et port"""
+
+    def __init__(self, *args, stats=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = stats
+        self.sessions = {}
+        self.creators = {}
+
+    @classmethod
+    def from_crawler(cls, crawler, method=SSL.SSLv23_METHOD, *args, **kwargs):
+        factory = cls.from_settings(crawler.settings, method, *args, **kwargs)
+        factory.stats = crawler.stats
+        return factory
+
+    def getContext(self, hostname=None, port=None):
+        ctx = super().getContext(hostname, port)
+        ctx.set_session_cache_mode(SSL.SESS_CACHE_CLIENT)
+        return ctx
+
+    def creatorForNetloc(self, hostname, port):
+        key = (hostname, port)
+        if key not in self.creators:
+            self.creators[key] = ResumingTLSOptions(
+                hostname.decode("ascii"), self.getContext(), self.tls_verbose_logging,
+                sessions=self.sessions, stats=self.stats,
+            )
+        return self.creators[key]
+
+
+class HostLimitedConnectionPool(HTTPConnectionPool):
+    """Pool Twisted avec une limite de connexions inactives par hôte et des stats
+    nouvelles / réutilisées"""
+
+    def __init__(self, reactor, max_per_host, default_max, stats=None, on_idle=None):
+        super().__init__(reactor, persistent=True)
+        self.max_per_host = max_per_host
+        self.maxPersistentPerHost = default_max
+        self.default_max = default_max
+        self.stats = stats
+        self.on_idle = on_idle
+        self._opened = False
+
+    def getConnection(self, key, endpoint):
+        self._opened = False
+        d = super().getConnection(key, endpoint)
+        if not self._opened and self.stats is not None:
+            self.stats.inc_value(f"connections/reused/{host_of(key)}")
+        return d
+
+    def _newConnection(self, key, endpoint):
+        self._opened = True
+        host = host_of(key)
+        started = time.perf_counter()
+        d = super()._newConnection(key, endpoint)
+
+        def connected(protocol):
+            if self.stats is not None:
+                self.stats.inc_value(f"connections/new/{host}")
+                self.stats.inc_value(f"connections/connect_seconds/{host}", time.perf_counter() - started)
+            return protocol
+
+        return d.addCallback(connected)
+
+    def _putConnection(self, key, connection):
+        if self.on_idle is not None:
+            self.on_idle(key, connection)
+        # La limite de Twisted est globale : on la fixe pour l'hôte juste avant l'ajout
+        self.maxPersistentPerHost = self.max_per_host.get(host_of(key), self.default_max)
+        if self.maxPersistentPerHost <= 0:
+            connection.transport.loseConnection()
+            return
+        super()._putConnection(key, connection)
+
+
+class PooledHTTPDownloadHandler(HTTP11DownloadHandler):
+    def __init__(self, settings, crawler=None):
+        super().__init__(settings, crawler)
+        from twisted.internet import reactor
+
+        self._pool = HostLimitedConnectionPool(
+            reactor,
+            max_per_host=settings.getdict("CONNECTION_POOL_MAX_PER_HOST"),
+            default_max=settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN"),
+            stats=crawler.stats if crawler else None,
+            on_idle=self.remember_session,
+        )
+        self._pool.cachedConnectionTimeout = settings.getfloat("CONNECTION_POOL_IDLE_TIMEOUT", 30)
+        self._pool._factory.noisy = False
+        self.stats = crawler.stats if crawler else None
+
+    def remember_session(self, key, connection):
+        """Session TLS relue quand la connexion redevient inactive : la réponse est lue, le
+        ticket TLS 1.3 envoyé après la poignée de main est donc arrivé"""
+        sessions = getattr(self._contextFactory, "sessions", None)
+        get_handle = getattr(connection.transport, "getHandle", None)
+        if sessions is None or get_handle is None:
+            return
+        handle = get_handle()
+        if isinstance(handle, SSL.Connection):
+            sessions[host_of(key)] = handle.get_session()
+
+    def close(self):
+        from twisted.internet import reactor
+
+        resolver = getattr(reactor, "resolver", None)
+        if self.stats is not None and isinstance(resolver, TTLCachingResolver):
+            for key, value in resolver.counts.items():
+                self.stats.set_value(key, value)
+        return super().close()
+
+
+class TTLCachingResolver(CachingThreadedResolver):
+    """Résolveur DNS de Scrapy dont les entrées expirent après DNS_CACHE_TTL secondes"""
+
+    def __init__(self, reactor, cache_size, timeout, ttl=300):
+        super().__init__(reactor, cache_size, timeout)
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.cache = {}
+        # Le résolveur appartient au processus (CrawlerProcess), pas au crawler : les compteurs
+        # sont recopiés dans les stats par PooledHTTPDownloadHandler.close()
+        self.counts = Counter()
+
+    @classmethod
+    def from_crawler(cls, crawler, reactor):
+        resolver = super().from_crawler(crawler, reactor)
+        resolver.ttl = crawler.settings.getfloat("DNS_CACHE_TTL", 300)
+        return resolver
+
+    def getHostByName(self, name, timeout=None):
+        entry = self.cache.get(name)
+        if entry is not None and entry[1] > time.monotonic():
+            self.counts["dns/cache_hit"] += 1
+            return defer.succeed(entry[0])
+        self.counts["dns/cache_miss"] += 1
+        # Appel direct au résolveur en thread : le cache global de Scrapy, sans expiration, est ignoré
+        d = super(CachingThreadedResolver, self).getHostByName(name, (self.timeout,))
+        if self.cache_size:
+            d.addCallback(self.store, name)
+        return d
+
+    def store(self, address, name):
+        if len(self.cache) >= self.cache_size:
+            self.cache.pop(next(iter(self.cache)))
+        self.cache[name] = (address, time.monotonic() + self.ttl)
+        return address
@@ -0,0 +1,129 @@
+# kbo_scraper/dead_letters.py
+"""File des requêtes en échec (dead letters), hors des slots de concurrence.
+
+Les réessais immédiats du RetryMiddleware gardent le slot occupé pendant que le site
+peine (ejustice n'a qu'un slot). Avec DEAD_LETTER_ENABLED, les requêtes d'entreprise
+partent sans réessai immédiat (`dont_retry`) ; un échec est enregistré dans la
+collection `dead_letters` avec sa cause, et la date du prochain essai recule à chaque
+échec (DEAD_LETTER_BASE_DELAY, 2x, 4x... plafonné à DEAD_LETTER_MAX_DELAY).
+
+Les entrées dues sont relancées quand le spider n'a plus rien à faire
+(`DeadLetterExtension`, signal spider_idle), tant que la pause avant la prochaine ne
+dépasse pas DEAD_LETTER_IDLE_WAIT ; les autres attendent `run_spiders.py --retry-failed`.
+Au-delà de DEAD_LETTER_MAX_ATTEMPTS échecs, l'entrée est marquée "exhausted" et n'est
+plus relancée automatiquement. Un succès supprime l'entrée.
+"""
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+
+DEAD_LETTERS_COLLECTION = "dead_letters"
+
+DEAD_LETTERS_INDEXES = [
+    IndexModel([("spider", ASCENDING), ("enterprise_number", ASCENDING)],
+               name="spider_enterprise_number_unique", unique=True),
+    IndexModel([("spider", ASCENDING), ("status", ASCENDING), ("next_retry", ASCENDING)],
+               name="spider_status_next_retry"),
+]
+
+PENDING = "pending"
+EXHAUSTED = "exhausted"
+
+
+def failure_reason(failure):
+    """Cause lisible : code HTTP si la réponse est arrivée, sinon type et message de l'exception"""
+    response = getattr(failure.value, "response", None)
+    if response is not None:
+        return f"HTTP {response.status}"
+    return f"{type(failure.value).__name__}: {failure.value}"
+
+
+class DeadLetterQueue:
+    def __init__(self, collection, base_delay=timedelta(minutes=5), max_delay=timedelta(hours=6),
+                 max_attempts=5, stats=None):
+        self.collection = collection
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.stats = stats
+        # Numéros en attente pour ce spider, pour ne supprimer que ce qui existe
+        self.pending = set()
+        # Échecs du crawl en cours, relancés en fin de crawl
+        self.failed = set()
+
+    def load_pending(self, spider_name):
+        cursor = self.collection.find({"spider": spider_name}, {"enterprise_number": 1, "_id": 0})
+        self.pending = {doc["enterprise_number"] for doc in cursor}
+
+    def push(self, spider_name, enterprise_number, url, reason, now=None):
+        """Enregistre un échec ; retourne l'entrée mise à jour. Un seul aller-retour : le
+        compteur, le statut et la date du prochain essai sont calculés par le serveur
+        (mise à jour par pipeline, MongoDB 4.2+)"""
+        now = now or datetime.now()
+        # Pause après n échecs : base x 2^(n-1), plafonnée
+        base_ms = self.base_delay.total_seconds() * 1000
+        max_ms = self.max_delay.total_seconds() * 1000
+        entry = self.collection.find_one_and_update(
+            {"spider": spider_name, "enterprise_number": enterprise_number},
+            [
+                {"$set": {
+                    "attempts": {"$add": [{"$ifNull": ["$attempts", 0]}, 1]},
+                    # $literal : une URL ou un message commençant par "$" serait lu comme un champ
+                    "url": {"$literal": url},
+                    "reason": {"$literal": reason},
+                    "last_failure": now,
+                    "first_failure": {"$ifNull": ["$first_failure", now]},
+                }},
+                {"$set": {
+                    "status": {"$cond": [{"$gte": ["$attempts", self.max_attempts]}, EXHAUSTED, PENDING]},
+                    "next_retry": {"$add": [now, {"$min": [
+                        max_ms, {"$multiply": [base_ms, {"$pow": [2, {"$subtract": ["$attempts", 1]}]}]},
+                    ]}]},
+                }},
+            ],
+            projection={"attempts": 1, "status": 1, "next_retry": 1, "_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        status = entry["status"]
+        self.pending.add(enterprise_number)
+        if status == PENDING:
+            self.failed.add(enterprise_number)
+        else:
+            self.failed.discard(enterprise_number)
+        if self.stats is not None:
+            self.stats.inc_value(f"dead_letters/{status}")
+        return entry
+
+    def resolve(self, spider_name, enterprise_number):
+        if enterprise_number not in self.pending:
+            return
+        self.pending.discard(enterprise_number)
+        self.failed.discard(enterprise_number)
+        self.collection.delete_one({"spider": spider_name, "enterprise_number": enterprise_number})
+        if self.stats is not None:
+            self.stats.inc_value("dead_letters/resolved")
+
+    def due(self, spider_name, numbers=None, now=None, limit=0):
+        """Entrées en attente (parmi `numbers` si donné) dont la date de réessai est passée,
+        les plus anciennes d'abord"""
+        now = now or datetime.now()
+        query = {"spider": spider_name, "status": PENDING, "next_retry": {"$lte": now}}
+        if numbers is not None:
+            query["enterprise_number"] = {"$in": list(numbers)}
+        cursor = self.collection.find(query, {"enterprise_number": 1, "_id": 0}).sort(
+            "next_retry", ASCENDING
+        ).limit(limit)
+        return [doc["enterprise_number"] for doc in cursor]
+
+    def next_retry_in(self, spider_name, numbers, now=None):
+        """Délai avant le prochain réessai parmi `numbers` (None s'il n'y en a pas)"""
+        now = now or datetime.now()
+        entry = self.collection.find_one(
+            {"spider": spider_name, "status": PENDING, "enterprise_number": {"$in": list(numbers)}},
+            {"next_retry": 1, "_id": 0},
+            sort=[("next_retry", ASCENDING)],
+        )
+        if entry is None:
+            return None
+        return max(entry["next_retry"] - now, timedelta(0))
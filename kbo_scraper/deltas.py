@@ -0,0 +1,142 @@
+# kbo_scraper/deltas.py
+"""Base immuable + deltas JSONL, la structure commune des index locaux (search.py, graph.py).
+
+Dossier d'un index :
+- des bases (`base-<date>/`) écrites par un constructeur puis publiées en remplaçant le
+  fichier `CURRENT`, qui donne le nom de la base en service ;
+- des deltas (`deltas/delta-*.jsonl`, une entrée par document) écrits par lots par les
+  pipelines pendant les crawls (`DeltaWriter`) et appliqués en mémoire par-dessus la base
+  (`DeltaIndex.refresh`).
+`rebuild_base` réécrit une base depuis la collection `entreprises` : les deltas déjà
+présents y sont couverts et supprimés.
+"""
+import glob
+import json
+import os
+import shutil
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from kbo_scraper.changes import directory_lock
+
+
+def write_current(directory, name):
+    path = os.path.join(directory, "CURRENT")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(path + ".tmp", path)
+
+
+def read_current(directory):
+    try:
+        with open(os.path.join(directory, "CURRENT"), encoding="utf-8") as f:
+            return os.path.join(directory, f.read().strip())
+    except FileNotFoundError:
+        return None
+
+
+def delta_paths(directory):
+    return sorted(glob.glob(os.path.join(directory, "deltas", "delta-*.jsonl")))
+
+
+# ============================
+# ÉCRITURE (PIPELINES)
+# ============================
+
+class DeltaWriter:
+    """Entrées des items du crawl, écrites par lots dans deltas/ (un fichier par lot)"""
+
+    def __init__(self, directory, batch_size=1000):
+        self.directory = os.path.join(directory, "deltas")
+        self.batch_size = batch_size
+        self.pending = []
+        self.sequence = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def append(self, enterprise_number, entry):
+        if entry:
+            self.pending.append({"enterprise_number": enterprise_number, **entry})
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        name = f"delta-{time.time_ns():020d}-{os.getpid()}-{self.sequence:05d}.jsonl"
+        self.sequence += 1
+        path = os.path.join(self.directory, name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in self.pending))
+        os.replace(path + ".tmp", path)
+        self.pending = []
+
+    def close(self):
+        self.flush()
+
+
+# ============================
+# LECTURE
+# ============================
+
+class DeltaIndex(ABC):
+    """Index ouvert sur la base en service, deltas appliqués en mémoire.
+
+    Les sous-classes définissent `load()` (ouvre la base de `read_current`, renseigne
+    `base_path`, vide `loaded_deltas` puis appelle `refresh()`) et `apply_delta(entry)`.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.RLock()
+        self.load()
+
+    @abstractmethod
+    def load(self):
+        """Ouvre la base en service et applique ses deltas"""
+
+    @abstractmethod
+    def apply_delta(self, entry):
+        """Applique en mémoire une entrée d'un fichier delta"""
+
+    def refresh(self):
+        """Applique les deltas apparus depuis le dernier appel ; recharge tout si une autre
+        base a été publiée (compactage, reconstruction). Retourne le nombre de fichiers"""
+        with self.lock:
+            if read_current(self.directory) != self.base_path:
+                self.load()
+                return len(self.loaded_deltas)
+            new = [path for path in delta_paths(self.directory)
+                   if os.path.basename(path) not in self.loaded_deltas]
+            for path in new:
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        self.apply_delta(json.loads(line))
+                self.loaded_deltas.add(os.path.basename(path))
+            return len(new)
+
+
+# ============================
+# RECONSTRUCTION
+# ============================
+
+def rebuild_base(collection, directory, builder, projection, entry_of, batch_size=1000):
+    """Passe chaque document de la collection `entreprises` (curseur par lots) à
+    `builder.add(numéro, entry_of(document))`, publie la base, supprime les deltas
+    antérieurs et l'ancienne base ; retourne le résultat de `builder.finish()`"""
+    os.makedirs(directory, exist_ok=True)
+    with directory_lock(directory):
+        previous = read_current(directory)
+        deltas = delta_paths(directory)
+        cursor = collection.find({"enterprise_number": {"$gt": ""}}, projection, batch_size=batch_size)
+        try:
+            for doc in cursor:
+                builder.add(doc["enterprise_number"], entry_of(doc))
+        finally:
+            cursor.close()
+        result = builder.finish()
+        for path in deltas:
+            os.remove(path)
+        if previous:
+            shutil.rmtree(previous, ignore_errors=True)
+    return result
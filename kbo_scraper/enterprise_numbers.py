@@ -0,0 +1,278 @@
+# kbo_scraper/enterprise_numbers.py
+"""Normalisation, validation et dédoublonnage des numéros d'entreprise avant planification.
+
+Les numéros sont chargés dans un tableau NumPy int64 (8 octets par numéro au lieu
+d'une chaîne Python) et traités en passes vectorisées :
+- format : 10 chiffres (ou 9, ancien format sans le 0 initial), points, espaces et
+  préfixe "BE" ignorés, premier chiffre 0 ou 1 (les autres sont des unités
+  d'établissement) ;
+- clé de contrôle : les deux derniers chiffres valent 97 - (8 premiers chiffres mod 97) ;
+- doublons : tri puis comparaison de chaque valeur à la précédente.
+Aucune requête n'est donc envoyée pour un numéro qui ne peut pas exister. Chaque spider
+reçoit ensuite la forme d'URL qui lui convient (`url_forms`), dans l'ordre de priorité
+éventuellement calculé par le runner (`kbo_scraper/priority.py`).
+
+NumPy n'est importé que dans les fonctions qui s'en servent : jusqu'à `SMALL_INPUT`
+numéros en liste (paramètre `-a enterprise_numbers=...`, courts passages), `prepare`
+traite les numéros en Python pur et `values` est alors une liste d'entiers triée ; le
+chargement des spiders n'importe donc pas NumPy.
+"""
+import re
+from dataclasses import dataclass, field
+
+# Plus grand numéro d'entreprise possible (les numéros 2 à 8 sont des établissements)
+MAX_ENTERPRISE_NUMBER = 1_999_999_999
+
+# Forme du numéro dans l'URL de chaque spider
+URL_FORMS = {
+    "kbo_spider": "digits",        # 0200065765
+    "consult_spider": "digits",    # 0200065765
+    "ejustice_spider": "unpadded",  # 200065765 (sans le 0 initial)
+}
+
+# Un numéro une fois séparateurs retirés (mêmes règles que `parse`)
+NUMBER_RE = re.compile(r"[BE]*(\d{9,10})")
+
+# Au-delà, `prepare` passe par NumPy (~2 µs par numéro en Python pur, ~100 ms d'import)
+SMALL_INPUT = 10_000
+
+
+@dataclass
+class PreparedNumbers:
+    # Tableau int64, ou liste d'entiers pour une petite entrée (voir SMALL_INPUT)
+    values: "np.ndarray | list"
+    report: dict = field(default_factory=dict)
+    # Priorité de chaque numéro (alignée sur `values`), None si aucune
+    priorities: "np.ndarray | list" = None
+
+    @property
+    def rejected(self):
+        return self.report.get("invalid_format", 0) + self.report.get("invalid_checksum", 0)
+
+
+def parse(numbers):
+    """Tableau int64 des numéros et masque des entrées au bon format"""
+    import numpy as np
+
+    raw = np.asarray(list(numbers) if not isinstance(numbers, np.ndarray) else numbers)
+    if raw.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool)
+    if raw.dtype.kind in "iu":
+        values = raw.astype(np.int64)
+        return values, (values >= 0) & (values <= MAX_ENTERPRISE_NUMBER)
+
+    text = np.char.upper(np.char.strip(raw.astype(str)))
+    for separator in (".", " ", "-"):
+        text = np.char.replace(text, separator, "")
+    text = np.char.lstrip(text, "BE")
+
+    length = np.char.str_len(text)
+    # isdecimal et non isdigit : "²" est un chiffre que int() refuse
+    valid = np.char.isdecimal(text) & ((length == 10) | (length == 9))
+    values = np.zeros(len(text), dtype=np.int64)
+    values[valid] = text[valid].astype(np.int64)
+    valid &= values <= MAX_ENTERPRISE_NUMBER
+    return values, valid
+
+
+def checksum_valid(values):
+    """Clé de contrôle modulo 97, sur tout le tableau (ou un seul entier)"""
+    return 97 - (values // 100) % 97 == values % 100
+
+
+def parse_one(number):
+    """Valeur d'un seul numéro au bon format (mêmes règles que `parse`), None sinon"""
+    if isinstance(number, int):
+        return number if 0 <= number <= MAX_ENTERPRISE_NUMBER else None
+    text = str(number).strip().upper()
+    for separator in (".", " ", "-"):
+        text = text.replace(separator, "")
+    match = NUMBER_RE.fullmatch(text)
+    if match is None:
+        return None
+    value = int(match.group(1))
+    return value if value <= MAX_ENTERPRISE_NUMBER else None
+
+
+def prepare(numbers, priorities=None):
+    """Numéros valides, uniques et triés, avec le décompte des rejets.
+
+    `priorities` (une par numéro) suit le même tri ; un doublon garde la plus haute.
+    """
+    if isinstance(numbers, (list, tuple)) and len(numbers) <= SMALL_INPUT:
+        return prepare_small(numbers, priorities)
+    import numpy as np
+
+    values, valid_format = parse(numbers)
+    valid_checksum = valid_format & checksum_valid(values)
+    # Tri + masque plutôt que np.unique, nettement plus lent sur des millions d'entiers
+    kept = values[valid_checksum]
+    if priorities is None:
+        ordered = np.sort(kept)
+    else:
+        order = np.argsort(kept, kind="stable")
+        ordered = kept[order]
+    first = np.concatenate(([True], ordered[1:] != ordered[:-1])) if len(ordered) else np.zeros(0, dtype=bool)
+    unique = ordered[first]
+
+    unique_priorities = None
+    if priorities is not None:
+        ordered_priorities = np.asarray(priorities, dtype=np.int64)[valid_checksum][order]
+        unique_priorities = (np.maximum.reduceat(ordered_priorities, np.flatnonzero(first))
+                             if len(unique) else ordered_priorities)
+
+    report = {
+        "input": int(len(values)),
+        "invalid_format": int(len(values) - valid_format.sum()),
+        "invalid_checksum": int(valid_format.sum() - valid_checksum.sum()),
+        "duplicates": int(valid_checksum.sum() - len(unique)),
+        "accepted": int(len(unique)),
+    }
+    return PreparedNumbers(unique, report, unique_priorities)
+
+
+def prepare_small(numbers, priorities=None):
+    """`prepare` en Python pur : `values` (et `priorities`) sont des listes"""
+    best = {}
+    invalid_format = invalid_checksum = 0
+    for index, number in enumerate(numbers):
+        value = parse_one(number)
+        if value is None:
+            invalid_format += 1
+        elif not checksum_valid(value):
+            invalid_checksum += 1
+        else:
+            priority = None if priorities is None else int(priorities[index])
+            if value not in best or (priority is not None and priority > best[value]):
+                best[value] = priority
+    values = sorted(best)
+    report = {
+        "input": len(numbers),
+        "invalid_format": invalid_format,
+        "invalid_checksum": invalid_checksum,
+        "duplicates": len(numbers) - invalid_format - invalid_checksum - len(values),
+        "accepted": len(values),
+    }
+    return PreparedNumbers(values, report, None if priorities is None else [best[value] for value in values])
+
+
+def as_list(values):
+    return values.tolist() if hasattr(values, "tolist") else list(values)
+
+
+def digits(values):
+    """["0200065765", ...]"""
+    return [f"{value:010d}" for value in as_list(values)]
+
+
+def dotted(values):
+    """["0200.065.765", ...] : format des documents Mongo et des CSV"""
+    return [f"{d[:4]}.{d[4:7]}.{d[7:]}" for d in digits(values)]
+
+
+def unpadded(values):
+    """["200065765", ...]"""
+    return [str(value) for value in as_list(values)]
+
+
+def normalize(numbers):
+    """Forme pointée de chaque numéro saisi librement, dans l'ordre (None si invalide)"""
+    values, valid = parse(numbers)
+    valid &= checksum_valid(values)
+    return [text if ok else None for text, ok in zip(dotted(values), valid.tolist())]
+
+
+def normalize_one(number):
+    """`normalize` d'un seul numéro, sans passer par NumPy (requêtes unitaires de l'API)"""
+    value = parse_one(number)
+    if value is None or not checksum_valid(value):
+        return None
+    return dotted([value])[0]
+
+
+def url_forms(values, spider_name):
+    form = URL_FORMS.get(spider_name, "digits")
+    return unpadded(values) if form == "unpadded" else digits(values)
+
+
+def schedule(prepared, spider_name):
+    """(numéros pointés, formes d'URL, priorités) dans l'ordre des requêtes : priorité
+    décroissante, puis numéro croissant"""
+    values, priorities = prepared.values, prepared.priorities
+    if priorities is None:
+        priorities = [0] * len(values)
+    elif isinstance(values, list):
+        order = sorted(range(len(values)), key=lambda index: -priorities[index])
+        values, priorities = [values[index] for index in order], [priorities[index] for index in order]
+    else:
+        import numpy as np
+
+        order = np.argsort(-priorities, kind="stable")
+        values, priorities = values[order], priorities[order].tolist()
+    return dotted(values), url_forms(values, spider_name), priorities
+
+
+def save(path, values, priorities=None):
+    """Fichier .npz passé aux spiders par le runner (enterprise_numbers_file)"""
+    import numpy as np
+
+    arrays = {"values": np.asarray(values, dtype=np.int64)}
+    if priorities is not None:
+        arrays["priorities"] = np.asarray(priorities, dtype=np.int64)
+    np.savez(path, **arrays)
+
+
+def load(path):
+    """(numéros, priorités ou None)"""
+    import numpy as np
+
+    with np.load(path, allow_pickle=False) as data:
+        return data["values"], data["priorities"] if "priorities" in data.files else None
+
+
+def from_spider_args(enterprise_numbers=None, enterprise_numbers_file=None):
+    """Numéros passés à un spider : liste séparée par des virgules et/ou fichier .npz"""
+    if enterprise_numbers_file:
+        return prepare(*load(enterprise_numbers_file))
+    if isinstance(enterprise_numbers, str):
+        enterprise_numbers = [num for num in enterprise_numbers.split(",") if num.strip()]
+    return prepare(enterprise_numbers or [])
+
+
+def format_report(report):
+    return (
+        f"{report['accepted']} numéros retenus sur {report['input']} "
+        f"(format invalide: {report['invalid_format']}, clé de contrôle invalide: "
+        f"{report['invalid_checksum']}, doublons: {report['duplicates']})"
+    )
+
+
+def record_stats(stats, report):
+    """Décompte des numéros dans les stats du crawl (repris dans le rapport du runner)"""
+    for key, value in report.items():
+        stats.set_value(f"numbers/{key}", value)
+
+
+def split_shards(prepared, count):
+    """(numéros, priorités) par shard selon `sharding.shard_of`, comme le filtre `shard=i/N`
+    des spiders"""
+    import numpy as np
+
+    from kbo_scraper.sharding import shard_of
+
+    values, priorities = prepared.values, prepared.priorities
+    if count <= 1:
+        return [(values, priorities)]
+    values = np.asarray(values, dtype=np.int64)
+    priorities = None if priorities is None else np.asarray(priorities, dtype=np.int64)
+    shard_ids = np.fromiter((shard_of(number, count) for number in digits(values)), dtype=np.int64,
+                            count=len(values))
+    return [
+        (values[shard_ids == index], None if priorities is None else priorities[shard_ids == index])
+        for index in range(count)
+    ]
+
+
+def url_form(enterprise_number, spider_name):
+    """Forme d'URL d'un seul numéro déjà validé (relance d'une requête en échec)"""
+    return url_forms([parse_one(enterprise_number)], spider_name)[0]
@@ -0,0 +1,925 @@
+# kbo_scraper/extensions.py
+import gc
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scrapy import Request, signals
+from scrapy.exceptions import DontCloseSpider, NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.trackref import live_refs
+from twisted.internet import task
+
+from kbo_scraper import instrumentation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _engine_scheduler(engine):
+    """Scheduler du moteur, quelle que soit la version de Scrapy"""
+    scheduler = getattr(engine, "scheduler", None)
+    if scheduler is None:
+        scheduler = getattr(getattr(engine, "slot", None) or getattr(engine, "_slot", None), "scheduler", None)
+    return scheduler
+
+
+class Histogram:
+    """Histogramme cumulatif à bornes fixes (format OpenMetrics)"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # dernière case : +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    """Histogrammes, compteurs et jauges étiquetés, lus depuis le thread HTTP"""
+
+    # Nom de métrique -> aide affichée dans l'exposition
+    HELP = {
+        "kbo_download_latency_seconds": "Latence de téléchargement par hôte et gestionnaire",
+        "kbo_parse_seconds": "Temps passé dans les callbacks des spiders",
+        "kbo_extract_seconds": "Temps passé dans les fonctions d'extraction",
+        "kbo_pipeline_seconds": "Temps passé dans chaque pipeline",
+        "kbo_items_scraped": "Items sortis des pipelines",
+        "kbo_responses_received": "Réponses reçues par hôte",
+        "kbo_scheduler_queue_depth": "Requêtes en attente dans le scheduler",
+        "kbo_downloader_active_requests": "Requêtes en cours de téléchargement",
+        "kbo_downloader_queued_requests": "Requêtes en attente dans les slots du downloader",
+        "kbo_scraper_active_items": "Items en cours de traitement dans les pipelines",
+        "kbo_items_per_second": "Débit d'items sur le dernier intervalle",
+    }
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def observe(self, name, labels, value):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def inc(self, name, labels, amount=1):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name, labels, value):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.gauges.setdefault(name, {})[key] = value
+
+    @staticmethod
+    def _labels(key, extra=()):
+        pairs = list(key) + list(extra)
+        if not pairs:
+            return ""
+        escaped = []
+        for name, value in pairs:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            escaped.append(f'{name}="{value}"')
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self):
+        """Exposition texte OpenMetrics"""
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.histograms.items()):
+                lines += [f"# TYPE {name} histogram", f"# HELP {name} {self.HELP.get(name, name)}"]
+                for key, histogram in sorted(series.items()):
+                    for bound, total in histogram.cumulative():
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{self._labels(key, [('le', le)])} {total}")
+                    lines.append(f"{name}_sum{self._labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{self._labels(key)} {histogram.count}")
+            for name, series in sorted(self.counters.items()):
+                lines += [f"# TYPE {name} counter", f"# HELP {name} {self.HELP.get(name, name)}"]
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}_total{self._labels(key)} {value}")
+            for name, series in sorted(self.gauges.items()):
+                lines += [f"# TYPE {name} gauge", f"# HELP {name} {self.HELP.get(name, name)}"]
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{self._labels(key)} {value}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExtension:
+    """Histogrammes de latence par étape et profondeur des files, servis en HTTP local.
+
+    Activée par METRICS_ENABLED. Les métriques sont exposées au format OpenMetrics
+    sur http://METRICS_HOST:METRICS_PORT/metrics pendant tout le crawl.
+    """
+
+    # Étape d'instrumentation -> (métrique, nom de l'étiquette)
+    STAGE_METRICS = {
+        "parse": ("kbo_parse_seconds", "callback"),
+        "extract": ("kbo_extract_seconds", "function"),
+        "pipeline": ("kbo_pipeline_seconds", "pipeline"),
+    }
+
+    def __init__(self, crawler, host, port, interval, buckets):
+        self.crawler = crawler
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.registry = MetricsRegistry(buckets)
+        self.handler_names = {}
+        self.server = None
+        self.sampler = None
+        self.items_scraped = 0
+        self.last_sample = (time.monotonic(), 0)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("METRICS_ENABLED"):
+            raise NotConfigured
+
+        ext = cls(
+            crawler,
+            host=settings.get("METRICS_HOST", "127.0.0.1"),
+            port=settings.getint("METRICS_PORT", 9410),
+            interval=settings.getfloat("METRICS_SAMPLE_INTERVAL", 5.0),
+            buckets=[float(b) for b in settings.getlist("METRICS_BUCKETS")] or DEFAULT_LATENCY_BUCKETS,
+        )
+        # Avant la création du moteur : les pipelines instanciés ensuite voient les enveloppes
+        instrumentation.attach(ext)
+
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.engine_stopped, signal=signals.engine_stopped)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        return ext
+
+    # ============================
+    # CYCLE DE VIE
+    # ============================
+
+    def spider_opened(self, spider):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            spider.logger.error(f"Métriques indisponibles sur {self.host}:{self.port}: {e}")
+        else:
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+            spider.logger.info(f"Métriques exposées sur http://{self.host}:{self.port}/metrics")
+
+        self.sampler = task.LoopingCall(self.sample, spider)
+        self.sampler.start(self.interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.sampler and self.sampler.running:
+            self.sampler.stop()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def engine_stopped(self):
+        instrumentation.detach(self)
+
+    # ============================
+    # OBSERVATIONS
+    # ============================
+
+    def on_enter(self, stage, label):
+        pass
+
+    def on_exit(self, stage, label, elapsed):
+        metric, label_name = self.STAGE_METRICS.get(stage, (f"kbo_{stage}_seconds", "name"))
+        self.registry.observe(metric, {label_name: label}, elapsed)
+
+    def handler_name(self, request):
+        scheme = urlparse_cached(request).scheme
+        if scheme not in self.handler_names:
+            handler = self.crawler.settings.getwithbase("DOWNLOAD_HANDLERS").get(scheme)
+            name = handler if isinstance(handler, str) else getattr(handler, "__name__", str(handler))
+            self.handler_names[scheme] = name.rsplit(".", 1)[-1]
+        return self.handler_names[scheme]
+
+    def response_received(self, response, request, spider):
+        host = urlparse_cached(request).hostname or ""
+        handler = "httpcache" if "cached" in response.flags else self.handler_name(request)
+        self.registry.inc("kbo_responses_received", {"host": host, "status": response.status})
+
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            self.registry.observe("kbo_download_latency_seconds", {"host": host, "handler": handler}, latency)
+
+    def item_scraped(self, item, spider):
+        self.items_scraped += 1
+        self.registry.inc("kbo_items_scraped", {"spider": spider.name})
+
+    def sample(self, spider):
+        """Relevé périodique des files d'attente et du débit"""
+        engine = self.crawler.engine
+        labels = {"spider": spider.name}
+
+        scheduler = _engine_scheduler(engine)
+        if scheduler is not None:
+            self.registry.set("kbo_scheduler_queue_depth", labels, len(scheduler))
+
+        downloader = engine.downloader
+        self.registry.set("kbo_downloader_active_requests", labels, len(downloader.active))
+        queued = sum(len(slot.queue) for slot in downloader.slots.values())
+        self.registry.set("kbo_downloader_queued_requests", labels, queued)
+
+        scraper_slot = engine.scraper.slot
+        if scraper_slot is not None:
+            self.registry.set("kbo_scraper_active_items", labels, scraper_slot.itemproc_size)
+
+        now = time.monotonic()
+        last_time, last_items = self.last_sample
+        if now > last_time:
+            rate = (self.items_scraped - last_items) / (now - last_time)
+            self.registry.set("kbo_items_per_second", labels, round(rate, 3))
+        self.last_sample = (now, self.items_scraped)
+
+
+class ProfilingExtension:
+    """Profilage à la demande des callbacks, extracteurs et pipelines instrumentés.
+
+    Activée par PROFILING_ENABLED (sans ce réglage, rien n'est enveloppé). Une fenêtre
+    de PROFILING_WINDOW secondes démarre à la réception de SIGUSR2, quand la stat
+    `profiling/request` passe à 1 (console telnet), ou dès l'ouverture si
+    PROFILING_START_ON_OPEN. Seul le temps passé dans les méthodes instrumentées est
+    profilé. Les fichiers sont écrits dans PROFILING_DIR :
+    - mode "deterministic" : `<spider>-<date>.pstats` (cProfile, lisible avec pstats/snakeviz)
+    - mode "sampling" : `<spider>-<date>.folded` (piles repliées pour flamegraph.pl/speedscope)
+    """
+
+    REQUEST_STAT = "profiling/request"
+
+    def __init__(self, crawler, mode, window, directory, sample_interval, start_on_open):
+        if mode not in ("deterministic", "sampling"):
+            raise NotConfigured(f"PROFILING_MODE inconnu: {mode}")
+        self.crawler = crawler
+        self.mode = mode
+        self.window = window
+        self.directory = directory
+        self.sample_interval = sample_interval
+        self.start_on_open = start_on_open
+
+        self.active = False
+        self.depth = 0
+        self.profiler = None
+        self.samples = None
+        self.spider = None
+        self.poller = None
+        self.previous_handlers = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("PROFILING_ENABLED"):
+            raise NotConfigured
+
+        ext = cls(
+            crawler,
+            mode=settings.get("PROFILING_MODE", "deterministic"),
+            window=settings.getfloat("PROFILING_WINDOW", 60.0),
+            directory=settings.get("PROFILING_DIR", "profiles"),
+            sample_interval=settings.getfloat("PROFILING_SAMPLE_INTERVAL", 0.005),
+            start_on_open=settings.getbool("PROFILING_START_ON_OPEN"),
+        )
+        instrumentation.attach(ext)
+
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.engine_stopped, signal=signals.engine_stopped)
+        return ext
+
+    # ============================
+    # CYCLE DE VIE
+    # ============================
+
+    def spider_opened(self, spider):
+        self.spider = spider
+        if hasattr(signal, "SIGUSR2"):
+            self.previous_handlers[signal.SIGUSR2] = signal.signal(signal.SIGUSR2, self.on_signal)
+
+        self.poller = task.LoopingCall(self.poll_request_flag)
+        self.poller.start(1.0, now=False)
+
+        if self.start_on_open:
+            self.start_window()
+
+    def spider_closed(self, spider):
+        if self.poller and self.poller.running:
+            self.poller.stop()
+        if self.active:
+            self.stop_window()
+        for signum, handler in self.previous_handlers.items():
+            signal.signal(signum, handler)
+        self.previous_handlers = {}
+
+    def engine_stopped(self):
+        instrumentation.detach(self)
+
+    def on_signal(self, signum, frame):
+        from twisted.internet import reactor
+        reactor.callFromThread(self.start_window)
+
+    def poll_request_flag(self):
+        stats = self.crawler.stats
+        if stats.get_value(self.REQUEST_STAT):
+            stats.set_value(self.REQUEST_STAT, 0)
+            self.start_window()
+
+    # ============================
+    # FENÊTRE DE PROFILAGE
+    # ============================
+
+    def start_window(self):
+        from twisted.internet import reactor
+
+        if self.active:
+            return
+        self.spider.logger.info(f"Profilage ({self.mode}) démarré pour {self.window:.0f}s")
+        self.depth = 0
+        if self.mode == "sampling":
+            self.samples = Counter()
+            signal.signal(signal.SIGPROF, self.on_sample)
+            signal.setitimer(signal.ITIMER_PROF, self.sample_interval, self.sample_interval)
+        else:
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+        self.active = True
+        reactor.callLater(self.window, self.stop_window)
+
+    def stop_window(self):
+        if not self.active:
+            return
+        self.active = False
+        if self.mode == "sampling":
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        elif self.depth:
+            self.profiler.disable()
+        self.depth = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        if self.mode == "sampling":
+            path = os.path.join(self.directory, f"{self.spider.name}-{stamp}.folded")
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            self.samples = None
+        else:
+            path = os.path.join(self.directory, f"{self.spider.name}-{stamp}.pstats")
+            self.profiler.dump_stats(path)
+            self.profiler = None
+
+        self.crawler.stats.inc_value("profiling/windows")
+        self.crawler.stats.set_value("profiling/last_file", path)
+        self.spider.logger.info(f"Profil écrit dans {path}")
+
+    # ============================
+    # OBSERVATIONS
+    # ============================
+
+    def on_enter(self, stage, label):
+        if not self.active:
+            return
+        self.depth += 1
+        if self.depth == 1 and self.profiler is not None:
+            self.profiler.enable()
+
+    def on_exit(self, stage, label, elapsed):
+        if not self.active or not self.depth:
+            return
+        self.depth -= 1
+        if self.depth == 0 and self.profiler is not None:
+            self.profiler.disable()
+
+    def on_sample(self, signum, frame):
+        # Seuls les échantillons pris dans une méthode instrumentée sont gardés
+        if not self.depth or frame is None:
+            return
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        self.samples[";".join(reversed(stack))] += 1
+
+
+class MemoryMonitorExtension:
+    """Suivi mémoire des longs crawls : RSS, structures qui grossissent, sites d'allocation.
+
+    Activée par MEMWATCH_ENABLED. Toutes les MEMWATCH_INTERVAL secondes :
+    - RSS courant et tendance (Mo/heure) sur les derniers relevés ;
+    - taille des structures connues par composant (publications vues par le pipeline
+      de déduplication, accumulateurs `publications_acc` des requêtes en vol, listes
+      de numéros des spiders) et objets Scrapy vivants par classe ;
+    - avec MEMWATCH_TRACEMALLOC, les sites d'allocation qui ont le plus grossi depuis
+      le relevé précédent, regroupés par composant.
+    Au-delà de MEMWATCH_SOFT_LIMIT_MB le moteur est mis en pause (les requêtes et items
+    en cours se terminent) jusqu'à redescendre sous MEMWATCH_RESUME_RATIO de la limite ou
+    MEMWATCH_MAX_PAUSE secondes ; au-delà de MEMWATCH_HARD_LIMIT_MB le spider est fermé.
+    """
+
+    TREND_SAMPLES = 10
+
+    def __init__(self, crawler, interval, use_tracemalloc, top, soft_limit_mb, hard_limit_mb,
+                 resume_ratio, max_pause):
+        self.crawler = crawler
+        self.interval = interval
+        self.use_tracemalloc = use_tracemalloc
+        self.top = top
+        self.soft_limit_mb = soft_limit_mb
+        self.hard_limit_mb = hard_limit_mb
+        self.resume_ratio = resume_ratio
+        self.max_pause = max_pause
+
+        self.history = deque(maxlen=self.TREND_SAMPLES)
+        self.snapshot = None
+        self.paused_since = None
+        self.monitor = None
+        self.started_tracemalloc = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("MEMWATCH_ENABLED"):
+            raise NotConfigured
+
+        ext = cls(
+            crawler,
+            interval=settings.getfloat("MEMWATCH_INTERVAL", 60.0),
+            use_tracemalloc=settings.getbool("MEMWATCH_TRACEMALLOC"),
+            top=settings.getint("MEMWATCH_TOP", 10),
+            soft_limit_mb=settings.getint("MEMWATCH_SOFT_LIMIT_MB", 0),
+            hard_limit_mb=settings.getint("MEMWATCH_HARD_LIMIT_MB", 0),
+            resume_ratio=settings.getfloat("MEMWATCH_RESUME_RATIO", 0.9),
+            max_pause=settings.getfloat("MEMWATCH_MAX_PAUSE", 300.0),
+        )
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        if self.use_tracemalloc:
+            # Importé seulement avec MEMWATCH_TRACEMALLOC (comme dans allocation_growth)
+            import tracemalloc
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracemalloc = True
+        self.monitor = task.LoopingCall(self.check, spider)
+        self.monitor.start(self.interval, now=True)
+
+    def spider_closed(self, spider):
+        if self.monitor and self.monitor.running:
+            self.monitor.stop()
+        if self.started_tracemalloc:
+            import tracemalloc
+
+            tracemalloc.stop()
+        self.snapshot = None
+
+    # ============================
+    # MESURES
+    # ============================
+
+    @staticmethod
+    def rss_mb():
+        try:
+            with open("/proc/self/statm") as f:
+                pages = int(f.read().split()[1])
+            return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+        except (OSError, ValueError):
+            # Hors Linux : pic de RSS seulement (Ko sous Linux/BSD, octets sous macOS)
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+    def trend_mb_per_hour(self):
+        if len(self.history) < 2:
+            return 0.0
+        (t0, rss0), (t1, rss1) = self.history[0], self.history[-1]
+        return (rss1 - rss0) / (t1 - t0) * 3600 if t1 > t0 else 0.0
+
+    def component_sizes(self, spider):
+        """Nombre d'éléments dans les structures qui grossissent, par composant"""
+        engine = self.crawler.engine
+        sizes = {}
+
+        for pipeline in getattr(engine.scraper.itemproc, "middlewares", ()):
+            name = type(pipeline).__name__
+            if hasattr(pipeline, "seen_publications"):
+                sizes[f"{name}.seen_publications"] = len(pipeline.seen_publications)
+            if hasattr(pipeline, "fingerprints"):
+                sizes[f"{name}.fingerprints"] = len(pipeline.fingerprints)
+
+        numbers = getattr(spider, "enterprise_numbers", None)
+        if numbers is not None:
+            sizes[f"{spider.name}.enterprise_numbers"] = len(numbers)
+
+        in_flight = list(live_refs.get(Request, {}))
+        sizes["requests.publications_acc"] = sum(
+            len(request.meta.get("publications_acc") or ()) for request in in_flight
+        )
+
+        for cls, refs in list(live_refs.items()):
+            if refs:
+                sizes[f"live.{cls.__name__}"] = len(refs)
+        return sizes
+
+    @staticmethod
+    def component_of(filename):
+        """Composant responsable d'une allocation, d'après le chemin du fichier"""
+        path = filename.replace(os.sep, "/")
+        if "/kbo_scraper/" in path:
+            return path.rsplit("/kbo_scraper/", 1)[1].rsplit(".", 1)[0].replace("/", ".")
+        if "/site-packages/" in path:
+            return path.rsplit("/site-packages/", 1)[1].split("/", 1)[0]
+        return "python"
+
+    def allocation_growth(self):
+        """Sites d'allocation qui ont le plus grossi depuis le relevé précédent"""
+        import tracemalloc
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        previous, self.snapshot = self.snapshot, snapshot
+        if previous is None:
+            return [], {}
+
+        diffs = snapshot.compare_to(previous, "lineno")
+        by_component = Counter()
+        for diff in diffs:
+            by_component[self.component_of(diff.traceback[0].filename)] += diff.size_diff
+        top_sites = [diff for diff in diffs if diff.size_diff > 0][:self.top]
+        return top_sites, by_component
+
+    def check(self, spider):
+        stats = self.crawler.stats
+        rss = self.rss_mb()
+        self.history.append((time.monotonic(), rss))
+        trend = self.trend_mb_per_hour()
+
+        stats.set_value("memwatch/rss_mb", round(rss, 1))
+        stats.max_value("memwatch/rss_max_mb", round(rss, 1))
+        stats.set_value("memwatch/trend_mb_per_hour", round(trend, 1))
+
+        sizes = self.component_sizes(spider)
+        for name, size in sizes.items():
+            stats.set_value(f"memwatch/size/{name}", size)
+
+        spider.logger.info(
+            f"Mémoire: RSS {rss:.0f} Mo ({trend:+.0f} Mo/h) - "
+            + ", ".join(f"{name}={size}" for name, size in sorted(sizes.items()))
+        )
+
+        if self.use_tracemalloc:
+            top_sites, by_component = self.allocation_growth()
+            for component, size_diff in by_component.items():
+                stats.set_value(f"memwatch/growth_kb/{component}", round(size_diff / 1024, 1))
+            for diff in top_sites:
+                frame = diff.traceback[0]
+                spider.logger.info(
+                    f"Croissance mémoire: {frame.filename}:{frame.lineno} "
+                    f"{diff.size_diff / 1024:+.1f} Ko ({diff.count_diff:+d} blocs)"
+                )
+
+        self.enforce_limits(spider, rss)
+
+    # ============================
+    # LIMITES
+    # ============================
+
+    def enforce_limits(self, spider, rss):
+        engine = self.crawler.engine
+
+        if self.hard_limit_mb and rss > self.hard_limit_mb:
+            spider.logger.error(f"Limite mémoire dure dépassée ({rss:.0f} > {self.hard_limit_mb} Mo): fermeture")
+            self.crawler.stats.set_value("memwatch/hard_limit_reached", True)
+            if self.paused_since is not None:
+                engine.unpause()
+                self.paused_since = None
+            engine.close_spider(spider, "memwatch_hard_limit")
+            return
+
+        if not self.soft_limit_mb:
+            return
+
+        if self.paused_since is None:
+            if rss > self.soft_limit_mb:
+                spider.logger.warning(
+                    f"Limite mémoire douce dépassée ({rss:.0f} > {self.soft_limit_mb} Mo): pause du moteur"
+                )
+                self.crawler.stats.inc_value("memwatch/pauses")
+                engine.pause()
+                self.paused_since = time.monotonic()
+                gc.collect()
+            return
+
+        paused_for = time.monotonic() - self.paused_since
+        if rss < self.soft_limit_mb * self.resume_ratio or paused_for > self.max_pause:
+            spider.logger.info(f"Reprise du moteur après {paused_for:.0f}s de pause (RSS {rss:.0f} Mo)")
+            engine.unpause()
+            self.paused_since = None
+        else:
+            gc.collect()
+
+
+
+class ExtractionPoolExtension:
+    """Donne aux spiders un pool de processus pour l'extraction HTML (EXTRACTION_POOL_WORKERS).
+
+    Seuls les spiders qui déclarent un attribut `extraction_pool` l'utilisent ; à 0
+    (défaut), l'extraction reste dans le callback, sur le thread du réacteur.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        workers = crawler.settings.getint("EXTRACTION_POOL_WORKERS", 0)
+        if workers <= 0:
+            raise NotConfigured
+        ext = cls(workers)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        if not hasattr(spider, "extraction_pool"):
+            return
+        from kbo_scraper.offload import ExtractionPool
+
+        self.pool = ExtractionPool(self.workers)
+        spider.extraction_pool = self.pool
+        logger.info(f"Extraction HTML déportée sur {self.workers} processus")
+
+    def spider_closed(self, spider):
+        if self.pool is not None:
+            spider.extraction_pool = None
+            self.pool.shutdown()
+            self.pool = None
+
+
+class StatsDumpExtension:
+    """Écrit les stats finales du crawl en JSON dans STATS_DUMP_FILE.
+
+    Utilisée par `run_spiders.py`, qui lance chaque spider en sous-processus et relit
+    ce fichier pour son rapport au lieu d'analyser la sortie de Scrapy.
+    """
+
+    def __init__(self, stats, path):
+        self.stats = stats
+        self.path = path
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get("STATS_DUMP_FILE")
+        if not path:
+            raise NotConfigured
+        ext = cls(crawler.stats, path)
+        # Après le collecteur de stats, qui renseigne finish_reason et elapsed_time_seconds
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_closed(self, spider, reason):
+        stats = dict(self.stats.get_stats())
+        stats.setdefault("finish_reason", reason)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2, ensure_ascii=False, default=str)
+
+
+class NegativeCacheExtension:
+    """Donne aux spiders le cache des résultats vides (NEGATIVE_CACHE_ENABLED).
+
+    Seuls les spiders qui déclarent un attribut `negative_cache` l'utilisent ; voir
+    `kbo_scraper/negative_cache.py`.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.client = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("NEGATIVE_CACHE_ENABLED"):
+            raise NotConfigured
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        if not hasattr(spider, "negative_cache"):
+            return
+        import pymongo
+
+        from kbo_scraper.indexes import ensure_indexes
+        from kbo_scraper.negative_cache import NEGATIVE_CACHE_COLLECTION, NEGATIVE_CACHE_INDEXES, NegativeCache
+
+        settings = self.crawler.settings
+        self.client = pymongo.MongoClient(settings.get("MONGO_URI"))
+        collection = self.client[settings.get("MONGO_DATABASE", "kbo_db")][NEGATIVE_CACHE_COLLECTION]
+        ensure_indexes(collection, NEGATIVE_CACHE_INDEXES)
+        spider.negative_cache = NegativeCache(
+            collection,
+            base_delay=timedelta(days=settings.getfloat("NEGATIVE_CACHE_BASE_DAYS", 7)),
+            max_delay=timedelta(days=settings.getfloat("NEGATIVE_CACHE_MAX_DAYS", 180)),
+            jitter=settings.getfloat("NEGATIVE_CACHE_JITTER", 0.1),
+            stats=self.crawler.stats,
+        )
+
+    def spider_closed(self, spider):
+        if self.client is not None:
+            spider.negative_cache = None
+            self.client.close()
+            self.client = None
+
+
+class DeadLetterExtension:
+    """File des requêtes en échec (DEAD_LETTER_ENABLED), voir `kbo_scraper/dead_letters.py`.
+
+    Donne un `DeadLetterQueue` aux spiders qui déclarent un attribut `dead_letters`, et
+    relance les échecs du crawl en cours quand le spider est inactif : ceux qui sont dus
+    tout de suite, ou après une pause d'au plus DEAD_LETTER_IDLE_WAIT secondes.
+    """
+
+    def __init__(self, crawler, idle_wait):
+        self.crawler = crawler
+        self.idle_wait = idle_wait
+        self.client = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("DEAD_LETTER_ENABLED"):
+            raise NotConfigured
+        ext = cls(crawler, timedelta(seconds=crawler.settings.getfloat("DEAD_LETTER_IDLE_WAIT", 600)))
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        if not hasattr(spider, "dead_letters"):
+            return
+        import pymongo
+
+        from kbo_scraper.dead_letters import DEAD_LETTERS_COLLECTION, DEAD_LETTERS_INDEXES, DeadLetterQueue
+        from kbo_scraper.indexes import ensure_indexes
+
+        settings = self.crawler.settings
+        self.client = pymongo.MongoClient(settings.get("MONGO_URI"))
+        collection = self.client[settings.get("MONGO_DATABASE", "kbo_db")][DEAD_LETTERS_COLLECTION]
+        ensure_indexes(collection, DEAD_LETTERS_INDEXES)
+        queue = DeadLetterQueue(
+            collection,
+            base_delay=timedelta(seconds=settings.getfloat("DEAD_LETTER_BASE_DELAY", 300)),
+            max_delay=timedelta(seconds=settings.getfloat("DEAD_LETTER_MAX_DELAY", 6 * 3600)),
+            max_attempts=settings.getint("DEAD_LETTER_MAX_ATTEMPTS", 5),
+            stats=self.crawler.stats,
+        )
+        queue.load_pending(spider.name)
+        spider.dead_letters = queue
+
+    def spider_idle(self, spider):
+        queue = getattr(spider, "dead_letters", None)
+        if queue is None or not queue.failed:
+            return
+
+        numbers = queue.due(spider.name, queue.failed)
+        if numbers:
+            logger.info(f"Relance de {len(numbers)} requêtes en échec")
+            for number in numbers:
+                queue.failed.discard(number)
+                # Même URL que l'essai précédent : à ne pas filtrer comme doublon
+                self.crawler.engine.crawl(spider.enterprise_request(number).replace(dont_filter=True))
+            self.crawler.stats.inc_value("dead_letters/refed", len(numbers))
+            raise DontCloseSpider
+
+        # spider_idle revient toutes les 5 s : on attend les réessais proches
+        wait = queue.next_retry_in(spider.name, queue.failed)
+        if wait is not None and wait <= self.idle_wait:
+            raise DontCloseSpider
+
+    def spider_closed(self, spider):
+        if self.client is not None:
+            spider.dead_letters = None
+            self.client.close()
+            self.client = None
+
+
+class MoniteurPdfExtension:
+    """PDF du Moniteur Belge et extraction de leur texte (MONITEUR_PDF_DIR), voir
+    `kbo_scraper/moniteur_pdf.py`.
+
+    Donne un `PdfExtractor` aux spiders qui déclarent un attribut `pdf_extractor`, avec
+    son propre pool de MONITEUR_PDF_WORKERS processus.
+    """
+
+    def __init__(self, crawler, directory, workers):
+        self.crawler = crawler
+        self.directory = directory
+        self.workers = workers
+        self.extractor = None
+        self.client = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        directory = crawler.settings.get("MONITEUR_PDF_DIR")
+        if not directory:
+            raise NotConfigured
+        from kbo_scraper.moniteur_pdf import missing_dependency
+
+        missing = missing_dependency()
+        if missing:
+            raise NotConfigured(f"Module requis pour lire les PDF du Moniteur: {missing}")
+        ext = cls(crawler, directory, max(crawler.settings.getint("MONITEUR_PDF_WORKERS", 2), 1))
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        if not hasattr(spider, "pdf_extractor"):
+            return
+        import pymongo
+
+        from kbo_scraper.indexes import ensure_indexes
+        from kbo_scraper.moniteur_pdf import MONITEUR_CONTENTS_COLLECTION, PdfExtractor, PdfStore
+        from kbo_scraper.offload import ExtractionPool
+
+        settings = self.crawler.settings
+        self.client = pymongo.MongoClient(settings.get("MONGO_URI"))
+        contents = self.client[settings.get("MONGO_DATABASE", "kbo_db")][MONITEUR_CONTENTS_COLLECTION]
+        # Textes d'une entreprise : {"enterprise_numbers": numéro}
+        ensure_indexes(contents, [pymongo.IndexModel([("enterprise_numbers", pymongo.ASCENDING)],
+                                                     name="enterprise_numbers")])
+        self.extractor = PdfExtractor(PdfStore(self.directory), ExtractionPool(self.workers), self.crawler.stats,
+                                      contents)
+        spider.pdf_extractor = self.extractor
+        logger.info(f"PDF du Moniteur dans {self.directory}, extraction sur {self.workers} processus")
+
+    def spider_closed(self, spider):
+        if self.extractor is not None:
+            spider.pdf_extractor = None
+            self.extractor.shutdown()
+            self.extractor = None
+        if self.client is not None:
+            self.client.close()
+            self.client = None
@@ -0,0 +1,388 @@
+# kbo_scraper/extractors.py
+"""Extraction des pages KBO et ejustice, sans dépendance à Scrapy.
+
+Chaque fonction prend un objet qui expose `.xpath()` (une `Response` Scrapy ou un
+`parsel.Selector`) et ne retourne que des types simples (dict, list, str, int, Decimal, datetime, None).
+Les spiders les appellent directement ; les variantes `*_from_body` reconstruisent le
+sélecteur à partir des octets de la page pour pouvoir tourner dans un processus du
+pool d'extraction (voir `kbo_scraper/offload.py`).
+
+Le sélecteur vient d'un backend de parsing (setting HTML_PARSER_BACKEND) :
+- "parsel" (défaut) : arbre lxml de la page entière, comme `response.xpath` ;
+- "sliced" : la page est d'abord coupée au conteneur utile (blocs `list-item` et
+  pagination d'ejustice, tableaux de la fiche KBO), seul ce morceau est parsé par lxml.
+Les fonctions d'extraction sont les mêmes : un marqueur introuvable fait parser la
+page entière, et `benchmarks/bench_parsers.py --verify` compare les deux backends sur
+les pages du cache HTTP.
+"""
+import re
+from urllib.parse import urljoin
+
+from parsel import Selector
+
+from kbo_scraper.normalize import is_placeholder_entries, normalize_enterprise, with_typed_dates
+from kbo_scraper.schema import SCHEMA_VERSION
+
+WHITESPACE_RE = re.compile(r'\s+')
+SINCE_RE = re.compile(r'Depuis le (.+?)$')
+SINCE_SUFFIX_RE = re.compile(r'\s*Depuis le .+$')
+PUBLICATION_DATE_REF_RE = re.compile(r'(\d{4}-\d{2}-\d{2})\s*/\s*(\d+)')
+
+
+def clean_text(text):
+    if text:
+        return WHITESPACE_RE.sub(' ', text.strip())
+    return None
+
+
+def selector_from_body(body, url, encoding):
+    return Selector(text=body.decode(encoding or "utf-8", "replace"), base_url=url)
+
+
+# ============================
+# BACKENDS DE PARSING
+# ============================
+
+# Page -> (textes dont la première occurrence ouvre le morceau, texte qui le ferme).
+# Les XPath de la liste ejustice ne visent que des éléments dont la classe contient
+# "list-item" ou "pagination-container" ; ceux de la fiche KBO que des td/h2/table,
+# tous entre div#table et div#EndTable.
+PAGE_SLICES = {
+    "publication_list": ((b"list-item", b"pagination-container"), b"</main"),
+    "enterprise": ((b'id="table"',), b'id="EndTable"'),
+}
+
+
+def _ascii_compatible(encoding):
+    # Couper les octets sur "<" n'est sûr que si "<" est codé sur un octet (pas UTF-16)
+    try:
+        return "<".encode(encoding) == b"<"
+    except LookupError:
+        return False
+
+
+def page_slice(body, page):
+    """(début, fin) du morceau utile de `body`, ou None si un marqueur manque"""
+    start_markers, end_marker = PAGE_SLICES[page]
+    positions = [position for position in map(body.find, start_markers) if position >= 0]
+    if not positions:
+        return None
+    # Début de la balise qui porte le premier marqueur
+    start = body.rfind(b"<", 0, min(positions))
+    if start < 0:
+        return None
+    # Fin : début de la balise qui porte le marqueur de fin, après la dernière occurrence
+    last = max(body.rfind(marker) for marker in start_markers)
+    found = body.find(end_marker, last)
+    end = body.rfind(b"<", last, found + 1) if found >= 0 else -1
+    if end <= start:
+        return None
+    return start, end
+
+
+def parse_full(body, url, encoding, page):
+    return selector_from_body(body, url, encoding)
+
+
+def parse_sliced(body, url, encoding, page):
+    bounds = page_slice(body, page) if _ascii_compatible(encoding or "utf-8") else None
+    if bounds is None:
+        return selector_from_body(body, url, encoding)
+    start, end = bounds
+    # Décodage du morceau sans copie préalable des octets
+    text = str(memoryview(body)[start:end], encoding or "utf-8", "replace")
+    return Selector(text=text, base_url=url)
+
+
+PARSER_BACKENDS = {
+    "parsel": parse_full,
+    "sliced": parse_sliced,
+}
+
+
+def check_parser_backend(backend):
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(f"HTML_PARSER_BACKEND inconnu : {backend!r} (choix : {', '.join(PARSER_BACKENDS)})")
+    return backend
+
+
+def page_selector(body, url, encoding, page, backend="parsel"):
+    return PARSER_BACKENDS[backend](body, url, encoding, page)
+
+
+def response_selector(response, page, backend="parsel"):
+    """Sélecteur d'une réponse Scrapy : la réponse elle-même (sélecteur déjà mis en cache)
+    avec "parsel", sinon celui du backend"""
+    if backend == "parsel":
+        return response
+    return page_selector(response.body, response.url, response.encoding, page, backend)
+
+
+# ============================
+# PAGE ENTREPRISE (KBO)
+# ============================
+
+def extract_nace_codes(sel, version):
+    nace_data = []
+    section_rows = sel.xpath(
+        f'//h2[contains(text(), "Code Nacebel version {version}")]/ancestor::tr/following-sibling::tr'
+    )
+    for row in section_rows:
+        if row.xpath('.//h2'):
+            break
+        texts = row.xpath('.//text()').getall()
+        texts = [t.strip() for t in texts if t.strip()]
+        if not texts:
+            continue
+        full_text = " ".join(texts)
+        match = re.match(r'(TVA|ONSS)\s*' + version + r'\s*([0-9.]+)\s*-\s*(.+)', full_text)
+        if match:
+            nace_type = match.group(1)
+            code = match.group(2)
+            desc_date = match.group(3)
+            date_match = re.search(r'Depuis le (.+)$', desc_date)
+            if date_match:
+                date = date_match.group(1).strip()
+                description = SINCE_SUFFIX_RE.sub('', desc_date).strip()
+            else:
+                date = "Date not found"
+                description = desc_date.strip()
+            nace_data.append({
+                "version": version,
+                "type": nace_type,
+                "code": code,
+                "description": description,
+                "date": date
+            })
+    return nace_data
+
+
+def extract_dated_rows(sel, section, stop_xpath):
+    """Lignes "<libellé> Depuis le <date>" qui suivent le titre `section`"""
+    entries = []
+    rows = sel.xpath(f'//h2[contains(text(), "{section}")]/ancestor::tr/following-sibling::tr')
+    for row in rows:
+        if row.xpath(stop_xpath):
+            break
+        texts = row.xpath('.//text()').getall()
+        if not texts:
+            continue
+        text = ' '.join([t.strip() for t in texts if t.strip()])
+        if not text:
+            continue
+        date_match = SINCE_RE.search(text)
+        if date_match:
+            date = date_match.group(1).strip()
+            name = SINCE_SUFFIX_RE.sub('', text).strip()
+        else:
+            date = "Date not found"
+            name = text.strip()
+        if name:
+            entries.append({"name": clean_text(name), "date": clean_text(date)})
+    return entries
+
+
+def extract_qualities(sel):
+    return extract_dated_rows(sel, "Qualités", './/h2[contains(text(), "Autorisations")]')
+
+
+def extract_entrepreneurial_capacities(sel):
+    return extract_dated_rows(sel, "Capacités entrepreneuriales", './/h2')
+
+
+def extract_functions(sel):
+    functions_data = []
+    hidden_functions = sel.xpath('//table[@id="toonfctie"]//tr')
+    for row in hidden_functions:
+        function_role = row.xpath('.//td[1]//text()').get()
+        function_name = row.xpath('.//td[2]//text()').getall()
+        function_date = row.xpath('.//td[3]//span[@class="upd"]/text()').get()
+        if function_role and function_name:
+            name_clean = ' '.join([n.strip() for n in function_name if n.strip()])
+            name_clean = re.sub(r'\s*,\s*', ', ', name_clean)
+            name_clean = WHITESPACE_RE.sub(' ', name_clean).strip()
+            functions_data.append({
+                'role': clean_text(function_role),
+                'name': name_clean,
+                'date': clean_text(function_date) if function_date else "Date not found"
+            })
+    return functions_data
+
+
+def extract_financial_data(sel):
+    financial_rows = '//h2[contains(text(), "Données financières")]/ancestor::tr/following-sibling::tr'
+    labels = {
+        "capital": "Capital",
+        "general_assembly": "Assemblée générale",
+        "fiscal_year_end": "Date de fin de l'année comptable",
+    }
+    financial_data = {}
+    for key, label in labels.items():
+        value = sel.xpath(f'{financial_rows}[td[contains(text(), "{label}")]]/td[2]//text()').get()
+        financial_data[key] = clean_text(value) if value else "Not found"
+    return financial_data
+
+
+def extract_entity_links(sel):
+    links_section = sel.xpath(
+        '//h2[contains(text(), "Liens entre entités")]/ancestor::tr/following-sibling::tr[1]//text()'
+    ).getall()
+    links_section = [t.strip() for t in links_section if t.strip()]
+    return " ".join(links_section) if links_section else "Not found"
+
+
+def extract_external_links(sel):
+    external_links = []
+    links = sel.xpath('//h2[contains(text(), "Liens externes")]/ancestor::tr/following-sibling::tr[1]//a')
+    for link in links:
+        href = link.xpath('./@href').get()
+        label = link.xpath('.//text()').get()
+        if href and label:
+            external_links.append({
+                "label": clean_text(label),
+                "url": href
+            })
+    return external_links
+
+
+def extract_authorizations(sel):
+    authorizations = []
+    rows = sel.xpath('//h2[contains(text(), "Autorisations")]/ancestor::tr/following-sibling::tr')
+    for row in rows:
+        links = row.xpath('.//a[@class="external"]')
+        for link in links:
+            href = link.xpath('./@href').get()
+            label = link.xpath('normalize-space(string(.))').get()
+            if href:
+                authorizations.append({
+                    "label": clean_text(label),
+                    "url": href
+                })
+    return authorizations
+
+
+def first_text(sel, xpath, default="Not found"):
+    value = sel.xpath(xpath).get()
+    return clean_text(value) if value else default
+
+
+def first_of_all(sel, xpath, default="Not found"):
+    values = sel.xpath(xpath).getall()
+    return values[0].strip() if values else default
+
+
+def extract_enterprise(sel):
+    """Tous les champs de la fiche entreprise, au format du schéma courant (valeurs typées)"""
+    fields = {}
+
+    # ========= INFORMATIONS =========
+    fields["status"] = first_text(
+        sel, '//td[contains(text(), "Statut:")]/following-sibling::td//span/text()', "Status not found"
+    )
+    fields["juridical_situation"] = first_text(
+        sel, '//td[contains(text(), "Situation juridique:")]/following-sibling::td//span[@class="pageactief"]/text()'
+    )
+    fields["start_date"] = first_text(sel, '//td[contains(text(), "Date de début:")]/following-sibling::td/text()')
+    fields["company_name"] = first_of_all(
+        sel, '//td[contains(text(), "Dénomination:")]/following-sibling::td//text()', "Name not found"
+    )
+    fields["abbreviation"] = first_of_all(sel, '//td[contains(text(), "Abréviation:")]/following-sibling::td//text()')
+    address_elements = sel.xpath('//td[contains(text(), "Adresse du siège:")]/following-sibling::td//text()').getall()
+    if address_elements:
+        full_address = ' '.join(
+            [elem.strip() for elem in address_elements if elem.strip() and "Depuis le" not in elem])
+        fields["headquarters_address"] = clean_text(full_address)
+    else:
+        fields["headquarters_address"] = "Not found"
+    fields["phone"] = first_text(sel, '//td[contains(text(), "Numéro de téléphone:")]/following-sibling::td/text()')
+    fields["email"] = first_text(sel, '//td[contains(text(), "E-mail:")]/following-sibling::td/text()')
+    fields["website"] = first_text(sel, '//td[contains(text(), "Adresse web:")]/following-sibling::td/text()')
+    fields["entity_type"] = first_text(sel, '//td[contains(text(), "Type d\'entité:")]/following-sibling::td/text()')
+    fields["legal_form"] = first_of_all(sel, '//td[contains(text(), "Forme légale:")]/following-sibling::td//text()')
+    fields["establishment_units"] = first_text(
+        sel, '//td[contains(text(), "Nombre d\'unités d\'établissement")]/following-sibling::td/strong/text()'
+    )
+
+    # ========= SECTIONS DATÉES =========
+    qualities = extract_qualities(sel)
+    fields["qualities"] = [] if is_placeholder_entries(qualities) else with_typed_dates(qualities)
+    fields["functions"] = with_typed_dates(extract_functions(sel))
+    nace_all = []
+    for version in ("2025", "2008", "2003"):
+        nace_all.extend(extract_nace_codes(sel, version))
+    fields["nace_codes"] = with_typed_dates(nace_all)
+
+    fields["financial_data"] = extract_financial_data(sel)
+    fields["entity_links"] = extract_entity_links(sel)
+    fields["external_links"] = extract_external_links(sel)
+
+    capacities = extract_entrepreneurial_capacities(sel)
+    fields["entrepreneurial_capacities"] = [] if is_placeholder_entries(capacities) else with_typed_dates(capacities)
+    fields["authorizations"] = extract_authorizations(sel)
+
+    fields["schema_version"] = SCHEMA_VERSION
+    return normalize_enterprise(fields)
+
+
+def extract_enterprise_from_body(body, url, encoding, backend="parsel"):
+    return extract_enterprise(page_selector(body, url, encoding, "enterprise", backend))
+
+
+# ============================
+# LISTE DE PUBLICATIONS (EJUSTICE)
+# ============================
+
+def extract_publication_list(sel, url, enterprise_number):
+    """Publications d'une page de résultats et lien vers la page suivante (ou None)"""
+    publications = []
+    for item in sel.xpath('//div[@class="list-item"]'):
+        content = item.xpath('.//div[@class="list-item--content"]')
+
+        subtitle_text = content.xpath('.//p[contains(@class,"list-item--subtitle")]//text()').getall()
+        subtitle_text = [t.strip() for t in subtitle_text if t.strip()]
+        publication_code = subtitle_text[-1] if subtitle_text else None
+
+        title_lines = content.xpath('.//a[contains(@class,"list-item--title")]//text()').getall()
+        title_lines = [line.strip() for line in title_lines if line.strip()]
+
+        address = title_lines[0] if len(title_lines) > 0 else None
+        type_pub = title_lines[2] if len(title_lines) > 2 else None
+
+        date_ref_match = PUBLICATION_DATE_REF_RE.search(' '.join(title_lines))
+        publication_date, publication_ref = (date_ref_match.groups() if date_ref_match else (None, None))
+
+        pdf_href = content.xpath('.//a[@class="standard"]/@href').get()
+        pdf_url = urljoin(url, pdf_href) if pdf_href else None
+
+        detail_link = content.xpath('.//a[contains(@class,"read-more")]/@href').get()
+        detail_url = urljoin(url, detail_link) if detail_link else None
+
+        title = type_pub or ' - '.join(title_lines) or publication_code or address or ""
+        publication_number = publication_ref or publication_code or None
+
+        publications.append({
+            "enterprise_number": enterprise_number,
+            "title": title,
+            "publication_number": publication_number,
+            "publication_date": publication_date,
+            "address": address,
+            "type_publication": type_pub,
+            "publication_code": publication_code,
+            "publication_ref": publication_ref,
+            "pdf_url": pdf_url,
+            "detail_url": detail_url
+        })
+
+    next_page = None
+    if publications:
+        next_href = sel.xpath(
+            '//div[contains(@class,"pagination-container")]//a[contains(@class,"pagination-next")]/@href'
+        ).get()
+        next_page = urljoin(url, next_href) if next_href else None
+
+    return {"publications": publications, "next_page": next_page}
+
+
+def extract_publication_list_from_body(body, url, encoding, enterprise_number, backend="parsel"):
+    return extract_publication_list(page_selector(body, url, encoding, "publication_list", backend),
+                                    url, enterprise_number)
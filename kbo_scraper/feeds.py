@@ -0,0 +1,412 @@
+# kbo_scraper/feeds.py
+"""Exports en colonnes (Parquet, Arrow) et flux JSONL compressés (zstd).
+
+Trois tables au schéma fixe : `enterprises` (fiche KBO), `publications` (Moniteur
+Belge, une ligne par publication) et `deposits` (comptes annuels BNB, une ligne par
+dépôt). Les sections imbriquées de la fiche (fonctions, codes NACE...) sont écrites
+en texte JSON : le schéma ne dépend pas du contenu d'une page.
+
+Arborescence : <dossier>/<format>/<table>/date=AAAA-MM-JJ/<préfixe>-<n>.<ext>, partitionnée
+par date de scraping (lisible telle quelle par pyarrow.dataset, Spark ou DuckDB). L'export
+hors crawl est un instantané, sans partition : <dossier>/<format>/<table>/<préfixe>-<n>.<ext>.
+Les lignes sont écrites par lots de FEED_BATCH_SIZE (un row group Parquet par lot),
+et chaque fichier est fermé et un suivant ouvert après FEED_ROWS_PER_FILE lignes.
+Un fichier en cours d'écriture porte un nom caché (.<nom>.tmp) : il n'apparaît sous
+son nom définitif qu'une fois complet.
+
+Sources : `FeedExportPipeline` pendant le crawl, `export_collection` hors crawl
+(curseur Mongo par lots, mémoire bornée). pyarrow (Parquet, Arrow) et zstandard
+(jsonl.zst) ne sont importés que pour les formats demandés.
+"""
+import importlib.util
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime
+
+from kbo_scraper.normalize import parse_kbo_date
+
+# Extension de fichier et module requis par format
+FORMATS = {
+    "parquet": (".parquet", "pyarrow"),
+    "arrow": (".arrow", "pyarrow"),
+    "jsonl.zst": (".jsonl.zst", "zstandard"),
+}
+
+ENTERPRISE_NESTED_FIELDS = (
+    "qualities", "functions", "nace_codes", "external_links", "financial_data",
+    "entrepreneurial_capacities", "authorizations", "belac_details",
+)
+
+# (colonne, type) ; "json" : valeur imbriquée sérialisée en texte
+SCHEMAS = {
+    "enterprises": [
+        ("enterprise_number", "string"),
+        ("status", "string"),
+        ("juridical_situation", "string"),
+        ("start_date", "timestamp"),
+        ("company_name", "string"),
+        ("abbreviation", "string"),
+        ("headquarters_address", "string"),
+        ("phone", "string"),
+        ("email", "string"),
+        ("website", "string"),
+        ("entity_type", "string"),
+        ("legal_form", "string"),
+        ("establishment_units", "int64"),
+        ("tva_activity_2025", "string"),
+        ("onss_activity_2025", "string"),
+        ("entity_links", "string"),
+        *((field, "json") for field in ENTERPRISE_NESTED_FIELDS),
+        ("schema_version", "int64"),
+        ("last_scraped", "timestamp"),
+    ],
+    "publications": [
+        ("enterprise_number", "string"),
+        ("publication_number", "string"),
+        ("publication_ref", "string"),
+        ("publication_code", "string"),
+        ("publication_date", "timestamp"),
+        ("title", "string"),
+        ("type_publication", "string"),
+        ("address", "string"),
+        ("pdf_url", "string"),
+        ("detail_url", "string"),
+        ("scraping_date", "timestamp"),
+    ],
+    "deposits": [
+        ("enterprise_number", "string"),
+        ("reference", "string"),
+        ("title", "string"),
+        ("language", "string"),
+        ("start_date", "timestamp_utc"),
+        ("end_date", "timestamp_utc"),
+        ("scraping_date", "timestamp"),
+    ],
+}
+
+
+def missing_dependencies(formats):
+    """Modules absents pour les formats demandés"""
+    modules = {FORMATS[fmt][1] for fmt in formats}
+    return sorted(module for module in modules if importlib.util.find_spec(module) is None)
+
+
+def check_formats(formats):
+    unknown = [fmt for fmt in formats if fmt not in FORMATS]
+    if unknown:
+        raise ValueError(f"Format(s) d'export inconnu(s): {', '.join(unknown)} (choix: {', '.join(FORMATS)})")
+    missing = missing_dependencies(formats)
+    if missing:
+        raise ImportError(f"Module(s) requis pour l'export: {', '.join(missing)}")
+
+
+def arrow_schema(table):
+    import pyarrow as pa
+
+    types = {
+        "string": pa.string(),
+        "json": pa.string(),
+        "int64": pa.int64(),
+        "timestamp": pa.timestamp("us"),
+        "timestamp_utc": pa.timestamp("us", tz="UTC"),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in SCHEMAS[table]])
+
+
+# ============================
+# CONVERSION EN LIGNES
+# ============================
+
+def parse_timestamp(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return parse_kbo_date(value)
+    return None
+
+
+def coerce(value, kind):
+    if value is None:
+        return None
+    if kind == "json":
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    if kind in ("timestamp", "timestamp_utc"):
+        return parse_timestamp(value)
+    if kind == "int64":
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    return value if isinstance(value, str) else str(value)
+
+
+def to_row(table, values):
+    return {name: coerce(values.get(name), kind) for name, kind in SCHEMAS[table]}
+
+
+def _load_list(value):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            return []
+    return value if isinstance(value, list) else []
+
+
+def publication_rows(enterprise_number, publications, scraping_date):
+    for publication in _load_list(publications):
+        yield to_row("publications", {
+            **publication,
+            "enterprise_number": enterprise_number,
+            "scraping_date": publication.get("scraping_date") or scraping_date,
+        })
+
+
+def deposit_rows(enterprise_number, deposits, scraping_date):
+    for deposit in _load_list(deposits):
+        yield to_row("deposits", {**deposit, "enterprise_number": enterprise_number, "scraping_date": scraping_date})
+
+
+def item_rows(document, spider_name, now):
+    """(table, ligne) d'un item scrapé (champs renseignés, voir Record.to_document)"""
+    number = document.get("enterprise_number")
+    if spider_name == "ejustice_spider":
+        for row in publication_rows(number, document.get("moniteur_publications"), now):
+            yield "publications", row
+    elif spider_name == "consult_spider":
+        for row in deposit_rows(number, document.get("deposits"), now):
+            yield "deposits", row
+    else:
+        yield "enterprises", to_row("enterprises", {**document, "last_scraped": now})
+
+
+def document_rows(doc):
+    """(table, ligne) d'un document de la collection `entreprises`"""
+    number = doc.get("enterprise_number")
+    if doc.get("last_scraped") or doc.get("company_name"):
+        yield "enterprises", to_row("enterprises", doc)
+    for row in publication_rows(number, doc.get("moniteur_publications"), doc.get("moniteur_last_updated")):
+        yield "publications", row
+    for row in deposit_rows(number, doc.get("deposits"), doc.get("deposits_last_updated") or doc.get("last_scraped")):
+        yield "deposits", row
+
+
+def partition_of(row):
+    """Partition de date d'une ligne : date de scraping, sinon "unknown" """
+    timestamp = row.get("scraping_date") or row.get("last_scraped")
+    return f"date={timestamp:%Y-%m-%d}" if isinstance(timestamp, datetime) else "date=unknown"
+
+
+# ============================
+# FICHIERS
+# ============================
+
+class ParquetFile:
+    def __init__(self, path, table, zstd_level):
+        import pyarrow.parquet as pq
+
+        self.schema = arrow_schema(table)
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd", compression_level=zstd_level)
+
+    def write(self, rows):
+        import pyarrow as pa
+
+        self.writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class ArrowFile:
+    def __init__(self, path, table, zstd_level):
+        import pyarrow as pa
+
+        self.schema = arrow_schema(table)
+        self.sink = pa.OSFile(path, "wb")
+        self.writer = pa.ipc.new_file(self.sink, self.schema, options=pa.ipc.IpcWriteOptions(compression="zstd"))
+
+    def write(self, rows):
+        import pyarrow as pa
+
+        self.writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+        self.sink.close()
+
+
+class ZstdJsonlFile:
+    def __init__(self, path, table, zstd_level):
+        import zstandard
+
+        self.stream = zstandard.ZstdCompressor(level=zstd_level).stream_writer(open(path, "wb"))
+
+    def write(self, rows):
+        lines = "".join(json.dumps(row, ensure_ascii=False, default=_json_default) + "\n" for row in rows)
+        self.stream.write(lines.encode("utf-8"))
+
+    def close(self):
+        self.stream.close()
+
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+FILE_CLASSES = {"parquet": ParquetFile, "arrow": ArrowFile, "jsonl.zst": ZstdJsonlFile}
+
+
+class PartitionFeed:
+    """Fichiers successifs d'une partition : lot en mémoire, rotation après `rows_per_file`"""
+
+    def __init__(self, directory, table, fmt, prefix, zstd_level):
+        self.directory = directory
+        self.table = table
+        self.fmt = fmt
+        self.prefix = prefix
+        self.zstd_level = zstd_level
+        self.buffer = []
+        self.file = None
+        self.path = None
+        self.file_rows = 0
+        self.sequence = 0
+        self.files = []
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{self.prefix}-{self.sequence:05d}{FORMATS[self.fmt][0]}"
+        while os.path.exists(os.path.join(self.directory, name)):
+            self.sequence += 1
+            name = f"{self.prefix}-{self.sequence:05d}{FORMATS[self.fmt][0]}"
+        self.sequence += 1
+        self.path = os.path.join(self.directory, name)
+        self.file = FILE_CLASSES[self.fmt](self.temporary_path(), self.table, self.zstd_level)
+        self.file_rows = 0
+
+    def temporary_path(self):
+        return os.path.join(self.directory, f".{os.path.basename(self.path)}.tmp")
+
+    def flush(self, rows_per_file):
+        while self.buffer:
+            if self.file is None:
+                self.open()
+            batch = self.buffer[:rows_per_file - self.file_rows]
+            self.file.write(batch)
+            self.file_rows += len(batch)
+            del self.buffer[:len(batch)]
+            if self.file_rows >= rows_per_file:
+                self.close_file()
+
+    def close_file(self):
+        if self.file is None:
+            return
+        self.file.close()
+        os.replace(self.temporary_path(), self.path)
+        self.files.append(self.path)
+        self.file = None
+
+
+class FeedWriter:
+    """Lignes réparties par table, format et partition, écrites par lots"""
+
+    def __init__(self, directory, formats, prefix, batch_size=1000, rows_per_file=100_000,
+                 zstd_level=3, max_open_files=32, stats=None, partitioned=True):
+        check_formats(formats)
+        self.directory = directory
+        self.formats = list(formats)
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.rows_per_file = rows_per_file
+        self.zstd_level = zstd_level
+        # Partitions ouvertes, la moins récemment écrite en tête : au-delà de
+        # max_open_files, son fichier est fermé mais son lot en cours reste en mémoire ;
+        # un fichier n'est rouvert qu'avec un lot complet (au moins batch_size lignes)
+        self.max_open_files = max_open_files
+        self.stats = stats
+        # Sans partition, une table n'a qu'un fichier ouvert par format
+        self.partitioned = partitioned
+        self.partitions = OrderedDict()
+        self.closed_partitions = {}
+        self.rows = {}
+
+    def write(self, table, row):
+        partition = partition_of(row) if self.partitioned else None
+        for fmt in self.formats:
+            feed = self.partition(table, fmt, partition)
+            feed.buffer.append(row)
+            if len(feed.buffer) >= self.batch_size:
+                feed.flush(self.rows_per_file)
+        self.rows[table] = self.rows.get(table, 0) + 1
+        if self.stats is not None:
+            self.stats.inc_value(f"feeds/rows/{table}")
+
+    def partition(self, table, fmt, partition):
+        key = (table, fmt, partition)
+        feed = self.partitions.get(key)
+        if feed is not None:
+            self.partitions.move_to_end(key)
+            return feed
+
+        directory = os.path.join(self.directory, fmt, table, *filter(None, [partition]))
+        feed = self.closed_partitions.pop(key, None) or PartitionFeed(
+            directory, table, fmt, self.prefix, self.zstd_level
+        )
+        self.partitions[key] = feed
+        while len(self.partitions) > self.max_open_files:
+            old_key, old_feed = self.partitions.popitem(last=False)
+            old_feed.close_file()
+            self.closed_partitions[old_key] = old_feed
+        return feed
+
+    def close(self):
+        """Écrit les lots restants, ferme les fichiers ; retourne les chemins écrits"""
+        files = []
+        for feed in list(self.partitions.values()) + list(self.closed_partitions.values()):
+            feed.flush(self.rows_per_file)
+            feed.close_file()
+            files.extend(feed.files)
+        self.partitions.clear()
+        self.closed_partitions.clear()
+        if self.stats is not None:
+            self.stats.set_value("feeds/files", len(files))
+        return files
+
+
+# ============================
+# EXPORT HORS CRAWL
+# ============================
+
+EXPORT_PROJECTION = {
+    **{name: 1 for name, _ in SCHEMAS["enterprises"]},
+    "moniteur_publications": 1, "moniteur_last_updated": 1, "deposits": 1, "deposits_last_updated": 1, "_id": 0,
+}
+
+
+def export_collection(collection, directory, formats, batch_size=1000, rows_per_file=100_000,
+                      zstd_level=3, query=None):
+    """Exporte la collection `entreprises` ; retourne (lignes par table, fichiers écrits).
+
+    Le curseur ramène `batch_size` documents à la fois et les lignes partent sur disque
+    par lots : la mémoire ne dépend pas de la taille de la collection.
+
+    Pas de partition par date : le curseur suit l'ordre des `_id`, les dates de scraping s'y
+    mélangent et chaque changement de partition au-delà de max_open_files fermerait un
+    fichier (un fichier par ligne ou presque).
+    """
+    writer = FeedWriter(
+        directory, formats, f"export-{datetime.now():%Y%m%d%H%M%S}", batch_size, rows_per_file, zstd_level,
+        partitioned=False,
+    )
+    cursor = collection.find(query or {}, EXPORT_PROJECTION, batch_size=batch_size)
+    try:
+        for doc in cursor:
+            for table, row in document_rows(doc):
+                writer.write(table, row)
+    finally:
+        cursor.close()
+        files = writer.close()
+    return writer.rows, files
@@ -0,0 +1,322 @@
+# kbo_scraper/graph.py
+"""Index de graphe local : entreprises, dirigeants et liens entre entités.
+
+Les fonctions (`functions`, tableau "Fonctions" de la page KBO) et les liens entre
+entités (`entity_links`) sont stockés dans chaque document : "toutes les entreprises
+dont X est administrateur" ou "liens à deux sauts" demanderaient de parcourir la
+collection. Cet index les retourne à partir de tableaux CSR ouverts en mémoire partagée.
+
+Nœuds : entreprises (numéro pointé) et personnes (nom normalisé comme dans search.py :
+deux homonymes sont confondus). Un dirigeant personne morale dont le numéro figure
+dans la fonction est une entreprise. Identifiants denses uint32 attribués à la
+construction (`kinds.npy`, `labels.txt`).
+
+Arêtes orientées depuis l'entreprise du document (c'est sa page qui les décrit), avec
+l'indice du rôle (`roles.txt`) :
+- sortantes : `out_offsets.npy`, `out_targets.npy`, `out_roles.npy` ;
+- entrantes (transposée) : `in_offsets.npy`, `in_sources.npy`, `in_roles.npy`.
+Les voisins d'un nœud sont les deux listes réunies.
+
+Mise à jour : comme pour l'index de recherche (kbo_scraper/deltas.py),
+`GraphIndexPipeline` écrit des deltas et `GraphIndex` les applique en mémoire : les
+arêtes d'une entreprise recrawlée remplacent celles de la base, y compris du côté entrant.
+`rebuild` (run_spiders.py --rebuild-graph-index) réécrit une base propre.
+"""
+import json
+import os
+import re
+from array import array
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+from kbo_scraper.deltas import DeltaIndex, read_current, rebuild_base, write_current
+from kbo_scraper.search import PLACEHOLDERS, normalize_text
+
+ENTERPRISE = 0
+PERSON = 1
+KIND_NAMES = ("enterprise", "person")
+
+# Rôle des arêtes tirées de la rubrique "Liens entre entités"
+LINK_ROLE = "Lien entre entités"
+
+NUMBER_RE = re.compile(r"\b([01]\d{3})\.?(\d{3})\.?(\d{3})\b")
+
+
+# ============================
+# ARÊTES D'UN DOCUMENT
+# ============================
+
+def _numbers_in(text):
+    return [f"{a}.{b}.{c}" for a, b, c in NUMBER_RE.findall(text or "")]
+
+
+def _functions_of(document):
+    functions = document.get("functions")
+    if isinstance(functions, str) or functions is None:
+        # Documents en version 1 du schéma : la chaîne JSON fait foi
+        functions = document.get("functions_json", functions)
+    if isinstance(functions, str):
+        try:
+            functions = json.loads(functions)
+        except json.JSONDecodeError:
+            return []
+    return [entry for entry in functions or [] if isinstance(entry, dict)]
+
+
+def document_edges(document):
+    """[[type de nœud, libellé, rôle]] décrits par un item ou un document Mongo"""
+    edges = []
+    own = document.get("enterprise_number")
+    for entry in _functions_of(document):
+        name = (entry.get("name") or "").strip()
+        if not name or name.lower().startswith(PLACEHOLDERS):
+            continue
+        role = (entry.get("role") or "").strip()
+        numbers = [n for n in _numbers_in(name) if n != own]
+        if numbers:
+            edges.extend([ENTERPRISE, number, role] for number in numbers)
+        else:
+            edges.append([PERSON, name, role])
+    links = document.get("entity_links")
+    if isinstance(links, str):
+        edges.extend([ENTERPRISE, number, LINK_ROLE] for number in dict.fromkeys(_numbers_in(links))
+                     if number != own)
+    return edges
+
+
+def has_edges(document):
+    """Vrai si le document porte les rubriques du graphe (items du spider KBO)"""
+    return any(field in document for field in ("functions", "functions_json", "entity_links"))
+
+
+def node_key(kind, label):
+    return (kind, label if kind == ENTERPRISE else normalize_text(label))
+
+
+# ============================
+# CONSTRUCTION DE LA BASE
+# ============================
+
+class GraphBuilder:
+    """Accumule les arêtes (tableaux compacts) puis écrit les deux CSR triés"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, f"base-{datetime.now():%Y%m%d%H%M%S%f}")
+        self.nodes = {}
+        self.labels = []
+        self.kinds = array("B")
+        self.roles = {}
+        self.sources = array("I")
+        self.targets = array("I")
+        self.edge_roles = array("H")
+
+    def node(self, kind, label):
+        key = node_key(kind, label)
+        node_id = self.nodes.get(key)
+        if node_id is None:
+            node_id = self.nodes[key] = len(self.labels)
+            self.labels.append(label)
+            self.kinds.append(kind)
+        return node_id
+
+    def add(self, enterprise_number, edges):
+        source = self.node(ENTERPRISE, enterprise_number)
+        for kind, label, role in edges:
+            self.sources.append(source)
+            self.targets.append(self.node(kind, label))
+            self.edge_roles.append(self.roles.setdefault(role, len(self.roles)))
+
+    def finish(self):
+        """Écrit la base, la publie (CURRENT) ; retourne (nœuds, arêtes)"""
+        work = self.path + ".tmp"
+        os.makedirs(work, exist_ok=True)
+        sources = np.frombuffer(self.sources, dtype=np.uint32)
+        targets = np.frombuffer(self.targets, dtype=np.uint32)
+        roles = np.frombuffer(self.edge_roles, dtype=np.uint16)
+
+        # Arêtes en double (même fonction listée deux fois, document vu deux fois) retirées
+        order = np.lexsort((roles, targets, sources))
+        sources, targets, roles = sources[order], targets[order], roles[order]
+        keep = np.ones(len(sources), dtype=bool)
+        keep[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1]) | (roles[1:] != roles[:-1])
+        sources, targets, roles = sources[keep], targets[keep], roles[keep]
+
+        count = len(self.labels)
+        # Sortantes : déjà triées par source. Entrantes : tri stable par cible
+        by_target = np.argsort(targets, kind="stable")
+        for prefix, rows, column_name, columns, column_roles in (
+            ("out", sources, "targets", targets, roles),
+            ("in", targets[by_target], "sources", sources[by_target], roles[by_target]),
+        ):
+            offsets = np.zeros(count + 1, dtype=np.uint64)
+            np.cumsum(np.bincount(rows, minlength=count), out=offsets[1:])
+            np.save(os.path.join(work, f"{prefix}_offsets.npy"), offsets)
+            np.save(os.path.join(work, f"{prefix}_{column_name}.npy"), columns)
+            np.save(os.path.join(work, f"{prefix}_roles.npy"), column_roles)
+
+        np.save(os.path.join(work, "kinds.npy"), np.frombuffer(self.kinds, dtype=np.uint8))
+        with open(os.path.join(work, "labels.txt"), "w", encoding="utf-8") as f:
+            f.write("".join(label.replace("\n", " ") + "\n" for label in self.labels))
+        with open(os.path.join(work, "roles.txt"), "w", encoding="utf-8") as f:
+            f.write("".join(role.replace("\n", " ") + "\n" for role in self.roles))
+
+        os.replace(work, self.path)
+        write_current(self.directory, os.path.basename(self.path))
+        return count, len(sources)
+
+
+# ============================
+# LECTURE ET PARCOURS
+# ============================
+
+class GraphIndex(DeltaIndex):
+    def load(self):
+        with self.lock:
+            base = read_current(self.directory)
+            self.base_path = base
+            if base is not None:
+                def load_array(name):
+                    return np.load(os.path.join(base, f"{name}.npy"), mmap_mode="r")
+
+                self.kinds = load_array("kinds")
+                self.out_offsets, self.out_targets, self.out_roles = (
+                    load_array("out_offsets"), load_array("out_targets"), load_array("out_roles"))
+                self.in_offsets, self.in_sources, self.in_roles = (
+                    load_array("in_offsets"), load_array("in_sources"), load_array("in_roles"))
+                with open(os.path.join(base, "labels.txt"), encoding="utf-8") as f:
+                    self.labels = f.read().split("\n")[:-1]
+                with open(os.path.join(base, "roles.txt"), encoding="utf-8") as f:
+                    self.roles = f.read().split("\n")[:-1]
+            else:
+                self.kinds = np.zeros(0, dtype=np.uint8)
+                self.out_offsets = self.in_offsets = np.zeros(1, dtype=np.uint64)
+                self.out_targets = self.in_sources = np.zeros(0, dtype=np.uint32)
+                self.out_roles = self.in_roles = np.zeros(0, dtype=np.uint16)
+                self.labels = []
+                self.roles = []
+            self.base_nodes = len(self.labels)
+            self.kind_list = self.kinds.tolist()
+            self.nodes = {node_key(kind, label): i for i, (kind, label) in enumerate(zip(self.kind_list, self.labels))}
+            self.role_ids = {role: i for i, role in enumerate(self.roles)}
+
+            # Couche en mémoire : arêtes des entreprises recrawlées depuis la base
+            self.overrides = {}            # source -> [(cible, rôle)]
+            self.delta_in = {}             # cible -> {source: rôle}
+            self.loaded_deltas = set()
+            self.refresh()
+
+    @property
+    def size(self):
+        return len(self.labels)
+
+    def apply_delta(self, entry):
+        self.replace(entry["enterprise_number"], entry.get("edges") or [])
+
+    def node(self, kind, label, create=False):
+        key = node_key(kind, label)
+        node_id = self.nodes.get(key)
+        if node_id is None and create:
+            node_id = self.nodes[key] = len(self.labels)
+            self.labels.append(label)
+            self.kind_list.append(kind)
+        return node_id
+
+    def role(self, name):
+        role_id = self.role_ids.get(name)
+        if role_id is None:
+            role_id = self.role_ids[name] = len(self.roles)
+            self.roles.append(name)
+        return role_id
+
+    def replace(self, enterprise_number, edges):
+        """Remplace les arêtes sortantes d'une entreprise"""
+        with self.lock:
+            source = self.node(ENTERPRISE, enterprise_number, create=True)
+            for target, _ in self.overrides.get(source, ()):
+                self.delta_in.get(target, {}).pop(source, None)
+            new = list(dict.fromkeys((self.node(kind, label, create=True), self.role(role))
+                                     for kind, label, role in edges))
+            self.overrides[source] = new
+            for target, role in new:
+                self.delta_in.setdefault(target, {})[source] = role
+
+    def out_edges(self, node_id):
+        """[(cible, rôle)] décrits par la page de l'entreprise `node_id`"""
+        override = self.overrides.get(node_id)
+        if override is not None:
+            return override
+        if node_id >= self.base_nodes:
+            return []
+        start, end = int(self.out_offsets[node_id]), int(self.out_offsets[node_id + 1])
+        return list(zip(self.out_targets[start:end].tolist(), self.out_roles[start:end].tolist()))
+
+    def in_edges(self, node_id):
+        """[(source, rôle)] : entreprises dont la page cite `node_id`"""
+        edges = []
+        if node_id < self.base_nodes:
+            start, end = int(self.in_offsets[node_id]), int(self.in_offsets[node_id + 1])
+            edges = [(source, role) for source, role in zip(self.in_sources[start:end].tolist(),
+                                                            self.in_roles[start:end].tolist())
+                     if source not in self.overrides]
+        delta = self.delta_in.get(node_id)
+        if delta:
+            edges.extend(delta.items())
+        return edges
+
+    def describe(self, node_id):
+        return {"kind": KIND_NAMES[self.kind_list[node_id]], "label": self.labels[node_id]}
+
+    def lookup(self, text):
+        """Nœud d'un numéro d'entreprise ou d'un nom de personne (None si inconnu)"""
+        # Pas de enterprise_numbers.normalize ici : NumPy coûte plus que la requête elle-même
+        match = NUMBER_RE.fullmatch(text.strip().upper().removeprefix("BE").strip())
+        if match:
+            return self.node(ENTERPRISE, ".".join(match.groups()))
+        return self.node(PERSON, text)
+
+    def neighbors(self, text):
+        """Voisins directs avec le rôle et le sens de l'arête"""
+        with self.lock:
+            node_id = self.lookup(text)
+            if node_id is None:
+                return None
+            return [{**self.describe(other), "role": self.roles[role], "direction": direction}
+                    for direction, edges in (("out", self.out_edges(node_id)), ("in", self.in_edges(node_id)))
+                    for other, role in edges]
+
+    def k_hop(self, text, hops=2, kind=None, limit=1000):
+        """Nœuds à au plus `hops` arêtes (sans tenir compte du sens), par distance croissante.
+        `kind` ("enterprise" ou "person") filtre le résultat, pas le parcours"""
+        with self.lock:
+            start = self.lookup(text)
+            if start is None:
+                return None
+            wanted = None if kind is None else KIND_NAMES.index(kind)
+            distances = {start: 0}
+            queue = deque([start])
+            results = []
+            while queue and len(results) < limit:
+                node_id = queue.popleft()
+                depth = distances[node_id]
+                if depth == hops:
+                    continue
+                for other, _ in self.out_edges(node_id) + self.in_edges(node_id):
+                    if other in distances:
+                        continue
+                    distances[other] = depth + 1
+                    queue.append(other)
+                    if wanted is None or self.kind_list[other] == wanted:
+                        results.append({**self.describe(other), "distance": depth + 1})
+                        if len(results) >= limit:
+                            break
+            return results
+
+
+def rebuild(collection, directory, batch_size=1000):
+    """Reconstruit la base depuis la collection `entreprises` (curseur par lots) ; les deltas
+    antérieurs sont couverts par la collection et supprimés. Retourne (nœuds, arêtes)"""
+    projection = {"enterprise_number": 1, "functions": 1, "functions_json": 1, "entity_links": 1, "_id": 0}
+    return rebuild_base(collection, directory, GraphBuilder(directory), projection, document_edges, batch_size)
@@ -0,0 +1,100 @@
+# kbo_scraper/indexes.py
+"""Index déclarés sur la collection `entreprises`.
+
+Le pipeline Mongo et `run_spiders.py` appellent `ensure_indexes` au démarrage :
+la création est idempotente, donc rien ne se passe si les index existent déjà. Sans
+l'index unique (doublons déjà présents), le crawl et le diagnostic s'arrêtent.
+"""
+import logging
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from kbo_scraper.opendata import KBO_PAGE_PENDING
+from kbo_scraper.priority import TIMESTAMP_FIELDS, refresh_index
+
+logger = logging.getLogger(__name__)
+
+ENTREPRISES_COLLECTION = "entreprises"
+
+ENTREPRISES_INDEXES = [
+    # Filtre de chaque upsert et des requêtes couvertes du runner
+    IndexModel([("enterprise_number", ASCENDING)], name="enterprise_number_unique", unique=True),
+    # Classement des entreprises à rafraîchir, par spider : tri sur la date du dernier
+    # passage et champs du score, sans lire les documents (priority.py). Remplacent les
+    # index simples `last_scraped` / `moniteur_last_updated`, dont ils commencent par la clé
+    *(IndexModel(keys, name=name) for name, keys in
+      (refresh_index(field) for field in dict.fromkeys(TIMESTAMP_FIELDS.values()))),
+    # Index multiclé sur les tableaux natifs du schéma v2 ("toutes les entreprises avec le code NACE X")
+    IndexModel([("nace_codes.code", ASCENDING)], name="nace_codes_code"),
+    IndexModel([("schema_version", ASCENDING)], name="schema_version"),
+    # Entreprises de l'open data encore à compléter : seules celles qui portent l'indicateur
+    # sont indexées (creux), le runner les lit sans parcourir la collection
+    IndexModel([(KBO_PAGE_PENDING, ASCENDING)], name=KBO_PAGE_PENDING, sparse=True),
+    # Requêtes par plage sur les valeurs typées du schéma v3 : égalité sur le statut d'abord,
+    # puis la plage ("actives fondées avant 1970", "actives au capital > 1 M EUR")
+    IndexModel([("status", ASCENDING), ("start_date", ASCENDING)], name="status_start_date"),
+    IndexModel([("status", ASCENDING), ("financial_data.capital.amount", ASCENDING)], name="status_capital"),
+]
+
+# Requête utilisée par le runner pour lister les numéros : `$gt: ""` ne retient que les
+# chaînes non vides, ce qui permet à MongoDB de répondre depuis l'index seul
+# (contrairement à `$exists/$ne: None`, qui oblige à relire les documents).
+ENTERPRISE_NUMBERS_QUERY = {"enterprise_number": {"$gt": ""}}
+ENTERPRISE_NUMBERS_PROJECTION = {"enterprise_number": 1, "_id": 0}
+ENTERPRISE_NUMBERS_HINT = "enterprise_number_unique"
+
+
+class IndexCreationError(Exception):
+    """Un index unique n'a pas pu être créé : les upserts par clé ne sont plus garantis"""
+
+
+def ensure_indexes(collection, indexes=ENTREPRISES_INDEXES):
+    """Crée les index manquants et retourne la liste des noms créés ou existants.
+
+    Chaque index est créé par sa propre commande : un échec n'empêche pas les autres.
+    Un index unique impossible à créer (doublons existants) lève IndexCreationError une
+    fois les autres créés ; l'échec d'un index non unique est seulement journalisé.
+    """
+    names = []
+    failed_unique = None
+    for index in indexes:
+        try:
+            names += collection.create_indexes([index])
+        except OperationFailure as e:
+            spec = index.document
+            if spec.get("unique"):
+                failed_unique = failed_unique or (spec, e)
+            else:
+                logger.error(f"Impossible de créer l'index {spec['name']} sur {collection.name}: {e}")
+    if failed_unique:
+        spec, e = failed_unique
+        raise IndexCreationError(
+            f"Index unique {spec['name']} impossible sur {collection.name} "
+            f"({e.details.get('errmsg', e) if e.details else e}) : supprimer les doublons de "
+            f"{', '.join(spec['key'])} avant de relancer"
+        ) from e
+    return names
+
+
+def describe_plan(explain):
+    """Résume un résultat d'`explain()` : enchaînement des étapes et documents lus."""
+    plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+    # Depuis MongoDB 7, le plan classique est imbriqué sous `queryPlan`
+    plan = plan.get("queryPlan", plan)
+
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage = f"{stage}({plan['indexName']})"
+        stages.append(stage)
+        plan = plan.get("inputStage")
+
+    stats = explain.get("executionStats", {})
+    return {
+        "stages": " <- ".join(stages),
+        "covered": "FETCH" not in stages and "COLLSCAN" not in stages,
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+    }
@@ -0,0 +1,127 @@
+# kbo_scraper/instrumentation.py
+"""Points d'instrumentation des callbacks, extracteurs et pipelines.
+
+Les méthodes ciblées ne sont enveloppées qu'à partir du moment où un observateur
+est attaché (métriques, profilage...). Sans observateur, les classes restent
+intactes : l'instrumentation ne coûte rien tant qu'elle n'est pas activée.
+
+Un observateur implémente `on_enter(stage, label)` et `on_exit(stage, label, elapsed)`.
+Pour les callbacks générateurs, chaque pas d'itération est mesuré séparément afin
+de ne compter que le temps passé dans le callback lui-même.
+"""
+import fnmatch
+import functools
+import importlib
+import inspect
+import time
+
+HOOK_TARGETS = {
+    "parse": (
+        "kbo_scraper.spiders.kbo_spider:KboSpider.parse",
+        "kbo_scraper.spiders.ejustice_spider:EjusticeSpider.parse_list",
+        "kbo_scraper.spiders.consult_spider:ConsultSpider.parse_api",
+    ),
+    "extract": (
+        "kbo_scraper.extractors:extract_*",
+    ),
+    "pipeline": (
+        "kbo_scraper.pipelines:ValidationPipeline.process_item",
+        "kbo_scraper.pipelines:PublicationDeduplicationPipeline.process_item",
+        "kbo_scraper.pipelines:MongoPipeline.process_item",
+    ),
+}
+
+_observers = []
+_originals = {}  # (classe ou module, attribut) -> fonction d'origine
+
+
+def attach(observer):
+    """Ajoute un observateur ; le premier installe les enveloppes."""
+    if not _observers:
+        install()
+    _observers.append(observer)
+
+
+def detach(observer):
+    """Retire un observateur ; le dernier restaure les méthodes d'origine."""
+    if observer in _observers:
+        _observers.remove(observer)
+    if not _observers:
+        uninstall()
+
+
+def resolve_targets(targets=HOOK_TARGETS):
+    """Développe les cibles "module:Classe.motif" ou "module:motif" en (stage, propriétaire, attribut)."""
+    for stage, specs in targets.items():
+        for spec in specs:
+            module_name, _, path = spec.partition(":")
+            owner = importlib.import_module(module_name)
+            class_name, dot, pattern = path.partition(".")
+            if dot:
+                owner = getattr(owner, class_name)
+            else:
+                pattern = class_name
+            for attr in sorted(vars(owner)):
+                value = vars(owner)[attr]
+                if fnmatch.fnmatchcase(attr, pattern) and callable(value) and not inspect.isclass(value):
+                    yield stage, owner, attr
+
+
+def install(targets=HOOK_TARGETS):
+    for stage, owner, attr in resolve_targets(targets):
+        if (owner, attr) in _originals:
+            continue
+        original = vars(owner)[attr]
+        _originals[(owner, attr)] = original
+        # Fonctions de module : étiquette "extractors.extract_x" plutôt que le chemin complet
+        label = f"{owner.__name__.rsplit('.', 1)[-1]}.{attr}"
+        setattr(owner, attr, _wrap(stage, label, original))
+
+
+def uninstall():
+    while _originals:
+        (owner, attr), original = _originals.popitem()
+        setattr(owner, attr, original)
+
+
+def _enter(stage, label):
+    for observer in _observers:
+        observer.on_enter(stage, label)
+
+
+def _exit(stage, label, elapsed):
+    for observer in _observers:
+        observer.on_exit(stage, label, elapsed)
+
+
+def _wrap(stage, label, func):
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            generator = func(*args, **kwargs)
+            while True:
+                _enter(stage, label)
+                start = time.perf_counter()
+                try:
+                    value = next(generator)
+                except StopIteration:
+                    _exit(stage, label, time.perf_counter() - start)
+                    return
+                except BaseException:
+                    _exit(stage, label, time.perf_counter() - start)
+                    raise
+                _exit(stage, label, time.perf_counter() - start)
+                yield value
+
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _enter(stage, label)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _exit(stage, label, time.perf_counter() - start)
+
+    return wrapper
@@ -1,5 +1,11 @@
 # items.py - Version mise à jour
+import dataclasses
+from dataclasses import dataclass
+from typing import Any, Optional
+
 import scrapy
+from itemadapter import ItemAdapter
+from itemadapter.adapter import DataclassAdapter
 
 
 class KboScraperItem(scrapy.Item):
@@ -29,9 +35,8 @@ class KboScraperItem(scrapy.Item):
     tva_activity_2025 = scrapy.Field()
     onss_activity_2025 = scrapy.Field()
 
+    # Sous-documents natifs (voir kbo_scraper/schema.py)
     functions = scrapy.Field()
-    functions_json = scrapy.Field()
-    qualities_json = scrapy.Field()
     nace_codes = scrapy.Field()
     external_links = scrapy.Field()
     entity_links = scrapy.Field()
@@ -43,7 +48,6 @@ class KboScraperItem(scrapy.Item):
 
 
     entrepreneurial_capacities = scrapy.Field()
-    entrepreneurial_capacities_json = scrapy.Field()
 
     authorizations = scrapy.Field()
     belac_details = scrapy.Field()
@@ -52,6 +56,8 @@ class KboScraperItem(scrapy.Item):
     deposits = scrapy.Field()  # <- nouveau champ
     url = scrapy.Field()          # <- ajouter ce champ
     data = scrapy.Field()         # <- ajouter ce champ
+
+    schema_version = scrapy.Field()
 class MoniteurPublicationItem(scrapy.Item):
     """Item spécifique pour une publication du Moniteur Belge"""
     enterprise_number = scrapy.Field()
@@ -78,4 +84,108 @@ class ConsultItem(scrapy.Item):
     last_update = scrapy.Field()
     deposits = scrapy.Field()
     url = scrapy.Field()
-    data = scrapy.Field()
\ No newline at end of file
+    data = scrapy.Field()
+
+
+# ============================
+# ITEMS COMPACTS (__slots__)
+# ============================
+# Mêmes champs que les items ci-dessus, mais sans dictionnaire par instance :
+# ce sont ces classes que les spiders produisent. ItemAdapter les gère avec
+# RecordAdapter (plus bas).
+
+class Record:
+    """Base des items compacts"""
+    __slots__ = ()
+
+    def to_document(self):
+        """Document Mongo des seuls champs renseignés, sans copier les valeurs"""
+        return {name: value for name in self.__slots__ if (value := getattr(self, name)) is not None}
+
+
+class RecordAdapter(DataclassAdapter):
+    """Adaptateur des items compacts : `DataclassAdapter` relit `dataclasses.fields()` à
+    chaque ItemAdapter (un par pipeline et par item), ici les champs sont lus une fois par classe"""
+    _class_fields = {}
+
+    def __init__(self, item):
+        self.item = item
+        fields_dict = self._class_fields.get(type(item))
+        if fields_dict is None:
+            fields_dict = {field.name: field for field in dataclasses.fields(item)}
+            self._class_fields[type(item)] = fields_dict
+        self._fields_dict = fields_dict
+
+    @classmethod
+    def is_item(cls, item):
+        return isinstance(item, Record)
+
+    @classmethod
+    def is_item_class(cls, item_class):
+        return isinstance(item_class, type) and issubclass(item_class, Record)
+
+
+# Avant ScrapyItemAdapter et DataclassAdapter : premier adaptateur essayé
+ItemAdapter.ADAPTER_CLASSES.appendleft(RecordAdapter)
+
+
+@dataclass(slots=True)
+class EnterpriseRecord(Record):
+    """Fiche entreprise du spider KBO"""
+    enterprise_number: Optional[str] = None
+    status: Optional[str] = None
+    juridical_situation: Optional[str] = None
+    start_date: Any = None
+
+    company_name: Optional[str] = None
+    abbreviation: Optional[str] = None
+    headquarters_address: Optional[str] = None
+
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    website: Optional[str] = None
+
+    entity_type: Optional[str] = None
+    legal_form: Optional[str] = None
+    establishment_units: Optional[int] = None
+
+    qualities: Optional[list] = None
+    tva_activity_2025: Optional[str] = None
+    onss_activity_2025: Optional[str] = None
+
+    functions: Optional[list] = None
+    nace_codes: Optional[list] = None
+    external_links: Optional[list] = None
+    entity_links: Optional[str] = None
+    financial_data: Optional[dict] = None
+
+    entrepreneurial_capacities: Optional[list] = None
+    authorizations: Optional[list] = None
+    belac_details: Any = None
+
+    schema_version: Optional[int] = None
+
+
+@dataclass(slots=True)
+class PublicationRecord(Record):
+    """Publications Moniteur Belge d'une entreprise (spider ejustice)"""
+    enterprise_number: Optional[str] = None
+    moniteur_publications: Optional[str] = None
+
+
+@dataclass(slots=True)
+class PublicationContentRecord(Record):
+    """Texte du PDF d'une publication Moniteur Belge (spider ejustice, MONITEUR_PDF_DIR)"""
+    enterprise_number: Optional[str] = None
+    pdf_url: Optional[str] = None
+    publication_key: Optional[str] = None
+    full_content: Optional[str] = None
+
+
+@dataclass(slots=True)
+class ConsultRecord(Record):
+    """Dépôts de comptes annuels d'une entreprise (spider consult)"""
+    enterprise_number: Optional[str] = None
+    url: Optional[str] = None
+    deposits: Optional[list] = None
+    data: Any = None
@@ -3,8 +3,17 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+from collections import deque
+
 from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.defer import maybe_deferred_to_future
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet import defer
+from twisted.internet.defer import Deferred, succeed
+from twisted.protocols.basic import LineReceiver
 import random
+import time
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
@@ -165,4 +174,164 @@ class CaptchaDetectionMiddleware:
                 spider.logger.error("Arrêt du spider pour éviter le blocage")
                 spider.crawler.engine.close_spider(spider, 'captcha_detected')
 
-        return response
\ No newline at end of file
+        return response
+
+
+# 🆕 Débit par hôte partagé entre les workers d'un même spider
+class RateLimitProtocol(LineReceiver):
+    """Connexion au coordinateur de débit (kbo_scraper/ratelimit.py) : une ligne `<hôte>`
+    par demande, les réponses `<délai>` arrivent dans l'ordre des demandes"""
+    delimiter = b"\n"
+
+    def __init__(self, client):
+        self.client = client
+        self.pending = deque()
+
+    def reserve(self, host):
+        waiting = Deferred()
+        self.pending.append(waiting)
+        self.sendLine(host.encode("ascii"))
+        return waiting
+
+    def lineReceived(self, line):
+        if not self.pending:
+            return
+        waiting = self.pending.popleft()
+        try:
+            delay = float(line)
+        except ValueError:
+            waiting.errback(OSError("Réponse invalide du coordinateur de débit"))
+        else:
+            waiting.callback(delay)
+
+    def connectionLost(self, reason=None):
+        self.client.disconnected(self)
+        pending, self.pending = self.pending, deque()
+        for waiting in pending:
+            waiting.errback(OSError("Coordinateur de débit déconnecté"))
+
+
+class RateLimitClient:
+    """Client du coordinateur de débit : `reserve` retourne un Deferred, le réacteur
+    continue de servir les autres requêtes pendant l'échange."""
+
+    def __init__(self, address, timeout=2.0):
+        host, _, port = address.rpartition(":")
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.protocol = None
+        # Demandes en attente de la connexion en cours
+        self.connecting = []
+
+    def reserve(self, host):
+        """Deferred du délai à attendre avant de contacter `host` ; échoue avec OSError si le
+        coordinateur ne répond pas dans les `timeout` secondes"""
+        from twisted.internet import reactor
+
+        waiting = self.connect()
+        waiting.addCallback(lambda protocol: protocol.reserve(host))
+        waiting.addTimeout(self.timeout, reactor)
+        waiting.addErrback(self.failed)
+        return waiting
+
+    def connect(self):
+        if self.protocol is not None:
+            return succeed(self.protocol)
+        waiting = Deferred()
+        self.connecting.append(waiting)
+        if len(self.connecting) == 1:
+            from twisted.internet import reactor
+            from twisted.internet.endpoints import TCP4ClientEndpoint, connectProtocol
+
+            endpoint = TCP4ClientEndpoint(reactor, self.host, self.port, timeout=self.timeout)
+            connectProtocol(endpoint, RateLimitProtocol(self)).addCallbacks(self.connected, self.connection_failed)
+        return waiting
+
+    def connected(self, protocol):
+        protocol.transport.setTcpNoDelay(True)
+        self.protocol = protocol
+        waiting, self.connecting = self.connecting, []
+        for d in waiting:
+            d.callback(protocol)
+
+    def connection_failed(self, failure):
+        waiting, self.connecting = self.connecting, []
+        for d in waiting:
+            d.errback(failure)
+
+    def disconnected(self, protocol):
+        if self.protocol is protocol:
+            self.protocol = None
+
+    def failed(self, failure):
+        # Réponse en retard : la connexion est abandonnée, sinon cette réponse serait
+        # attribuée à la demande suivante
+        self.close()
+        if failure.check(defer.TimeoutError):
+            raise OSError(f"Coordinateur de débit sans réponse après {self.timeout}s")
+        raise OSError(f"Coordinateur de débit injoignable ({failure.getErrorMessage()})")
+
+    def close(self):
+        if self.protocol is not None:
+            self.protocol.transport.loseConnection()
+        self.protocol = None
+
+
+class CoordinatedRateLimitMiddleware:
+    """Attend le créneau attribué par le coordinateur de débit avant chaque téléchargement.
+
+    Actif seulement si RATE_COORDINATOR ("hôte:port") est défini, ce que fait
+    `run_spiders.py --workers N`. Placé après HttpCacheMiddleware : les réponses servies
+    par le cache ne consomment pas de créneau. Si le coordinateur ne répond plus, le
+    worker se limite localement à un créneau toutes les RATE_LIMIT_FALLBACK_DELAY secondes.
+    """
+
+    def __init__(self, client, fallback_delay, stats):
+        self.client = client
+        self.fallback_delay = fallback_delay
+        self.stats = stats
+        self.local_slots = {}
+        self.coordinator_lost = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        address = crawler.settings.get('RATE_COORDINATOR')
+        if not address:
+            raise NotConfigured
+
+        mw = cls(
+            RateLimitClient(address),
+            fallback_delay=crawler.settings.getfloat('RATE_LIMIT_FALLBACK_DELAY', 2.0),
+            stats=crawler.stats,
+        )
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    async def process_request(self, request, spider):
+        host = urlparse_cached(request).hostname or ''
+        try:
+            delay = await maybe_deferred_to_future(self.client.reserve(host))
+        except OSError as e:
+            if not self.coordinator_lost:
+                spider.logger.warning(f"{e} - limitation locale à 1 requête / {self.fallback_delay}s par hôte")
+                self.coordinator_lost = True
+            delay = self.reserve_locally(host)
+
+        if delay <= 0:
+            return None
+        self.stats.inc_value('ratelimit/delayed')
+        self.stats.inc_value('ratelimit/wait_seconds', delay)
+
+        from twisted.internet import reactor, task
+        await maybe_deferred_to_future(task.deferLater(reactor, delay, lambda: None))
+        return None
+
+    def reserve_locally(self, host):
+        now = time.monotonic()
+        slot = max(now, self.local_slots.get(host, now))
+        self.local_slots[host] = slot + self.fallback_delay
+        return slot - now
+
+    def spider_closed(self, spider):
+        self.client.close()
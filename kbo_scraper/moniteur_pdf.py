@@ -0,0 +1,235 @@
+# kbo_scraper/moniteur_pdf.py
+"""Téléchargement des PDF du Moniteur Belge et extraction de leur texte (`full_content`).
+
+La liste ejustice donne un `pdf_url` par publication. Avec MONITEUR_PDF_DIR,
+`MoniteurPdfExtension` donne au spider ejustice un `PdfExtractor` : après l'item des
+publications d'une entreprise, le spider demande les PDF pas encore traités, les
+range dans le dépôt puis envoie l'extraction du texte à un pool de processus
+(MONITEUR_PDF_WORKERS), hors du réacteur. Chaque texte extrait part dans un item
+`PublicationContentRecord`, écrit par `MongoPipeline` dans la collection
+`moniteur_contents` sous la clé de la publication (`publication_key`), avec les numéros
+des entreprises qui la citent : la liste `moniteur_publications` des entreprises ne
+contient pas les textes.
+
+Une publication est sautée quand `moniteur_contents` a son texte pour cette entreprise
+(une requête `$in` par liste). Si seul le dépôt l'a (item perdu avant le pipeline, crawl
+interrompu, dépôt réutilisé avec une autre base), l'item est renvoyé depuis le texte du
+dépôt, sans nouveau téléchargement.
+
+Dépôt (dossier MONITEUR_PDF_DIR), adressé par contenu : une publication du Moniteur ne
+change plus une fois parue, elle n'est donc téléchargée et lue qu'une fois.
+- `objects/<sha256[:2]>/<sha256>.pdf` : PDF tels que téléchargés ;
+- `texts/<sha256[:2]>/<sha256>.txt` : texte extrait (un même PDF cité sous deux
+  références n'est lu qu'une fois) ;
+- `refs/<année>/<clé>.json` : clé de publication (date + référence) -> empreinte du PDF,
+  pages, caractères. Une clé présente est déjà traitée : plus de requête.
+
+Extraction sans OCR (pypdf, dépendance optionnelle) : couche texte des pages, espaces
+normalisés, mots coupés en fin de ligne recollés. Un PDF scanné, sans couche texte,
+est enregistré avec un texte vide (stat `moniteur_pdf/no_text`).
+"""
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+from scrapy.utils.defer import maybe_deferred_to_future
+
+PDF_MODULE = "pypdf"
+
+MONITEUR_CONTENTS_COLLECTION = "moniteur_contents"
+
+KEY_UNSAFE_RE = re.compile(r"[^0-9A-Za-z_.-]+")
+HYPHENATED_RE = re.compile(r"(\w)-\n(\w)")
+SPACES_RE = re.compile(r"[ \t\f\v ]+")
+BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def missing_dependency():
+    """Nom du module d'extraction s'il est absent, sinon None"""
+    return PDF_MODULE if importlib.util.find_spec(PDF_MODULE) is None else None
+
+
+def publication_key(publication):
+    """Clé stable d'une publication (date + référence), ou None sans référence"""
+    reference = (publication.get("publication_ref") or publication.get("publication_number")
+                 or publication.get("publication_code"))
+    if not reference:
+        return None
+    date = publication.get("publication_date")
+    key = f"{date}-{reference}" if date else str(reference)
+    return KEY_UNSAFE_RE.sub("_", key)
+
+
+# ============================
+# EXTRACTION (PROCESSUS DU POOL)
+# ============================
+
+def clean_pdf_text(pages):
+    text = "\n\n".join(page for page in pages if page)
+    text = HYPHENATED_RE.sub(r"\1\2", text)
+    lines = [SPACES_RE.sub(" ", line).strip() for line in text.split("\n")]
+    return BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+
+def extract_pdf_text(path):
+    """Texte d'un PDF du dépôt : {"text", "pages", "seconds"}. Exécuté dans le pool : le
+    chemin plutôt que les octets, pour ne pas copier le PDF entre processus"""
+    from pypdf import PdfReader
+
+    start = time.perf_counter()
+    reader = PdfReader(path)
+    pages = []
+    for page in reader.pages:
+        try:
+            pages.append(page.extract_text() or "")
+        except Exception:
+            # Une page illisible (police sans table d'encodage) ne fait pas perdre les autres
+            pages.append("")
+    return {"text": clean_pdf_text(pages), "pages": len(reader.pages), "seconds": time.perf_counter() - start}
+
+
+# ============================
+# DÉPÔT
+# ============================
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class PdfStore:
+    """PDF et textes adressés par leur empreinte, index des publications déjà traitées"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def object_path(self, digest):
+        return os.path.join(self.directory, "objects", digest[:2], f"{digest}.pdf")
+
+    def text_path(self, digest):
+        return os.path.join(self.directory, "texts", digest[:2], f"{digest}.txt")
+
+    def ref_path(self, key):
+        return os.path.join(self.directory, "refs", key[:4], f"{key}.json")
+
+    def lookup(self, key):
+        """Entrée d'une publication traitée, ou None"""
+        try:
+            with open(self.ref_path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def text(self, key):
+        entry = self.lookup(key)
+        if entry is None:
+            return None
+        with open(self.text_path(entry["sha256"]), encoding="utf-8") as f:
+            return f.read()
+
+    def put_pdf(self, body):
+        """Range le PDF (une seule copie par contenu) ; retourne son empreinte"""
+        digest = hashlib.sha256(body).hexdigest()
+        if not os.path.exists(self.object_path(digest)):
+            _write_atomic(self.object_path(digest), body)
+        return digest
+
+    def put_text(self, digest, text):
+        _write_atomic(self.text_path(digest), text.encode("utf-8"))
+
+    def record(self, key, digest, url, size, pages, chars):
+        """Marque la publication comme traitée (écrit en dernier : texte déjà en place)"""
+        entry = {"sha256": digest, "pdf_url": url, "size": size, "pages": pages, "chars": chars,
+                 "processed_at": datetime.now().isoformat()}
+        _write_atomic(self.ref_path(key), json.dumps(entry).encode("utf-8"))
+        return entry
+
+
+class PdfExtractor:
+    """Dépôt + pool d'extraction, avec les stats de débit et de file d'attente"""
+
+    def __init__(self, store, pool, stats=None, contents=None):
+        self.store = store
+        self.pool = pool
+        self.stats = stats
+        # Collection moniteur_contents : ce qui compte comme traité (le dépôt seul ne suffit pas)
+        self.contents = contents
+        self.queued = 0
+        # Publications demandées et pas encore extraites : clé -> numéros d'entreprise
+        self.pending = {}
+
+    def inc(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(f"moniteur_pdf/{key}", count)
+
+    def written_keys(self, enterprise_number, keys):
+        """Clés parmi `keys` dont le texte est déjà dans moniteur_contents pour cette entreprise"""
+        if self.contents is None or not keys:
+            return set()
+        cursor = self.contents.find({"_id": {"$in": list(keys)}, "enterprise_numbers": enterprise_number},
+                                    {"_id": 1})
+        return {doc["_id"] for doc in cursor}
+
+    def stored_text(self, key):
+        """Texte déjà extrait dans le dépôt (à réécrire dans Mongo), sinon None"""
+        try:
+            text = self.store.text(key)
+        except FileNotFoundError:
+            # Référence sans fichier texte : le PDF est redemandé
+            return None
+        if text is not None:
+            self.inc("restored")
+        return text
+
+    def wanted(self, key, enterprise_number):
+        """Vrai s'il faut demander le PDF, faux s'il est déjà demandé pour une autre entreprise"""
+        if key in self.pending:
+            self.pending[key].append(enterprise_number)
+            return False
+        self.pending[key] = [enterprise_number]
+        return True
+
+    def release(self, key):
+        """Numéros d'entreprise qui attendaient cette publication"""
+        return self.pending.pop(key, [])
+
+    async def process(self, key, body, url):
+        """Range le PDF, extrait son texte dans le pool ; retourne le texte"""
+        digest = self.store.put_pdf(body)
+        self.inc("downloaded")
+        self.inc("bytes", len(body))
+        if os.path.exists(self.store.text_path(digest)):
+            # Même PDF sous une autre référence : déjà lu
+            with open(self.store.text_path(digest), encoding="utf-8") as f:
+                text = f.read()
+            self.store.record(key, digest, url, len(body), None, len(text))
+            self.inc("deduplicated")
+            return text
+
+        self.queued += 1
+        if self.stats is not None:
+            self.stats.max_value("moniteur_pdf/max_queue_depth", self.queued)
+        try:
+            result = await maybe_deferred_to_future(self.pool.submit(extract_pdf_text, self.store.object_path(digest)))
+        finally:
+            self.queued -= 1
+
+        self.store.put_text(digest, result["text"])
+        self.store.record(key, digest, url, len(body), result["pages"], len(result["text"]))
+        self.inc("extracted")
+        self.inc("pages", result["pages"])
+        if not result["text"]:
+            self.inc("no_text")
+        if self.stats is not None:
+            self.stats.inc_value("moniteur_pdf/extract_seconds", result["seconds"])
+        return result["text"]
+
+    def shutdown(self):
+        self.pool.shutdown()
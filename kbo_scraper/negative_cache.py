@@ -0,0 +1,117 @@
+# kbo_scraper/negative_cache.py
+"""Cache des résultats vides (aucune publication au Moniteur, aucun dépôt à la BNB).
+
+Un résultat vide ne produit pas d'item (ou un item que la validation écarte) : rien ne
+garde donc la trace de la vérification, et chaque exécution redemande la même page.
+La collection `negative_cache` enregistre, par (spider, numéro d'entreprise), le dernier
+résultat vide et la date du prochain contrôle. L'intervalle double à chaque nouveau
+résultat vide consécutif (NEGATIVE_CACHE_BASE_DAYS, 2x, 4x... plafonné à
+NEGATIVE_CACHE_MAX_DAYS) ; un résultat non vide supprime l'entrée.
+
+Les spiders qui déclarent un attribut `negative_cache` reçoivent un `NegativeCache`
+de `NegativeCacheExtension` et sautent les numéros dont le prochain contrôle n'est pas
+encore dû : `filter_due` les cherche par lots parmi les numéros de l'exécution, au fil
+des requêtes, sans charger toutes les entrées du spider. Les numéros qui ont une entrée,
+due ou non, sont retenus (`known`) : un résultat non vide n'envoie de suppression que
+pour eux.
+"""
+import itertools
+import random
+from datetime import datetime
+
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+
+NEGATIVE_CACHE_COLLECTION = "negative_cache"
+
+NEGATIVE_CACHE_INDEXES = [
+    # Mises à jour et recherche par lots (`$in`) des numéros d'une exécution
+    IndexModel([("spider", ASCENDING), ("enterprise_number", ASCENDING)],
+               name="spider_enterprise_number_unique", unique=True),
+]
+
+
+class NegativeCache:
+    def __init__(self, collection, base_delay, max_delay, jitter=0.1, stats=None):
+        self.collection = collection
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Étale les contrôles d'un même lot sur quelques jours au lieu d'un seul passage
+        self.jitter = jitter
+        self.stats = stats
+        # (spider, numéro) ayant une entrée : lus par `suppressed`, écrits par `record_empty`
+        self.known = set()
+
+    def suppressed(self, spider_name, numbers, now=None):
+        """Parmi `numbers` (un lot), ceux à ne pas redemander : résultat vide et prochain
+        contrôle pas encore dû. Les numéros du lot qui ont une entrée rejoignent `known`"""
+        now = now or datetime.now()
+        cursor = self.collection.find(
+            {"spider": spider_name, "enterprise_number": {"$in": list(numbers)}},
+            {"enterprise_number": 1, "next_check": 1, "_id": 0},
+        ).hint("spider_enterprise_number_unique")
+        skipped = set()
+        for doc in cursor:
+            self.known.add((spider_name, doc["enterprise_number"]))
+            if doc["next_check"] > now:
+                skipped.add(doc["enterprise_number"])
+        return skipped
+
+    def filter_due(self, spider_name, rows, batch_size=1000):
+        """Lignes `(numéro, ...)` de `rows` dont le contrôle est dû, dans l'ordre, une requête
+        par lot de `batch_size` numéros"""
+        rows = iter(rows)
+        while batch := list(itertools.islice(rows, batch_size)):
+            skipped = self.suppressed(spider_name, [row[0] for row in batch])
+            for row in batch:
+                if row[0] in skipped:
+                    if self.stats is not None:
+                        self.stats.inc_value("negative_cache/skipped")
+                    continue
+                yield row
+
+    def record_empty(self, spider_name, enterprise_number, reason, now=None):
+        """Un seul aller-retour : le compteur et la date du prochain contrôle sont calculés
+        par le serveur (mise à jour par pipeline, MongoDB 4.2+)"""
+        now = now or datetime.now()
+        # Intervalle après n résultats vides consécutifs : base x 2^(n-1), plafonné, moins le jitter
+        factor = 1 - random.uniform(0, self.jitter)
+        base_ms = self.base_delay.total_seconds() * 1000
+        max_ms = self.max_delay.total_seconds() * 1000
+        entry = self.collection.find_one_and_update(
+            {"spider": spider_name, "enterprise_number": enterprise_number},
+            [
+                {"$set": {
+                    "empty_count": {"$add": [{"$ifNull": ["$empty_count", 0]}, 1]},
+                    "last_checked": now,
+                    "reason": reason,
+                    "first_empty": {"$ifNull": ["$first_empty", now]},
+                }},
+                {"$set": {"next_check": {"$add": [now, {"$multiply": [factor, {"$min": [
+                    max_ms, {"$multiply": [base_ms, {"$pow": [2, {"$subtract": ["$empty_count", 1]}]}]},
+                ]}]}]}}},
+            ],
+            projection={"next_check": 1, "_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self.known.add((spider_name, enterprise_number))
+        if self.stats is not None:
+            self.stats.inc_value("negative_cache/recorded")
+        return entry["next_check"]
+
+    def clear(self, spider_name, enterprise_number):
+        """Supprime l'entrée du numéro, sans aller-retour s'il n'en a pas (`known`)"""
+        if (spider_name, enterprise_number) not in self.known:
+            return
+        self.known.discard((spider_name, enterprise_number))
+        result = self.collection.delete_one({"spider": spider_name, "enterprise_number": enterprise_number})
+        if result.deleted_count and self.stats is not None:
+            self.stats.inc_value("negative_cache/cleared")
+
+    def record(self, spider_name, enterprise_number, found, reason="empty"):
+        """Résultat d'un contrôle : vide -> prochain contrôle repoussé, sinon entrée supprimée"""
+        if found:
+            self.clear(spider_name, enterprise_number)
+        else:
+            self.record_empty(spider_name, enterprise_number, reason)
+
@@ -0,0 +1,226 @@
+# kbo_scraper/normalize.py
+"""Valeurs typées des fiches entreprise : dates, montants et valeurs absentes.
+
+La page KBO affiche tout en texte : "9 août 1960", "Depuis le 1 janvier 2022",
+"1.978.935,00 EUR", et des libellés à la place des valeurs absentes ("Not found",
+"Pas de données reprises dans la BCE."). Depuis le schéma v3, les documents stockent :
+- des dates typées (datetime BSON), comparables et indexables ;
+- les montants en `{"amount": Decimal, "currency": "EUR"}` ; `type_registry()` les fait
+  écrire en Decimal128 par pymongo ;
+- None à la place des libellés d'absence ;
+- le nombre d'unités d'établissement en entier.
+
+`normalize_enterprise` est appliquée par les extracteurs (spiders), par
+`ValidationPipeline`, par l'import open data et par la migration de schéma : elle est
+idempotente. Les mêmes textes reviennent d'une fiche à l'autre (dates de début,
+capitaux ronds, "Depuis le 1 janvier 2022"), d'où les parseurs en cache.
+"""
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+FRENCH_MONTHS = {
+    "janvier": 1, "février": 2, "fevrier": 2, "mars": 3, "avril": 4, "mai": 5, "juin": 6,
+    "juillet": 7, "août": 8, "aout": 8, "septembre": 9, "octobre": 10, "novembre": 11,
+    "décembre": 12, "decembre": 12,
+}
+
+TEXT_DATE_RE = re.compile(r'(\d{1,2})\s+([a-zéû]+)\s+(\d{4})', re.IGNORECASE)
+NUMERIC_DATE_RE = re.compile(r'(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})')
+ISO_DATE_RE = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+
+# "Not found", "Status not found", "Name not found", "Date not found" (extracteurs) et
+# "Pas de données reprises dans la BCE." (page KBO, open data)
+PLACEHOLDER_RE = re.compile(r'^(?:(?:status|name|date)\s+)?not found$|^pas de données', re.IGNORECASE)
+
+# "1.978.935,00 EUR", "0,00", "EUR 18.550,00" : séparateur de milliers "." ou espace
+AMOUNT_RE = re.compile(r'(-?)(\d{1,3}(?:[.  ]\d{3})+|\d+)(?:,(\d+))?')
+CURRENCY_RE = re.compile(r'\b([A-Z]{3})\b|(€)')
+
+# Champs texte de la fiche dont le libellé d'absence devient None
+TEXT_FIELDS = (
+    "status", "juridical_situation", "company_name", "abbreviation", "headquarters_address",
+    "phone", "email", "website", "entity_type", "legal_form", "entity_links",
+)
+DATE_FIELDS = ("start_date",)
+INTEGER_FIELDS = ("establishment_units",)
+# financial_data : montants et libellés ("mai", "31 décembre" : sans année, restent du texte)
+AMOUNT_FIELDS = ("capital",)
+DATED_SECTIONS = ("qualities", "functions", "entrepreneurial_capacities", "nace_codes")
+# Champs de premier niveau qui peuvent valoir None dans une fiche au schéma courant
+NULLABLE_FIELDS = TEXT_FIELDS + DATE_FIELDS + INTEGER_FIELDS
+
+CACHE_SIZE = 4096
+
+
+# ============================
+# DATES
+# ============================
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_date_text(text):
+    match = TEXT_DATE_RE.search(text)
+    if match:
+        month = FRENCH_MONTHS.get(match.group(2).lower())
+        if month:
+            return _safe_datetime(int(match.group(3)), month, int(match.group(1)))
+
+    match = NUMERIC_DATE_RE.search(text)
+    if match:
+        return _safe_datetime(int(match.group(3)), int(match.group(2)), int(match.group(1)))
+
+    match = ISO_DATE_RE.search(text)
+    if match:
+        return _safe_datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+
+    return None
+
+
+def parse_kbo_date(text):
+    """Convertit une date affichée par la BCE ("Depuis le 9 août 1960", "09-08-1960") en datetime."""
+    if isinstance(text, datetime):
+        return text
+    if not text or not isinstance(text, str):
+        return None
+    return _parse_date_text(text)
+
+
+def _safe_datetime(year, month, day):
+    try:
+        return datetime(year, month, day)
+    except ValueError:
+        return None
+
+
+def with_typed_dates(entries, key="date"):
+    """Copie de `entries` où `key` est converti en datetime (None si absente ou illisible)."""
+    return [{**entry, key: parse_kbo_date(entry.get(key))} for entry in entries]
+
+
+# ============================
+# MONTANTS
+# ============================
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_amount_text(text):
+    match = AMOUNT_RE.search(text)
+    if match is None:
+        return None
+    sign, units, cents = match.groups()
+    digits = re.sub(r'[.  ]', '', units)
+    try:
+        amount = Decimal(f"{sign}{digits}.{cents}" if cents else f"{sign}{digits}")
+    except InvalidOperation:
+        return None
+    currency = CURRENCY_RE.search(text)
+    if currency is None:
+        code = None
+    else:
+        code = currency.group(1) or "EUR"
+    return amount, code
+
+
+def parse_amount(value):
+    """{"amount": Decimal, "currency": "EUR" ou None} depuis "1.978.935,00 EUR", ou None"""
+    if isinstance(value, dict):
+        return value
+    if not isinstance(value, str) or is_placeholder(value):
+        return None
+    parsed = _parse_amount_text(value.strip())
+    if parsed is None:
+        return None
+    amount, currency = parsed
+    return {"amount": amount, "currency": currency}
+
+
+def type_registry():
+    """Registre pymongo qui écrit les Decimal en Decimal128 et les relit en Decimal"""
+    return _type_registry()
+
+
+@lru_cache(maxsize=1)
+def _type_registry():
+    # bson importé ici : les extracteurs (spiders, pool) n'en ont pas besoin
+    from bson.codec_options import TypeCodec, TypeRegistry
+    from bson.decimal128 import Decimal128
+
+    class DecimalCodec(TypeCodec):
+        python_type = Decimal
+        bson_type = Decimal128
+
+        def transform_python(self, value):
+            return Decimal128(value)
+
+        def transform_bson(self, value):
+            return value.to_decimal()
+
+    return TypeRegistry([DecimalCodec()])
+
+
+# ============================
+# VALEURS ABSENTES
+# ============================
+
+def is_placeholder(value):
+    return isinstance(value, str) and PLACEHOLDER_RE.match(value.strip()) is not None
+
+
+def null_if_placeholder(value):
+    """None pour les libellés d'absence et les chaînes vides, sinon la valeur"""
+    if isinstance(value, str) and (not value.strip() or is_placeholder(value)):
+        return None
+    return value
+
+
+def is_placeholder_entries(entries):
+    """Vrai pour la ligne unique "Pas de données reprises dans la BCE." de la page"""
+    return (
+        len(entries) == 1
+        and not parse_kbo_date(entries[0].get("date"))
+        and "pas de données" in (entries[0].get("name") or "").lower()
+    )
+
+
+def parse_integer(value):
+    if isinstance(value, int) or value is None:
+        return value
+    digits = re.sub(r'\D', '', value) if isinstance(value, str) else ""
+    return int(digits) if digits else None
+
+
+# ============================
+# FICHE ENTREPRISE
+# ============================
+
+def normalize_enterprise(fields):
+    """Type les champs présents de `fields` (dict ou ItemAdapter), en place ; retourne `fields`.
+
+    Idempotente : une valeur déjà typée (datetime, montant, entier, None) est laissée telle quelle.
+    """
+    for key in TEXT_FIELDS:
+        value = fields.get(key)
+        if value is not None:
+            fields[key] = null_if_placeholder(value)
+    for key in DATE_FIELDS:
+        value = fields.get(key)
+        if value is not None:
+            fields[key] = parse_kbo_date(value)
+    for key in INTEGER_FIELDS:
+        value = fields.get(key)
+        if value is not None:
+            fields[key] = parse_integer(null_if_placeholder(value))
+
+    financial_data = fields.get("financial_data")
+    if isinstance(financial_data, dict):
+        fields["financial_data"] = {
+            key: parse_amount(value) if key in AMOUNT_FIELDS else null_if_placeholder(value)
+            for key, value in financial_data.items()
+        }
+
+    for key in DATED_SECTIONS:
+        entries = fields.get(key)
+        if isinstance(entries, list) and any(not isinstance(entry.get("date"), (datetime, type(None)))
+                                             for entry in entries):
+            fields[key] = with_typed_dates(entries)
+    return fields
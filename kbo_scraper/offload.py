@@ -0,0 +1,50 @@
+# kbo_scraper/offload.py
+"""Pool de processus pour l'extraction HTML, hors du thread du réacteur.
+
+Le parsing lxml et les dizaines de XPath/regex d'une fiche KBO bloquent le réacteur
+pendant tout le callback, ce qui retarde les autres téléchargements. Avec
+EXTRACTION_POOL_WORKERS > 0, l'extension `ExtractionPoolExtension` donne au spider un
+`ExtractionPool` : le callback envoie `response.body` à un processus du pool, qui
+exécute les fonctions pures de `kbo_scraper.extractors` et renvoie des dict simples.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import defer
+
+
+class ExtractionPool:
+    def __init__(self, workers):
+        self.workers = workers
+        # forkserver : les workers ne dupliquent ni le réacteur ni les threads du crawl
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+    def submit(self, func, *args):
+        """Exécute `func(*args)` dans le pool ; retourne un Deferred déclenché dans le réacteur."""
+        from twisted.internet import reactor
+
+        d = defer.Deferred()
+        future = self.executor.submit(func, *args)
+
+        def resolve(done):
+            if done.cancelled():
+                reactor.callFromThread(d.cancel)
+            elif done.exception() is not None:
+                reactor.callFromThread(d.errback, done.exception())
+            else:
+                reactor.callFromThread(d.callback, done.result())
+
+        future.add_done_callback(resolve)
+        return d
+
+    async def extract(self, func, response, *args):
+        """`func(body, url, encoding, *args)` dans le pool, attendu depuis un callback `async`"""
+        return await maybe_deferred_to_future(
+            self.submit(func, response.body, response.url, response.encoding, *args)
+        )
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,288 @@
+# kbo_scraper/opendata.py
+"""Import des fichiers CSV de KBO Open Data dans la collection `entreprises`.
+
+Les fichiers du dump (enterprise, denomination, address, activity, contact,
+establishment, code) sont joints par numéro d'entreprise en une seule passe : ils sont
+livrés triés par numéro, chaque fichier est donc lu en flux et avancé en même temps que
+`enterprise.csv` (jointure par fusion). Un fichier qui ne serait pas trié est d'abord
+trié sur disque par morceaux, pour garder une mémoire bornée.
+
+Les champs couverts par l'open data (OPEN_DATA_FIELDS) n'ont plus besoin d'être
+scrapés ; le spider KBO peut se limiter à SCRAPE_ONLY_FIELDS (KBO_OPEN_DATA_COMPLEMENT).
+Une entreprise créée par l'import porte `kbo_page_pending: true` jusqu'au premier
+passage du spider KBO, qui retire l'indicateur : le runner liste les entreprises à
+compléter depuis l'index creux sur ce champ (run_spiders.py --complement).
+"""
+import csv
+import heapq
+import itertools
+import logging
+import os
+import tempfile
+from datetime import datetime
+
+from kbo_scraper.normalize import parse_kbo_date
+from kbo_scraper.schema import SCHEMA_VERSION
+
+logger = logging.getLogger(__name__)
+
+ENTERPRISE_FILE = "enterprise.csv"
+CODE_FILE = "code.csv"
+
+# Fichier -> colonne de jointure (numéro d'entreprise)
+RELATED_FILES = {
+    "denomination": ("denomination.csv", "EntityNumber"),
+    "address": ("address.csv", "EntityNumber"),
+    "activity": ("activity.csv", "EntityNumber"),
+    "contact": ("contact.csv", "EntityNumber"),
+    "establishment": ("establishment.csv", "EnterpriseNumber"),
+}
+
+# Champs remplis par l'import
+OPEN_DATA_FIELDS = (
+    "status", "juridical_situation", "start_date", "company_name", "abbreviation",
+    "headquarters_address", "phone", "email", "website", "entity_type", "legal_form",
+    "establishment_units", "nace_codes",
+)
+# Champs que seule la page KBO fournit
+SCRAPE_ONLY_FIELDS = (
+    "qualities", "functions", "financial_data", "entity_links", "external_links",
+    "entrepreneurial_capacities", "authorizations",
+)
+
+# Posé à la création par l'import, retiré par le spider KBO (index creux)
+KBO_PAGE_PENDING = "kbo_page_pending"
+# Entreprises importées avant l'indicateur et jamais scrapées (rattrapage après un import)
+LEGACY_PENDING_QUERY = {"open_data_updated": {"$exists": True}, "functions": {"$exists": False},
+                        KBO_PAGE_PENDING: {"$exists": False}}
+
+# Langue des dénominations et des libellés (code.csv) : français d'abord
+LANGUAGE_PRIORITY = {"1": 0, "0": 1, "2": 2, "3": 3, "4": 4}
+CONTACT_FIELDS = {"TEL": "phone", "EMAIL": "email", "WEB": "website"}
+
+
+# ============================
+# LECTURE EN FLUX
+# ============================
+
+def read_rows(path):
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def is_sorted(path, key):
+    previous = ""
+    for row in read_rows(path):
+        if row[key] < previous:
+            return False
+        previous = row[key]
+    return True
+
+
+def external_sort(path, key, chunk_rows, tmpdir):
+    """Lignes de `path` triées sur `key`, par morceaux de `chunk_rows` lignes triés sur disque"""
+    chunk_paths = []
+    rows = read_rows(path)
+    fieldnames = None
+    while True:
+        chunk = list(itertools.islice(rows, chunk_rows))
+        if not chunk:
+            break
+        fieldnames = list(chunk[0].keys())
+        chunk.sort(key=lambda row: row[key])
+        chunk_path = os.path.join(tmpdir, f"{os.path.basename(path)}.{len(chunk_paths)}")
+        with open(chunk_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(chunk)
+        chunk_paths.append(chunk_path)
+        del chunk
+
+    return heapq.merge(*(read_rows(p) for p in chunk_paths), key=lambda row: row[key])
+
+
+class SortedGroups:
+    """Curseur sur les groupes de lignes d'un fichier trié, avancé au fil de la jointure"""
+
+    def __init__(self, rows, key):
+        self.groups = itertools.groupby(rows, key=lambda row: row[key])
+        self.current = next(self.groups, None)
+
+    def take(self, number):
+        """Lignes de `number` ; les groupes précédents (établissements, numéros absents
+        de enterprise.csv) sont ignorés"""
+        while self.current is not None and self.current[0] < number:
+            self.current = next(self.groups, None)
+        if self.current is not None and self.current[0] == number:
+            rows = list(self.current[1])
+            self.current = next(self.groups, None)
+            return rows
+        return []
+
+
+def load_codes(path):
+    """(catégorie, code) -> libellé, en français si disponible"""
+    codes = {}
+    ranks = {}
+    language_rank = {"FR": 0, "NL": 1, "DE": 2, "EN": 3}
+    for row in read_rows(path):
+        key = (row["Category"], row["Code"])
+        rank = language_rank.get(row["Language"], 9)
+        if rank < ranks.get(key, 10):
+            codes[key] = row["Description"]
+            ranks[key] = rank
+    return codes
+
+
+# ============================
+# CONSTRUCTION DES DOCUMENTS
+# ============================
+
+def pick_denomination(rows, type_code):
+    candidates = [row for row in rows if row["TypeOfDenomination"] == type_code]
+    if not candidates:
+        return None
+    candidates.sort(key=lambda row: LANGUAGE_PRIORITY.get(row["Language"], 9))
+    return candidates[0]["Denomination"]
+
+
+def format_address(rows):
+    for row in rows:
+        if row["TypeOfAddress"] != "REGO":
+            continue
+        street = row["StreetFR"] or row["StreetNL"]
+        municipality = row["MunicipalityFR"] or row["MunicipalityNL"]
+        parts = [street, row["HouseNumber"]]
+        if row["Box"]:
+            parts.append(f"bte {row['Box']}")
+        parts += [row["Zipcode"], municipality]
+        return " ".join(part for part in parts if part)
+    return None
+
+
+def format_nace(code):
+    # "68121" -> "68.121", comme sur la page KBO
+    return f"{code[:2]}.{code[2:]}" if len(code) > 2 else code
+
+
+def build_nace_codes(rows, codes):
+    nace_codes = []
+    for row in rows:
+        group = codes.get(("ActivityGroup", row["ActivityGroup"]), "")
+        nace_type = "TVA" if "TVA" in group else "ONSS" if "ONSS" in group else group
+        version = row["NaceVersion"]
+        nace_codes.append({
+            "version": version,
+            "type": nace_type,
+            "code": format_nace(row["NaceCode"]),
+            "description": codes.get((f"Nace{version}", row["NaceCode"]), ""),
+            "classification": row["Classification"],
+            # L'open data ne donne pas la date de début de l'activité
+            "date": None,
+        })
+    return nace_codes
+
+
+def build_document(enterprise, related, codes):
+    contacts = {}
+    for row in related["contact"]:
+        field = CONTACT_FIELDS.get(row["ContactType"])
+        if field and field not in contacts:
+            contacts[field] = row["Value"]
+
+    document = {
+        "enterprise_number": enterprise["EnterpriseNumber"],
+        "status": codes.get(("Status", enterprise["Status"]), enterprise["Status"]),
+        "juridical_situation": codes.get(
+            ("JuridicalSituation", enterprise["JuridicalSituation"]), enterprise["JuridicalSituation"]
+        ),
+        "start_date": parse_kbo_date(enterprise["StartDate"]),
+        "company_name": pick_denomination(related["denomination"], "001"),
+        "abbreviation": pick_denomination(related["denomination"], "002"),
+        "headquarters_address": format_address(related["address"]),
+        "phone": contacts.get("phone"),
+        "email": contacts.get("email"),
+        "website": contacts.get("website"),
+        "entity_type": codes.get(("TypeOfEnterprise", enterprise["TypeOfEnterprise"])),
+        "legal_form": codes.get(("JuridicalForm", enterprise["JuridicalForm"])),
+        "establishment_units": len(related["establishment"]),
+        "nace_codes": build_nace_codes(related["activity"], codes),
+        "schema_version": SCHEMA_VERSION,
+    }
+    return document
+
+
+def iter_documents(directory, chunk_rows=500_000, tmpdir=None):
+    """Documents `entreprises` construits depuis le dump, dans l'ordre de enterprise.csv"""
+    codes = load_codes(os.path.join(directory, CODE_FILE))
+
+    with tempfile.TemporaryDirectory(dir=tmpdir) as sort_dir:
+        sides = {}
+        for name, (filename, key) in RELATED_FILES.items():
+            path = os.path.join(directory, filename)
+            if not os.path.exists(path):
+                logger.warning(f"{filename} absent : champs correspondants non importés")
+                sides[name] = None
+                continue
+            if is_sorted(path, key):
+                rows = read_rows(path)
+            else:
+                logger.info(f"{filename} n'est pas trié sur {key} : tri sur disque")
+                rows = external_sort(path, key, chunk_rows, sort_dir)
+            sides[name] = SortedGroups(rows, key)
+
+        previous = ""
+        for enterprise in read_rows(os.path.join(directory, ENTERPRISE_FILE)):
+            number = enterprise["EnterpriseNumber"]
+            if number < previous:
+                raise ValueError(f"{ENTERPRISE_FILE} n'est pas trié ({number} après {previous})")
+            previous = number
+            related = {name: side.take(number) if side else [] for name, side in sides.items()}
+            document = build_document(enterprise, related, codes)
+            # Sans le fichier correspondant, ne pas écraser ce qui a été scrapé
+            for name, fields in (("contact", ("phone", "email", "website")),
+                                 ("establishment", ("establishment_units",)),
+                                 ("activity", ("nace_codes",)),
+                                 ("address", ("headquarters_address",)),
+                                 ("denomination", ("company_name", "abbreviation"))):
+                if sides[name] is None:
+                    for field in fields:
+                        document.pop(field)
+            yield document
+
+
+def import_documents(collection, documents, batch_size=1000, now=None):
+    """Upsert des documents par lots non ordonnés ; retourne les compteurs de l'import.
+
+    Seuls les champs de l'open data sont écrits (`$set`) : ce que le spider a scrapé
+    (fonctions, capacités, données financières...) est conservé. `schema_version` et
+    `kbo_page_pending` ne sont posés qu'à la création : un document existant d'un ancien schéma garde sa version, ses
+    autres champs restent à convertir par `migrate_document` (run_spiders.py --migrate-schema).
+    """
+    # Importé ici : le spider KBO lit SCRAPE_ONLY_FIELDS sans avoir besoin de pymongo
+    from pymongo import UpdateOne
+
+    now = now or datetime.now()
+    counts = {"read": 0, "inserted": 0, "modified": 0}
+    batch = []
+
+    def flush():
+        result = collection.bulk_write(batch, ordered=False)
+        counts["inserted"] += result.upserted_count
+        counts["modified"] += result.modified_count
+        batch.clear()
+
+    for document in documents:
+        counts["read"] += 1
+        fields = dict(document)
+        schema_version = fields.pop("schema_version", SCHEMA_VERSION)
+        batch.append(UpdateOne(
+            {"enterprise_number": document["enterprise_number"]},
+            {"$set": {**fields, "open_data_updated": now}, "$setOnInsert": {"schema_version": schema_version, KBO_PAGE_PENDING: True}},
+            upsert=True,
+        ))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return counts
@@ -1,56 +1,244 @@
-import pymongo
+import hashlib
 import json
+import os
 import re
+from abc import ABC, abstractmethod
 from datetime import datetime
 from itemadapter import ItemAdapter
-from scrapy.exceptions import DropItem
+from scrapy.exceptions import DropItem, NotConfigured
+
+from kbo_scraper.changes import ChangeLog, change_record
+from kbo_scraper.moniteur_pdf import MONITEUR_CONTENTS_COLLECTION
+from kbo_scraper.normalize import NULLABLE_FIELDS, normalize_enterprise, type_registry
+from kbo_scraper.opendata import KBO_PAGE_PENDING, SCRAPE_ONLY_FIELDS
+from kbo_scraper.priority import spider_timestamp_field
+from kbo_scraper.schema import LEGACY_FIELDS, SCHEMA_VERSION
+
+
+def item_to_document(adapter):
+    """Champs à écrire : les items compacts ne copient rien et omettent leurs champs vides"""
+    if hasattr(adapter.item, "to_document"):
+        return adapter.item.to_document()
+    return dict(adapter)
 
 
 class MongoPipeline:
     collection_name = "entreprises"
+    # Texte des PDF du Moniteur, un document par publication (_id : moniteur_pdf.publication_key)
+    contents_collection_name = MONITEUR_CONTENTS_COLLECTION
     # ❌ Suppression de la collection séparée
     # publications_collection_name = "moniteur_publications"
 
-    def __init__(self, mongo_uri, mongo_db):
+    # Champs qui changent à chaque passage : exclus de l'empreinte du contenu. Le texte des
+    # PDF du Moniteur aussi, pour les listes qui le contiennent encore : il est écrit à part
+    # (process_publication_content)
+    volatile_fields = frozenset({"scraping_date", "last_scraped", "moniteur_last_updated", "deposits_last_updated",
+                                 "full_content"})
+
+    def __init__(self, mongo_uri, mongo_db, stats=None, touch_unchanged=True, fingerprint_batch_size=500,
+                 change_log=None):
         self.mongo_uri = mongo_uri
         self.mongo_db = mongo_db
+        self.stats = stats
+        self.touch_unchanged = touch_unchanged
+        self.fingerprint_batch_size = fingerprint_batch_size
+        # Journal des modifications (kbo_scraper/changes.py), si CHANGE_LOG_DIR est renseigné
+        self.change_log = change_log
 
     @classmethod
     def from_crawler(cls, crawler):
+        change_log = None
+        if crawler.settings.get("CHANGE_LOG_DIR"):
+            change_log = ChangeLog(
+                crawler.settings.get("CHANGE_LOG_DIR"),
+                segment_bytes=crawler.settings.getint("CHANGE_LOG_SEGMENT_BYTES", 64 * 1024 * 1024),
+                batch_size=crawler.settings.getint("CHANGE_LOG_BATCH_SIZE", 100),
+                stats=crawler.stats,
+            )
         return cls(
             mongo_uri=crawler.settings.get("MONGO_URI"),
-            mongo_db=crawler.settings.get("MONGO_DATABASE", "kbo_db")
+            mongo_db=crawler.settings.get("MONGO_DATABASE", "kbo_db"),
+            stats=crawler.stats,
+            touch_unchanged=crawler.settings.getbool("MONGO_TOUCH_UNCHANGED", True),
+            fingerprint_batch_size=crawler.settings.getint("MONGO_FINGERPRINT_BATCH_SIZE", 500),
+            change_log=change_log,
         )
 
     def open_spider(self, spider):
-        self.client = pymongo.MongoClient(self.mongo_uri)
+        # pymongo importé ici : le chargement des pipelines ne coûte rien au démarrage
+        import pymongo
+
+        from kbo_scraper.indexes import ensure_indexes
+
+        # Montants en Decimal128 (kbo_scraper/normalize.py)
+        self.client = pymongo.MongoClient(self.mongo_uri, type_registry=type_registry())
         self.db = self.client[self.mongo_db]
+        ensure_indexes(self.db[self.collection_name])
+
+        # Empreintes préchargées par lot : numéro -> empreinte (None si jamais écrit)
+        self.fingerprints = {}
+        self.loaded_batches = set()
+        self.number_positions = None
 
     def close_spider(self, spider):
+        if self.change_log is not None:
+            self.change_log.close()
         self.client.close()
 
     def process_item(self, item, spider):
         adapter = ItemAdapter(item)
 
         if spider.name == "ejustice_spider":
+            if "full_content" in adapter:
+                return self.process_publication_content(adapter, spider)
             return self.process_publication_item(adapter, spider)
         else:
             return self.process_enterprise_item(adapter, spider)
 
+    # ============================
+    # EMPREINTES DE CONTENU
+    # ============================
+
+    def compute_fingerprint(self, value):
+        """Empreinte stable du contenu normalisé (clés triées, champs volatils ignorés)"""
+        normalized = json.dumps(
+            self.strip_volatile(value), sort_keys=True, ensure_ascii=False,
+            separators=(",", ":"), default=str
+        )
+        return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+    def strip_volatile(self, value):
+        if isinstance(value, dict):
+            return {k: self.strip_volatile(v) for k, v in value.items() if k not in self.volatile_fields}
+        if isinstance(value, (list, tuple)):
+            return [self.strip_volatile(v) for v in value]
+        return value
+
+    def fingerprint_field(self, spider):
+        # Une empreinte par spider : chacun n'écrit qu'une partie du document
+        return f"content_fingerprints.{spider.name}"
+
+    def lookup_fingerprint(self, spider, enterprise_number):
+        """Retourne l'empreinte stockée pour ce spider, en préchargeant tout le lot du numéro"""
+        if enterprise_number not in self.fingerprints:
+            self.preload_fingerprints(spider, self.batch_for(spider, enterprise_number))
+        return self.fingerprints.pop(enterprise_number, None)
+
+    def batch_for(self, spider, enterprise_number):
+        """Lot de numéros (dans l'ordre du spider) contenant `enterprise_number`"""
+        if self.number_positions is None:
+            numbers = getattr(spider, "enterprise_numbers", None) or []
+            self.number_positions = {number: i for i, number in enumerate(numbers)}
+            self.ordered_numbers = list(numbers)
+
+        position = self.number_positions.get(enterprise_number)
+        if position is None:
+            return [enterprise_number]
+
+        batch_index = position // self.fingerprint_batch_size
+        if batch_index in self.loaded_batches:
+            return [enterprise_number]
+        self.loaded_batches.add(batch_index)
+
+        start = batch_index * self.fingerprint_batch_size
+        return self.ordered_numbers[start:start + self.fingerprint_batch_size]
+
+    def preload_fingerprints(self, spider, numbers):
+        field = self.fingerprint_field(spider)
+        for number in numbers:
+            self.fingerprints.setdefault(number, None)
+
+        cursor = self.db[self.collection_name].find(
+            {"enterprise_number": {"$in": numbers}},
+            {"enterprise_number": 1, field: 1, "_id": 0}
+        )
+        for doc in cursor:
+            stored = doc.get("content_fingerprints", {}).get(spider.name)
+            self.fingerprints[doc["enterprise_number"]] = stored
+
+    def write_document(self, spider, enterprise_number, document, timestamp_field, unset_fields=()):
+        """Écrit `document` seulement si son empreinte a changé depuis le dernier passage.
+
+        Retourne "new", "changed" ou "unchanged".
+        """
+        now = datetime.now()
+        collection = self.db[self.collection_name]
+        fingerprint = self.compute_fingerprint(document)
+        previous = self.lookup_fingerprint(spider, enterprise_number)
+
+        if previous == fingerprint:
+            if self.touch_unchanged:
+                collection.update_one(
+                    {"enterprise_number": enterprise_number},
+                    {"$set": {timestamp_field: now}}
+                )
+            status = "unchanged"
+        else:
+            update = {
+                "$set": {
+                    **document,
+                    timestamp_field: now,
+                    self.fingerprint_field(spider): fingerprint,
+                    "last_changed": now,
+                }
+            }
+            if previous is not None:
+                update["$inc"] = {"change_count": 1}
+            if unset_fields:
+                update["$unset"] = {field: "" for field in unset_fields}
+            if self.change_log is None:
+                collection.update_one({"enterprise_number": enterprise_number}, update, upsert=True)
+            else:
+                # Même aller-retour, mais l'écriture renvoie les champs avant modification
+                from pymongo import ReturnDocument
+
+                before = collection.find_one_and_update(
+                    {"enterprise_number": enterprise_number}, update, upsert=True,
+                    projection={**{field: 1 for field in document}, "_id": 0},
+                    return_document=ReturnDocument.BEFORE,
+                )
+                record = change_record(spider.name, enterprise_number, before, document, self.volatile_fields, now)
+                if record is not None:
+                    self.change_log.append(record)
+            status = "changed" if previous is not None else "new"
+
+        if self.stats:
+            self.stats.inc_value(f"mongo/items_{status}")
+        return status
+
+    # ============================
+    # ÉCRITURES
+    # ============================
+
     def process_enterprise_item(self, adapter, spider):
         """Traite les items d'entreprise du spider KBO"""
-        self.db[self.collection_name].update_one(
-            {"enterprise_number": adapter["enterprise_number"]},
-            {"$set": dict(adapter)},
-            upsert=True
-        )
+        # Un item au schéma courant remplace les doublons `*_json` de la version 1
+        unset_fields = LEGACY_FIELDS if adapter.get("schema_version") == SCHEMA_VERSION else ()
+        if spider.name == "kbo_spider":
+            # Page KBO scrapée : l'entreprise sort de la liste à compléter
+            unset_fields = (*unset_fields, KBO_PAGE_PENDING)
+        document = item_to_document(adapter)
+        for field in self.cleared_fields(adapter, spider):
+            document[field] = None
+        # Date du passage propre au spider (consult : deposits_last_updated), pour la priorité
+        self.write_document(spider, adapter["enterprise_number"], document, spider_timestamp_field(spider.name),
+                            unset_fields)
         return adapter.item
 
+    def cleared_fields(self, adapter, spider):
+        """Champs d'une fiche au schéma courant devenus absents (None) : les items compacts
+        les omettent, ils sont écrits à null pour effacer l'ancienne valeur"""
+        if adapter.get("schema_version") != SCHEMA_VERSION:
+            return []
+        # KBO_OPEN_DATA_COMPLEMENT : les autres champs viennent de l'open data
+        scraped = SCRAPE_ONLY_FIELDS if getattr(spider, "complement_only", False) else NULLABLE_FIELDS
+        return [field for field in NULLABLE_FIELDS if field in scraped and adapter.get(field) is None]
+
     def process_publication_item(self, adapter, spider):
         """Traite les items de publications du spider ejustice - SANS collection séparée"""
         enterprise_number = adapter["enterprise_number"]
 
-        if "moniteur_publications" in adapter:
+        if adapter.get("moniteur_publications"):
             try:
                 publications_data = json.loads(adapter["moniteur_publications"])
 
@@ -59,15 +247,11 @@ class MongoPipeline:
                     pub["scraping_date"] = datetime.now().isoformat()
 
                 # ✅ UNIQUEMENT mettre à jour l'entreprise avec les nouvelles publications
-                self.db[self.collection_name].update_one(
-                    {"enterprise_number": enterprise_number},
-                    {
-                        "$set": {
-                            "moniteur_publications": publications_data,  # Remplace les anciennes
-                            "moniteur_last_updated": datetime.now()
-                        }
-                    },
-                    upsert=True
+                # (l'empreinte ignore scraping_date : une liste identique n'est pas réécrite)
+                self.write_document(
+                    spider, enterprise_number,
+                    {"moniteur_publications": publications_data},  # Remplace les anciennes
+                    "moniteur_last_updated"
                 )
 
                 # ❌ SUPPRESSION de la sauvegarde dans une collection séparée
@@ -100,6 +284,35 @@ class MongoPipeline:
         return adapter.item
 
 
+    def process_publication_content(self, adapter, spider):
+        """Texte du PDF d'une publication (MONITEUR_PDF_DIR) : écrit dans `moniteur_contents`
+        sous la clé de la publication. Hors du document entreprise, il ne compte pas dans sa
+        limite de 16 Mo et la liste des publications peut être réécrite sans le perdre"""
+        enterprise_number = adapter["enterprise_number"]
+        key = adapter["publication_key"]
+        result = self.db[self.contents_collection_name].update_one(
+            {"_id": key},
+            {"$set": {"pdf_url": adapter["pdf_url"], "full_content": adapter["full_content"],
+                      "chars": len(adapter["full_content"])},
+             "$addToSet": {"enterprise_numbers": enterprise_number},
+             "$setOnInsert": {"created": datetime.now()}},
+            upsert=True,
+        )
+        written = result.upserted_id is not None or result.modified_count
+        if self.stats:
+            self.stats.inc_value("moniteur_pdf/written" if written else "moniteur_pdf/unchanged")
+        if written and self.change_log is not None:
+            self.change_log.append({
+                "time": datetime.now(),
+                "spider": spider.name,
+                "enterprise_number": enterprise_number,
+                "op": "update",
+                "publication_content": {"publication_key": key, "pdf_url": adapter["pdf_url"],
+                                        "chars": len(adapter["full_content"])},
+            })
+        return adapter.item
+
+
 class PublicationDeduplicationPipeline:
     """Pipeline pour dédupliquer les publications identiques"""
 
@@ -109,7 +322,7 @@ class PublicationDeduplicationPipeline:
     def process_item(self, item, spider):
         adapter = ItemAdapter(item)
 
-        if spider.name == "ejustice_spider" and "moniteur_publications" in adapter:
+        if spider.name == "ejustice_spider" and adapter.get("moniteur_publications"):
             try:
                 publications_data = json.loads(adapter["moniteur_publications"])
                 unique_publications = []
@@ -148,7 +361,7 @@ class ValidationPipeline:
             spider.logger.error("Item rejeté: pas de numéro d'entreprise")
             raise DropItem("Numéro d'entreprise manquant")
 
-        if spider.name == "ejustice_spider" and "moniteur_publications" in adapter:
+        if spider.name == "ejustice_spider" and adapter.get("moniteur_publications"):
             try:
                 publications = json.loads(adapter["moniteur_publications"])
                 if not publications:
@@ -167,6 +380,10 @@ class ValidationPipeline:
             except json.JSONDecodeError:
                 raise DropItem("Données de publication invalides")
 
+        elif spider.name == "kbo_spider":
+            # Valeurs typées (dates, montants, None pour "Not found"), quelle que soit la source de l'item
+            normalize_enterprise(adapter)
+
         return adapter.item
 
     def validate_publication(self, pub, spider):
@@ -192,4 +409,138 @@ class ValidationPipeline:
         if date_str and not re.search(r'\d{4}', date_str):
             spider.logger.warning(f"Date suspecte: {date_str}")
 
-        return True
\ No newline at end of file
+        return True
+
+
+class FeedExportPipeline:
+    """Écrit les items en Parquet / Arrow / JSONL zstd pendant le crawl (kbo_scraper/feeds.py)"""
+
+    def __init__(self, directory, formats, batch_size=1000, rows_per_file=100_000, zstd_level=3, stats=None):
+        self.directory = directory
+        self.formats = formats
+        self.batch_size = batch_size
+        self.rows_per_file = rows_per_file
+        self.zstd_level = zstd_level
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        directory = settings.get("FEED_EXPORT_DIR")
+        if not directory:
+            raise NotConfigured
+        # Modules des exports et des index importés seulement si le pipeline est activé
+        from kbo_scraper import feeds
+
+        formats = settings.getlist("FEED_EXPORT_FORMATS", ["parquet"])
+        try:
+            feeds.check_formats(formats)
+        except (ValueError, ImportError) as e:
+            raise NotConfigured(str(e))
+        return cls(
+            directory,
+            formats,
+            batch_size=settings.getint("FEED_BATCH_SIZE", 1000),
+            rows_per_file=settings.getint("FEED_ROWS_PER_FILE", 100_000),
+            zstd_level=settings.getint("FEED_ZSTD_LEVEL", 3),
+            stats=crawler.stats,
+        )
+
+    def open_spider(self, spider):
+        from kbo_scraper import feeds
+
+        # Un préfixe par processus : les workers d'un même spider écrivent côte à côte
+        prefix = f"{spider.name}-{datetime.now():%Y%m%d%H%M%S}-{os.getpid()}"
+        self.writer = feeds.FeedWriter(
+            self.directory, self.formats, prefix, self.batch_size, self.rows_per_file,
+            self.zstd_level, stats=self.stats,
+        )
+
+    def close_spider(self, spider):
+        files = self.writer.close()
+        spider.logger.info(f"Export: {len(files)} fichier(s) écrit(s) dans {self.directory}")
+
+    def process_item(self, item, spider):
+        from kbo_scraper import feeds
+
+        document = item_to_document(ItemAdapter(item))
+        for table, row in feeds.item_rows(document, spider.name, datetime.now()):
+            self.writer.write(table, row)
+        return item
+
+
+class DeltaIndexPipeline(ABC):
+    """Écrit une entrée par item dans les deltas d'un index local (kbo_scraper/deltas.py) ;
+    les sous-classes donnent les réglages et l'entrée d'un document (`delta_entry`)"""
+
+    directory_setting = None
+    flush_items_setting = None
+    stats_prefix = None
+
+    def __init__(self, directory, flush_items=1000, stats=None):
+        self.directory = directory
+        self.flush_items = flush_items
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        directory = settings.get(cls.directory_setting)
+        if not directory:
+            raise NotConfigured
+        return cls(directory, flush_items=settings.getint(cls.flush_items_setting, 1000), stats=crawler.stats)
+
+    def open_spider(self, spider):
+        from kbo_scraper.deltas import DeltaWriter
+
+        self.writer = DeltaWriter(self.directory, self.flush_items)
+
+    def close_spider(self, spider):
+        self.writer.close()
+
+    def process_item(self, item, spider):
+        document = item_to_document(ItemAdapter(item))
+        entry = self.delta_entry(document, spider) if document.get("enterprise_number") else None
+        if entry:
+            self.writer.append(document["enterprise_number"], entry)
+            if self.stats is not None:
+                self.stats.inc_value(f"{self.stats_prefix}/items")
+        return item
+
+    @abstractmethod
+    def delta_entry(self, document, spider):
+        """Entrée du delta pour `document` (None : rien à écrire)"""
+
+
+class SearchIndexPipeline(DeltaIndexPipeline):
+    """Ajoute les noms, adresses et titres de publications des items à l'index de recherche
+    local (deltas relus par kbo_scraper/search.py ; voir run_spiders.py --search-index)"""
+
+    directory_setting = "SEARCH_INDEX_DIR"
+    flush_items_setting = "SEARCH_INDEX_FLUSH_ITEMS"
+    stats_prefix = "search_index"
+
+    def delta_entry(self, document, spider):
+        from kbo_scraper.search import field_texts
+
+        return field_texts(document, spider.name)
+
+
+class GraphIndexPipeline(DeltaIndexPipeline):
+    """Ajoute les dirigeants et liens entre entités des items KBO à l'index de graphe local
+    (deltas relus par kbo_scraper/graph.py ; voir run_spiders.py --graph-index)"""
+
+    directory_setting = "GRAPH_INDEX_DIR"
+    flush_items_setting = "GRAPH_INDEX_FLUSH_ITEMS"
+    stats_prefix = "graph_index"
+
+    def delta_entry(self, document, spider):
+        from kbo_scraper.graph import document_edges, has_edges
+
+        # Un item sans ces rubriques (ejustice, BNB) ne doit pas effacer les arêtes connues
+        if not has_edges(document):
+            return None
+        edges = document_edges(document)
+        if self.stats is not None:
+            self.stats.inc_value("graph_index/edges", len(edges))
+        return {"edges": edges}
@@ -0,0 +1,102 @@
+# kbo_scraper/priority.py
+"""Priorité de rafraîchissement des entreprises.
+
+Le score estime la probabilité qu'une fiche ait changé depuis le dernier passage du
+spider, pondérée par le statut de l'entreprise :
+- taux de changement : un changement par an par défaut, augmenté du nombre de
+  changements déjà observés (`change_count`) et doublé si le dernier date de moins de
+  RECENT_CHANGE_DAYS ;
+- probabilité de changement depuis `age` jours : 1 - exp(-taux * age) (jamais scrapé : 1) ;
+- statut : une entreprise arrêtée change rarement, elle passe après les actives.
+
+Le score (0..1) est ramené à PRIORITY_LEVELS niveaux entiers pour `Request.priority` :
+avec JOBDIR, Scrapy ouvre une file disque par niveau, leur nombre doit rester borné.
+
+Les entreprises sont lues par l'index `refresh_<champ>` de chaque spider (indexes.py) :
+tri par date du dernier passage, les champs du score dans l'index (requête couverte).
+Avec une limite, seuls les `limit * CANDIDATE_FACTOR` plus anciens passages sont lus
+puis classés par score : à statut et historique égaux, le score croît avec l'ancienneté.
+"""
+import heapq
+import math
+from datetime import datetime
+
+PRIORITY_LEVELS = 100
+BASE_CHANGE_RATE = 1 / 365  # changements par jour
+RECENT_CHANGE_DAYS = 90
+
+ACTIVE_STATUSES = frozenset({"ac", "actif", "active", "actief"})
+STOPPED_STATUSES = frozenset({"st", "arrêté", "stopped", "gestopt"})
+STATUS_WEIGHTS = {"active": 1.0, "unknown": 0.6, "stopped": 0.2}
+
+# Date du dernier passage de chaque spider, écrite par MongoPipeline
+TIMESTAMP_FIELDS = {
+    "kbo_spider": "last_scraped",
+    "consult_spider": "deposits_last_updated",
+    "ejustice_spider": "moniteur_last_updated",
+}
+
+# Champs du score, à la suite du champ de date dans les index `refresh_<champ>`
+SCORE_FIELDS = ("status", "change_count", "last_changed", "enterprise_number")
+# Candidats lus par entreprise retenue quand une limite est donnée
+CANDIDATE_FACTOR = 4
+
+
+def spider_timestamp_field(spider_name):
+    return TIMESTAMP_FIELDS.get(spider_name, "last_scraped")
+
+
+def refresh_index(field):
+    """(nom, clés) de l'index de rafraîchissement trié sur `field`"""
+    return f"refresh_{field}", [(field, 1)] + [(name, 1) for name in SCORE_FIELDS]
+
+
+def priority_projection(spider_name):
+    return {field: 1 for field in (spider_timestamp_field(spider_name),) + SCORE_FIELDS} | {"_id": 0}
+
+
+def status_weight(status):
+    status = (status or "").strip().lower()
+    if status in ACTIVE_STATUSES:
+        return STATUS_WEIGHTS["active"]
+    if status in STOPPED_STATUSES:
+        return STATUS_WEIGHTS["stopped"]
+    return STATUS_WEIGHTS["unknown"]
+
+
+def refresh_score(doc, timestamp_field="last_scraped", now=None):
+    now = now or datetime.now()
+    weight = status_weight(doc.get("status"))
+    last_seen = doc.get(timestamp_field)
+    if not isinstance(last_seen, datetime):
+        return weight
+
+    rate = BASE_CHANGE_RATE * (1 + (doc.get("change_count") or 0))
+    last_changed = doc.get("last_changed")
+    if isinstance(last_changed, datetime) and (now - last_changed).days < RECENT_CHANGE_DAYS:
+        rate *= 2
+    age_days = max((now - last_seen).total_seconds() / 86400, 0)
+    return weight * (1 - math.exp(-rate * age_days))
+
+
+def priority_level(score):
+    return round(min(max(score, 0.0), 1.0) * PRIORITY_LEVELS)
+
+
+def top_numbers(docs, spider_name, limit=None, now=None):
+    """(numéros, niveaux de priorité) des `limit` entreprises les plus utiles à rafraîchir,
+    par score décroissant ; toutes si `limit` est None, dans l'ordre de `docs` (le spider
+    les range par niveau, voir `enterprise_numbers.schedule`)"""
+    now = now or datetime.now()
+    field = spider_timestamp_field(spider_name)
+    scored = (
+        (refresh_score(doc, field, now), doc["enterprise_number"])
+        for doc in docs if doc.get("enterprise_number")
+    )
+    # nlargest garde `limit` entrées en mémoire au lieu de trier toute la collection
+    ranked = heapq.nlargest(limit, scored) if limit else scored
+    numbers, levels = [], []
+    for score, number in ranked:
+        numbers.append(number)
+        levels.append(priority_level(score))
+    return numbers, levels
@@ -0,0 +1,75 @@
+# kbo_scraper/ratelimit.py
+"""Coordination du débit par hôte entre plusieurs processus Scrapy.
+
+Quand `run_spiders.py` lance plusieurs workers pour un même spider, chacun ne voit
+que ses propres requêtes : DOWNLOAD_DELAY et AUTOTHROTTLE ne limitent plus le débit
+total vers un site. Le runner démarre alors un `RateCoordinator` local ; avant chaque
+téléchargement, le middleware `CoordinatedRateLimitMiddleware` de chaque worker lui
+réserve un créneau pour l'hôte visé et attend le délai renvoyé. Son client
+(`RateLimitClient`, kbo_scraper/middlewares.py) est un protocole Twisted : l'échange ne
+bloque pas le réacteur.
+
+Protocole (TCP, une ligne par échange) : le client envoie `<hôte>\\n`, le serveur répond
+`<délai en secondes>\\n`. Les créneaux d'un hôte sont espacés de 1 / débit, tous
+workers confondus.
+"""
+import logging
+import socketserver
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RateCoordinator:
+    """Serveur de créneaux : `rate` requêtes/seconde par hôte (ou `host_rates[hôte]`)."""
+
+    def __init__(self, rate, host_rates=None, address=("127.0.0.1", 0)):
+        self.interval = 1.0 / rate
+        self.host_intervals = {host: 1.0 / r for host, r in (host_rates or {}).items()}
+        self.next_slot = {}
+        self.lock = threading.Lock()
+        self.server = _CoordinatorServer(address, _CoordinatorHandler, coordinator=self)
+        self.thread = None
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="rate-coordinator", daemon=True)
+        self.thread.start()
+        return self.address
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reserve(self, host):
+        """Réserve le prochain créneau libre pour `host` et retourne l'attente correspondante."""
+        now = time.monotonic()
+        with self.lock:
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.host_intervals.get(host, self.interval)
+        return slot - now
+
+
+class _CoordinatorServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, handler, coordinator):
+        self.coordinator = coordinator
+        super().__init__(address, handler)
+
+
+class _CoordinatorHandler(socketserver.StreamRequestHandler):
+    # Une connexion persistante par worker
+    def handle(self):
+        for line in self.rfile:
+            host = line.decode("ascii", "replace").strip()
+            if not host:
+                continue
+            delay = self.server.coordinator.reserve(host)
+            self.wfile.write(f"{delay:.6f}\n".encode("ascii"))
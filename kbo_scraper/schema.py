@@ -0,0 +1,66 @@
+# kbo_scraper/schema.py
+"""Schéma versionné des documents de la collection `entreprises`.
+
+Version 1 : sections stockées deux fois (texte formaté + chaîne `*_json`), listes et
+dictionnaires sérialisés en chaînes JSON, dates laissées telles qu'affichées.
+Version 2 : sous-documents et tableaux natifs, dates typées (datetime BSON ou None).
+Version 3 : valeurs typées (kbo_scraper/normalize.py) : `start_date` en datetime,
+capital en `{"amount": Decimal128, "currency"}`, `establishment_units` en entier, None
+à la place des libellés d'absence ("Not found", "Pas de données reprises dans la BCE.").
+"""
+import json
+
+from kbo_scraper.normalize import (
+    DATED_SECTIONS, is_placeholder_entries, normalize_enterprise, with_typed_dates,
+)
+
+SCHEMA_VERSION = 3
+
+# Sections stockées en JSON dans la version 1
+LIST_SECTIONS = ("nace_codes", "external_links", "authorizations")
+# Doublons de la version 1, supprimés par la migration
+LEGACY_FIELDS = ("qualities_json", "functions_json", "entrepreneurial_capacities_json")
+
+
+def _load_json(value, default):
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return default
+    return default if value is None else value
+
+
+def migrate_document(doc):
+    """Retourne (`$set`, `$unset`) pour passer un document en version courante, ou None."""
+    if doc.get("schema_version") == SCHEMA_VERSION:
+        return None
+
+    to_set = {"schema_version": SCHEMA_VERSION}
+    to_unset = {}
+
+    # Les sections en double : la version JSON fait foi, le texte formaté est remplacé
+    for field in ("qualities", "functions", "entrepreneurial_capacities"):
+        legacy = f"{field}_json"
+        if legacy in doc or isinstance(doc.get(field), str):
+            entries = _load_json(doc.get(legacy), [])
+            if is_placeholder_entries(entries):
+                entries = []
+            to_set[field] = with_typed_dates(entries)
+        if legacy in doc:
+            to_unset[legacy] = ""
+
+    for field in LIST_SECTIONS:
+        if isinstance(doc.get(field), str):
+            entries = _load_json(doc[field], [])
+            to_set[field] = with_typed_dates(entries) if field in DATED_SECTIONS else entries
+
+    if isinstance(doc.get("financial_data"), str):
+        to_set["financial_data"] = _load_json(doc["financial_data"], {})
+
+    # Version 3 : valeurs typées, sur le document déjà passé en version 2
+    current = {**doc, **to_set}
+    typed = normalize_enterprise(dict(current))
+    to_set.update({key: value for key, value in typed.items() if key in to_set or value != current[key]})
+
+    return to_set, to_unset
@@ -0,0 +1,431 @@
+# kbo_scraper/search.py
+"""Index de recherche local (jetons et trigrammes) des noms, adresses et publications.
+
+Trois champs : `name` (dénomination et abréviation), `address` (siège) et
+`publications` (titres des publications du Moniteur Belge). Le texte est normalisé
+(minuscules, sans accents ni ponctuation) puis indexé sous deux formes :
+- jetons entiers (recherche exacte et par préfixe, pour l'autocomplétion) ;
+- trigrammes de chaque jeton bordé de "$" (recherche approchée : fautes de frappe,
+  mots tronqués, ordre des mots indifférent).
+
+Stockage (dossier SEARCH_INDEX_DIR) :
+- une base immuable (`base-<date>/`) au format CSR : termes triés (`terms.txt`),
+  début de la liste de chaque terme (`offsets.npy`) et listes concaténées d'identifiants
+  denses uint32 (`postings.npy`), plus les numéros (`docs.npy`) et les textes indexés
+  (`texts.bin` + `text_offsets.npy`) ; tout est ouvert en mémoire partagée (mmap) ;
+- des deltas JSONL (`deltas/`) écrits par `SearchIndexPipeline` pendant les crawls,
+  relus au chargement et indexés en mémoire par-dessus la base.
+Un document modifié n'est pas retiré des listes de la base : les candidats sont
+toujours notés sur leur texte courant, une entrée périmée retombe donc sous le seuil.
+`compact` (ou `run_spiders.py --rebuild-search-index`) réécrit une base propre.
+Base, deltas et reconstruction suivent la structure commune de kbo_scraper/deltas.py.
+
+Notation d'une recherche approchée : pour chaque mot de la requête, meilleur coefficient
+de Dice (2 x trigrammes communs / total) avec un mot du texte, moyenne sur les mots de la
+requête. Seuls les `candidates` documents qui partagent le plus de trigrammes avec la
+requête sont notés (comptage np.unique sur les listes concaténées).
+"""
+import json
+import os
+import re
+import shutil
+import unicodedata
+from bisect import bisect_left
+from array import array
+from datetime import datetime
+
+import numpy as np
+
+from kbo_scraper.changes import directory_lock
+from kbo_scraper.deltas import DeltaIndex, read_current, rebuild_base, write_current
+
+FIELDS = ("name", "address", "publications")
+
+# Valeurs affichées par la BCE quand une rubrique est vide
+PLACEHOLDERS = ("pas de données", "not found")
+
+NON_ALNUM_RE = re.compile(r"[^0-9a-z]+")
+NON_DIGIT_RE = re.compile(r"\D")
+
+
+# ============================
+# TEXTE
+# ============================
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii").lower()
+    return NON_ALNUM_RE.sub(" ", text).strip()
+
+
+def tokens(text):
+    return normalize_text(text).split()
+
+
+def token_trigrams(token):
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def trigrams(text):
+    result = set()
+    for token in tokens(text):
+        result |= token_trigrams(token)
+    return result
+
+
+def dice(a, b):
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def terms_for(field, text):
+    """Clés d'index d'un texte : "<champ>#<jeton>" et "<champ>:<trigramme>" """
+    keys = set()
+    for token in tokens(text):
+        keys.add(f"{field}#{token}")
+        keys.update(f"{field}:{trigram}" for trigram in token_trigrams(token))
+    return keys
+
+
+def _clean(value):
+    if not isinstance(value, str):
+        return ""
+    value = value.strip()
+    return "" if value.lower().startswith(PLACEHOLDERS) else value
+
+
+def field_texts(document, spider_name=None):
+    """Textes indexés d'un item ou d'un document Mongo (seulement les champs présents)"""
+    texts = {}
+    if spider_name in (None, "kbo_spider"):
+        if "company_name" in document or "abbreviation" in document:
+            texts["name"] = " ".join(filter(None, (_clean(document.get("company_name")),
+                                                   _clean(document.get("abbreviation")))))
+        if "headquarters_address" in document:
+            texts["address"] = _clean(document.get("headquarters_address"))
+    if spider_name in (None, "ejustice_spider") and "moniteur_publications" in document:
+        publications = document.get("moniteur_publications")
+        if isinstance(publications, str):
+            try:
+                publications = json.loads(publications)
+            except json.JSONDecodeError:
+                publications = []
+        titles = [p.get("title") or p.get("type_publication") or "" for p in publications or [] if isinstance(p, dict)]
+        texts["publications"] = " | ".join(dict.fromkeys(t for t in titles if t))
+    return texts
+
+
+def number_value(enterprise_number):
+    """Numéro pointé -> entier (identifiant compact, tient dans un uint32). Appelé pour
+    chaque document d'une reconstruction : sans passer par les tableaux NumPy"""
+    digits = NON_DIGIT_RE.sub("", enterprise_number or "")
+    return int(digits) if len(digits) in (9, 10) and int(digits) <= 0xFFFFFFFF else None
+
+
+def number_text(value):
+    digits = f"{value:010d}"
+    return f"{digits[:4]}.{digits[4:7]}.{digits[7:]}"
+
+
+# ============================
+# CONSTRUCTION DE LA BASE
+# ============================
+
+class IndexBuilder:
+    """Construit une base CSR en flux : lots de `chunk_docs` documents écrits sur disque
+    puis fusionnés, sans garder toutes les listes en mémoire"""
+
+    def __init__(self, directory, chunk_docs=200_000):
+        self.directory = directory
+        self.chunk_docs = chunk_docs
+        self.path = os.path.join(directory, f"base-{datetime.now():%Y%m%d%H%M%S%f}")
+        self.work = self.path + ".tmp"
+        os.makedirs(self.work, exist_ok=True)
+        self.numbers = array("I")
+        self.texts = open(os.path.join(self.work, "texts.bin"), "wb")
+        self.text_offsets = array("Q", [0])
+        self.text_size = 0
+        self.vocabulary = {}
+        self.chunk_terms = array("I")
+        self.chunk_docs_ids = array("I")
+        self.chunks = []
+
+    def add(self, enterprise_number, texts):
+        value = number_value(enterprise_number)
+        if value is None:
+            return
+        doc_id = len(self.numbers)
+        self.numbers.append(value)
+        for field in FIELDS:
+            encoded = (texts.get(field) or "").encode("utf-8")
+            self.texts.write(encoded)
+            self.text_size += len(encoded)
+            self.text_offsets.append(self.text_size)
+            for key in terms_for(field, texts.get(field)):
+                term_id = self.vocabulary.setdefault(key, len(self.vocabulary))
+                self.chunk_terms.append(term_id)
+                self.chunk_docs_ids.append(doc_id)
+        if doc_id % self.chunk_docs == self.chunk_docs - 1:
+            self.flush_chunk()
+
+    def flush_chunk(self):
+        """Paires (terme, document) du lot sur disque ; triées à la fusion, quand l'ordre
+        global des termes est connu"""
+        if not self.chunk_terms:
+            return
+        path = os.path.join(self.work, f"chunk-{len(self.chunks)}.npz")
+        np.savez(path, terms=np.frombuffer(self.chunk_terms, dtype=np.uint32),
+                 docs=np.frombuffer(self.chunk_docs_ids, dtype=np.uint32))
+        self.chunks.append(path)
+        self.chunk_terms = array("I")
+        self.chunk_docs_ids = array("I")
+
+    def finish(self):
+        """Fusionne les lots, publie la base (fichier CURRENT) ; retourne le nombre de documents"""
+        self.flush_chunk()
+        self.texts.close()
+
+        # Identifiants de termes globaux dans l'ordre lexicographique
+        keys = sorted(self.vocabulary)
+        rank = np.empty(len(keys), dtype=np.uint32)
+        for position, key in enumerate(keys):
+            rank[self.vocabulary[key]] = position
+
+        counts = np.zeros(len(keys), dtype=np.uint64)
+        for path in self.chunks:
+            with np.load(path) as chunk:
+                counts += np.bincount(rank[chunk["terms"]], minlength=len(keys)).astype(np.uint64)
+        offsets = np.zeros(len(keys) + 1, dtype=np.uint64)
+        np.cumsum(counts, out=offsets[1:])
+
+        postings = np.lib.format.open_memmap(
+            os.path.join(self.work, "postings.npy"), mode="w+", dtype=np.uint32, shape=(int(offsets[-1]),)
+        )
+        cursor = offsets[:-1].copy()
+        # Les lots couvrent des documents croissants et le tri stable garde cet ordre dans un
+        # lot : les écrire à la suite garde chaque liste triée
+        for path in self.chunks:
+            with np.load(path) as chunk:
+                terms = rank[chunk["terms"]]
+                order = np.argsort(terms, kind="stable")
+                terms, docs = terms[order], chunk["docs"][order]
+                starts = np.flatnonzero(np.concatenate(([True], terms[1:] != terms[:-1])))
+                run_lengths = np.diff(np.append(starts, len(terms)))
+                within = np.arange(len(terms)) - np.repeat(starts, run_lengths)
+                postings[cursor[terms] + within.astype(np.uint64)] = docs
+                cursor[terms[starts]] += run_lengths.astype(np.uint64)
+            os.remove(path)
+        postings.flush()
+        del postings
+
+        np.save(os.path.join(self.work, "offsets.npy"), offsets)
+        np.save(os.path.join(self.work, "docs.npy"), np.frombuffer(self.numbers, dtype=np.uint32))
+        np.save(os.path.join(self.work, "text_offsets.npy"), np.frombuffer(self.text_offsets, dtype=np.uint64))
+        with open(os.path.join(self.work, "terms.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(keys))
+
+        os.replace(self.work, self.path)
+        write_current(self.directory, os.path.basename(self.path))
+        return len(self.numbers)
+
+
+# ============================
+# LECTURE ET RECHERCHE
+# ============================
+
+class SearchIndex(DeltaIndex):
+    def load(self):
+        with self.lock:
+            base = read_current(self.directory)
+            self.base_path = base
+            if base is not None:
+                self.docs = np.load(os.path.join(base, "docs.npy"), mmap_mode="r")
+                self.offsets = np.load(os.path.join(base, "offsets.npy"), mmap_mode="r")
+                self.postings = np.load(os.path.join(base, "postings.npy"), mmap_mode="r")
+                self.text_offsets = np.load(os.path.join(base, "text_offsets.npy"), mmap_mode="r")
+                self.texts_blob = np.memmap(os.path.join(base, "texts.bin"), dtype=np.uint8, mode="r") \
+                    if os.path.getsize(os.path.join(base, "texts.bin")) else np.zeros(0, dtype=np.uint8)
+                with open(os.path.join(base, "terms.txt"), encoding="utf-8") as f:
+                    self.terms = f.read().split("\n") if len(self.offsets) > 1 else []
+            else:
+                self.docs = np.zeros(0, dtype=np.uint32)
+                self.offsets = np.zeros(1, dtype=np.uint64)
+                self.postings = np.zeros(0, dtype=np.uint32)
+                self.text_offsets = np.zeros(1, dtype=np.uint64)
+                self.texts_blob = np.zeros(0, dtype=np.uint8)
+                self.terms = []
+            self.term_ids = {term: i for i, term in enumerate(self.terms)}
+            self.doc_ids = {int(value): i for i, value in enumerate(self.docs.tolist())}
+
+            # Couche en mémoire : documents ajoutés ou modifiés depuis la base
+            self.extra_docs = []           # identifiant dense - len(docs) -> numéro
+            self.overrides = {}            # identifiant dense -> {champ: texte}
+            self.delta_postings = {}       # terme -> array("I")
+            self.delta_tokens = {}         # champ -> liste triée des jetons de la couche
+            self.loaded_deltas = set()
+            self.refresh()
+
+    @property
+    def size(self):
+        return len(self.docs) + len(self.extra_docs)
+
+    def apply_delta(self, entry):
+        self.add(entry.pop("enterprise_number"), entry)
+
+    def add(self, enterprise_number, texts):
+        """Indexe (ou réindexe) les champs donnés d'un document dans la couche en mémoire"""
+        value = number_value(enterprise_number)
+        if value is None:
+            return
+        with self.lock:
+            doc_id = self.doc_ids.get(value)
+            if doc_id is None:
+                doc_id = self.size
+                self.doc_ids[value] = doc_id
+                self.extra_docs.append(value)
+            current = self.overrides.setdefault(doc_id, {})
+            for field, text in texts.items():
+                if field not in FIELDS:
+                    continue
+                current[field] = text
+                for key in terms_for(field, text):
+                    postings = self.delta_postings.get(key)
+                    if postings is None:
+                        postings = self.delta_postings[key] = array("I")
+                        if "#" in key:
+                            field_name, token = key.split("#", 1)
+                            token_list = self.delta_tokens.setdefault(field_name, [])
+                            token_list.insert(bisect_left(token_list, token), token)
+                    if not postings or postings[-1] != doc_id:
+                        postings.append(doc_id)
+
+    def text(self, doc_id, field):
+        override = self.overrides.get(doc_id)
+        if override is not None and field in override:
+            return override[field]
+        if doc_id >= len(self.docs):
+            return ""
+        slot = doc_id * len(FIELDS) + FIELDS.index(field)
+        start, end = int(self.text_offsets[slot]), int(self.text_offsets[slot + 1])
+        return bytes(self.texts_blob[start:end]).decode("utf-8")
+
+    def number(self, doc_id):
+        value = self.docs[doc_id] if doc_id < len(self.docs) else self.extra_docs[doc_id - len(self.docs)]
+        return number_text(int(value))
+
+    def postings_for(self, key):
+        """Liste d'identifiants d'un terme : base + couche en mémoire"""
+        parts = []
+        term_id = self.term_ids.get(key)
+        if term_id is not None:
+            parts.append(self.postings[int(self.offsets[term_id]):int(self.offsets[term_id + 1])])
+        delta = self.delta_postings.get(key)
+        if delta:
+            parts.append(np.frombuffer(delta, dtype=np.uint32))
+        if not parts:
+            return np.zeros(0, dtype=np.uint32)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def result(self, doc_id, field, score):
+        return {"enterprise_number": self.number(doc_id), "field": field,
+                "text": self.text(doc_id, field), "score": round(score, 3)}
+
+    def search(self, query, field="name", limit=10, min_score=0.5, candidates=100):
+        """Recherche approchée par trigrammes, meilleurs scores d'abord"""
+        query_tokens = [token_trigrams(token) for token in dict.fromkeys(tokens(query))]
+        query_trigrams = set().union(*query_tokens)
+        if not query_trigrams:
+            return []
+        with self.lock:
+            lists = [self.postings_for(f"{field}:{trigram}") for trigram in query_trigrams]
+            lists = [postings for postings in lists if len(postings)]
+            if not lists:
+                return []
+            # Comptage sur les seuls documents cités (quelques milliers), pas sur tout l'index
+            doc_ids, hits = np.unique(np.concatenate(lists), return_counts=True)
+            if len(doc_ids) > candidates:
+                doc_ids = doc_ids[np.argpartition(hits, -candidates)[-candidates:]]
+
+            results = []
+            for doc_id in doc_ids.tolist():
+                doc_tokens = [token_trigrams(token) for token in set(tokens(self.text(doc_id, field)))]
+                if not doc_tokens:
+                    continue
+                score = sum(max(dice(query_token, doc_token) for doc_token in doc_tokens)
+                            for query_token in query_tokens) / len(query_tokens)
+                if score >= min_score:
+                    results.append(self.result(doc_id, field, score))
+        # À score égal, le texte le plus court (le moins de mots hors requête) d'abord
+        results.sort(key=lambda r: (-r["score"], len(r["text"]), r["text"]))
+        return results[:limit]
+
+    def token_range(self, field, prefix):
+        """Jetons de la base commençant par `prefix` (termes triés : une recherche dichotomique)"""
+        start = bisect_left(self.terms, f"{field}#{prefix}")
+        end = bisect_left(self.terms, f"{field}#{prefix}￿")
+        return [term.split("#", 1)[1] for term in self.terms[start:end]]
+
+    def prefix(self, query, field="name", limit=10, max_expansions=500):
+        """Documents contenant tous les mots de la requête, le dernier pouvant être incomplet"""
+        words = tokens(query)
+        if not words:
+            return []
+        with self.lock:
+            *exact, last = words
+            expansions = set(self.token_range(field, last)[:max_expansions])
+            delta_tokens = self.delta_tokens.get(field, [])
+            start = bisect_left(delta_tokens, last)
+            for token in delta_tokens[start:]:
+                if not token.startswith(last) or len(expansions) >= max_expansions:
+                    break
+                expansions.add(token)
+            if not expansions:
+                return []
+
+            matches = np.unique(np.concatenate([self.postings_for(f"{field}#{token}") for token in expansions]))
+            for word in exact:
+                matches = np.intersect1d(matches, self.postings_for(f"{field}#{word}"), assume_unique=False)
+                if not len(matches):
+                    return []
+
+            results = []
+            for doc_id in matches.tolist():
+                # Vérification sur le texte courant (listes de la base périmées après une modification)
+                doc_tokens = tokens(self.text(doc_id, field))
+                if all(word in doc_tokens for word in exact) and any(t.startswith(last) for t in doc_tokens):
+                    results.append(self.result(doc_id, field, 1.0))
+                    if len(results) >= limit * 4:
+                        break
+        # Textes les plus courts d'abord : "Veneco" avant "Veneco Services Internationaux"
+        results.sort(key=lambda r: (len(r["text"]), r["text"]))
+        return results[:limit]
+
+    def documents(self):
+        """(numéro, textes) de chaque document, couche en mémoire comprise"""
+        for doc_id in range(self.size):
+            yield self.number(doc_id), {field: self.text(doc_id, field) for field in FIELDS}
+
+    def compact(self, chunk_docs=200_000):
+        """Réécrit la base avec les deltas ; retourne le nombre de documents"""
+        with directory_lock(self.directory), self.lock:
+            self.refresh()
+            merged = set(self.loaded_deltas)
+            builder = IndexBuilder(self.directory, chunk_docs)
+            for number, texts in self.documents():
+                builder.add(number, texts)
+            count = builder.finish()
+            for name in merged:
+                os.remove(os.path.join(self.directory, "deltas", name))
+            previous = self.base_path
+            self.load()
+            if previous and previous != self.base_path:
+                shutil.rmtree(previous, ignore_errors=True)
+            return count
+
+
+def rebuild(collection, directory, batch_size=1000, chunk_docs=200_000):
+    """Reconstruit la base depuis la collection `entreprises` (curseur par lots) ; les deltas
+    antérieurs sont couverts par la collection et supprimés"""
+    projection = {"enterprise_number": 1, "company_name": 1, "abbreviation": 1, "headquarters_address": 1,
+                  "moniteur_publications.title": 1, "moniteur_publications.type_publication": 1, "_id": 0}
+    return rebuild_base(collection, directory, IndexBuilder(directory, chunk_docs), projection, field_texts,
+                        batch_size)
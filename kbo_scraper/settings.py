@@ -14,12 +14,42 @@ ITEM_PIPELINES = {
     "kbo_scraper.pipelines.ValidationPipeline": 200,
     "kbo_scraper.pipelines.PublicationDeduplicationPipeline": 250,
     "kbo_scraper.pipelines.MongoPipeline": 300,
+    "kbo_scraper.pipelines.FeedExportPipeline": 400,
+    "kbo_scraper.pipelines.SearchIndexPipeline": 450,
+    "kbo_scraper.pipelines.GraphIndexPipeline": 460,
 }
 
+# Export Parquet / Arrow / JSONL zstd pendant le crawl (kbo_scraper/feeds.py), actif si
+# FEED_EXPORT_DIR est renseigné (run_spiders.py --feed-dir)
+FEED_EXPORT_DIR = None
+FEED_EXPORT_FORMATS = ["parquet", "jsonl.zst"]
+FEED_BATCH_SIZE = 1000
+FEED_ROWS_PER_FILE = 100_000
+FEED_ZSTD_LEVEL = 3
+
+# Journal des modifications de la collection entreprises (kbo_scraper/changes.py), actif si
+# CHANGE_LOG_DIR est renseigné (run_spiders.py --change-log)
+CHANGE_LOG_DIR = None
+CHANGE_LOG_SEGMENT_BYTES = 64 * 1024 * 1024
+CHANGE_LOG_BATCH_SIZE = 100
+
+# Index de recherche local (kbo_scraper/search.py), alimenté pendant le crawl si
+# SEARCH_INDEX_DIR est renseigné (run_spiders.py --search-index)
+SEARCH_INDEX_DIR = None
+SEARCH_INDEX_FLUSH_ITEMS = 1000
+
+# Index de graphe dirigeants / entreprises (kbo_scraper/graph.py), alimenté pendant le
+# crawl si GRAPH_INDEX_DIR est renseigné (run_spiders.py --graph-index)
+GRAPH_INDEX_DIR = None
+GRAPH_INDEX_FLUSH_ITEMS = 1000
+
 # Configuration MongoDB
 MONGO_URI = "mongodb://localhost:27017"
 MONGO_DATABASE = "kbo_db"
 
+# Le spider KBO n'écrit que les champs absents de KBO Open Data (run_spiders.py --complement)
+KBO_OPEN_DATA_COMPLEMENT = False
+
 # 🆕 Configuration spécifique pour ejustice
 EJUSTICE_SETTINGS = {
     'CONCURRENT_REQUESTS': 1,
@@ -38,6 +68,81 @@ CONSULT_SETTINGS = {
     'RETRY_HTTP_CODES': [500, 502, 503, 504, 408, 429],
 }
 
+# Console telnet jamais utilisée (processus lancés par le runner) : évite d'importer
+# twisted.conch au démarrage de chaque crawl
+TELNETCONSOLE_ENABLED = False
+
+# Extensions maison (chacune reste inactive tant que son réglage n'est pas activé)
+EXTENSIONS = {
+    "kbo_scraper.extensions.MetricsExtension": 500,
+    "kbo_scraper.extensions.ProfilingExtension": 510,
+    "kbo_scraper.extensions.MemoryMonitorExtension": 520,
+    "kbo_scraper.extensions.StatsDumpExtension": 530,
+    "kbo_scraper.extensions.ExtractionPoolExtension": 540,
+    "kbo_scraper.extensions.NegativeCacheExtension": 550,
+    "kbo_scraper.extensions.DeadLetterExtension": 560,
+    "kbo_scraper.extensions.MoniteurPdfExtension": 570,
+}
+
+# Métriques OpenMetrics (latences par étape, files d'attente) sur un endpoint HTTP local
+METRICS_ENABLED = False
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9410
+METRICS_SAMPLE_INTERVAL = 5.0
+
+# Profilage à la demande (kill -USR2 <pid>) des callbacks et pipelines
+PROFILING_ENABLED = False
+PROFILING_MODE = "deterministic"  # ou "sampling" pour des piles repliées (flamegraph)
+PROFILING_WINDOW = 60
+PROFILING_DIR = "profiles"
+
+# Suivi mémoire des longs crawls (0 = pas de limite)
+MEMWATCH_ENABLED = False
+MEMWATCH_INTERVAL = 60
+MEMWATCH_TRACEMALLOC = False
+MEMWATCH_SOFT_LIMIT_MB = 0  # pause du moteur au-delà
+MEMWATCH_HARD_LIMIT_MB = 0  # fermeture propre du spider au-delà
+
+# Extraction HTML dans un pool de processus (0 = dans le callback, sur le thread du réacteur)
+EXTRACTION_POOL_WORKERS = 0
+# Parsing HTML des spiders kbo/ejustice : "parsel" (page entière) ou "sliced" (page coupée
+# au conteneur utile avant lxml, même résultat ; voir benchmarks/bench_parsers.py)
+HTML_PARSER_BACKEND = "parsel"
+
+# PDF des publications du Moniteur Belge et leur texte (full_content), téléchargés une
+# seule fois dans MONITEUR_PDF_DIR (run_spiders.py --moniteur-pdf) ; texte extrait dans
+# un pool de MONITEUR_PDF_WORKERS processus. Requiert pypdf
+MONITEUR_PDF_DIR = None
+MONITEUR_PDF_WORKERS = 2
+
+# Résultats vides (ni publication ni dépôt) recontrôlés après 7 j, puis 14, 28... au plus 180 j
+# (activé par run_spiders.py, sauf avec --recheck-empty)
+NEGATIVE_CACHE_ENABLED = False
+NEGATIVE_CACHE_BASE_DAYS = 7
+NEGATIVE_CACHE_MAX_DAYS = 180
+NEGATIVE_CACHE_JITTER = 0.1
+
+# Requêtes en échec mises de côté au lieu d'être réessayées tout de suite (activé par
+# run_spiders.py) : relancées en fin de crawl après 5 min, 10, 20... au plus 6 h entre deux
+# essais et 5 essais ; le reste attend run_spiders.py --retry-failed
+DEAD_LETTER_ENABLED = False
+DEAD_LETTER_BASE_DELAY = 300
+DEAD_LETTER_MAX_DELAY = 6 * 3600
+DEAD_LETTER_MAX_ATTEMPTS = 5
+DEAD_LETTER_IDLE_WAIT = 600  # attente maximale en fin de crawl avant le prochain réessai
+
+# Stats finales en JSON (renseigné par run_spiders.py pour son rapport)
+STATS_DUMP_FILE = None
+
+# Débit par hôte partagé entre workers (renseigné par run_spiders.py --workers N)
+RATE_COORDINATOR = None
+RATE_LIMIT_FALLBACK_DELAY = 2.0
+
+# Files du scheduler : FIFO par niveau de priorité (Request.priority, voir kbo_scraper/priority.py),
+# sur disque quand JOBDIR est défini (run_spiders.py en donne un par worker)
+SCHEDULER_DISK_QUEUE = "scrapy.squeues.PickleFifoDiskQueue"
+SCHEDULER_MEMORY_QUEUE = "scrapy.squeues.FifoMemoryQueue"
+
 # Logging
 LOG_LEVEL = 'INFO'
 LOG_FILE = 'scrapy.log'
@@ -58,7 +163,8 @@ AUTOTHROTTLE_DEBUG = False
 DOWNLOADER_MIDDLEWARES = {
     'scrapy.downloadermiddlewares.useragent.UserAgentMiddleware': None,
     'kbo_scraper.middlewares.RotateUserAgentMiddleware': 400,
-    'scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler': 543,
+    # Après HttpCacheMiddleware (900) : seules les requêtes réellement émises attendent
+    'kbo_scraper.middlewares.CoordinatedRateLimitMiddleware': 950,
 }
 
 # Liste d'User-Agents pour la rotation
@@ -69,15 +175,29 @@ USER_AGENT_LIST = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0',
     'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:89.0) Gecko/20100101 Firefox/89.0',
 ]
-# Activer le support de Playwright
-PLAYWRIGHT_BROWSER_TYPE = "chromium"  # ou "firefox" ou "webkit"
-PLAYWRIGHT_LAUNCH_OPTIONS = {
-    "headless": True,  # Défini sur False si vous souhaitez voir le navigateur
-}
-
 TWISTED_REACTOR = 'twisted.internet.asyncioreactor.AsyncioSelectorReactor'
 
+# Réutilisation des connexions (kbo_scraper/connections.py)
 DOWNLOAD_HANDLERS = {
-    "http": "scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler",
-    "https": "scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler",
+    "http": "kbo_scraper.connections.PooledHTTPDownloadHandler",
+    "https": "kbo_scraper.connections.PooledHTTPDownloadHandler",
+    # Aucun spider ne télécharge en FTP ni sur S3 : pas de handler chargé au démarrage
+    "ftp": None,
+    "s3": None,
 }
+DOWNLOADER_CLIENTCONTEXTFACTORY = "kbo_scraper.connections.SessionResumingContextFactory"
+
+# Connexions inactives gardées par hôte (par défaut : CONCURRENT_REQUESTS_PER_DOMAIN)
+CONNECTION_POOL_MAX_PER_HOST = {
+    "www.ejustice.just.fgov.be": 1,
+    "consult.cbso.nbb.be": 2,
+    "kbopub.economie.fgov.be": 2,
+}
+# Secondes avant fermeture d'une connexion inactive, sous le keep-alive des serveurs
+CONNECTION_POOL_IDLE_TIMEOUT = 30
+
+# Cache DNS avec expiration
+DNS_RESOLVER = "kbo_scraper.connections.TTLCachingResolver"
+DNSCACHE_ENABLED = True
+DNSCACHE_SIZE = 1000
+DNS_CACHE_TTL = 300
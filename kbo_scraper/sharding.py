@@ -0,0 +1,32 @@
+# kbo_scraper/sharding.py
+"""Répartition des numéros d'entreprise entre plusieurs processus d'un même spider.
+
+Le shard d'un numéro est `crc32(chiffres) % N` : contrairement à `hash()`, dont la
+graine change à chaque processus pour les chaînes, le résultat est le même dans le
+runner et dans chaque worker, quel que soit le format du numéro ("0441.571.714",
+"0441571714").
+"""
+import re
+import zlib
+
+NON_DIGITS_RE = re.compile(r"\D")
+
+
+def shard_of(enterprise_number, count):
+    digits = NON_DIGITS_RE.sub("", str(enterprise_number))
+    return zlib.crc32(digits.encode("ascii")) % count
+
+
+def parse_shard(value):
+    """"2/8" -> (2, 8) ; None ou "" -> None (pas de découpage)."""
+    if not value:
+        return None
+    index, _, count = str(value).partition("/")
+    index, count = int(index), int(count)
+    if not 0 <= index < count:
+        raise ValueError(f"Shard invalide: {value}")
+    return index, count
+
+
+def in_shard(enterprise_number, shard):
+    return shard is None or shard_of(enterprise_number, shard[1]) == shard[0]
@@ -1,30 +1,33 @@
 # kbo_scraper/spiders/consult_spider.py
 import scrapy
-from kbo_scraper.items import KboScraperItem
+from kbo_scraper.enterprise_numbers import format_report, from_spider_args, record_stats, schedule, url_form
+from kbo_scraper.items import ConsultRecord
 
 
 class ConsultSpider(scrapy.Spider):
     name = "consult_spider"
     allowed_domains = ["consult.cbso.nbb.be"]
 
+    # Renseigné par NegativeCacheExtension quand NEGATIVE_CACHE_ENABLED
+    negative_cache = None
+    # Renseigné par DeadLetterExtension quand DEAD_LETTER_ENABLED
+    dead_letters = None
+
     custom_settings = {
         "LOG_LEVEL": "INFO",
     }
 
-    def __init__(self, enterprise_numbers=None, *args, **kwargs):
+    def __init__(self, enterprise_numbers=None, enterprise_numbers_file=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        # Accepter les numéros d'entreprise en paramètre
-        if enterprise_numbers:
-            if isinstance(enterprise_numbers, str):
-                # Si c'est une string, on assume que c'est séparé par des virgules
-                self.enterprise_numbers = [num.strip() for num in enterprise_numbers.split(',')]
-            elif isinstance(enterprise_numbers, list):
-                self.enterprise_numbers = enterprise_numbers
-            else:
-                self.enterprise_numbers = []
-        else:
-            self.enterprise_numbers = []
+        # Numéros en paramètre (liste séparée par des virgules) ou fichier .npz (numéros et
+        # priorités) préparé par le runner ; seuls les numéros valides (clé de contrôle), sans
+        # doublons, sont gardés, dans l'ordre de priorité calculé par le runner
+        prepared = from_spider_args(enterprise_numbers, enterprise_numbers_file)
+        self.numbers_report = prepared.report
+        self.enterprise_numbers, self.url_numbers, self.priorities = schedule(prepared, self.name)
+        if prepared.rejected or prepared.report["duplicates"]:
+            self.logger.warning(format_report(prepared.report))
 
         self.logger.info(f"Spider initialisé avec {len(self.enterprise_numbers)} numéros d'entreprise")
 
@@ -32,20 +35,34 @@ class ConsultSpider(scrapy.Spider):
         if not self.enterprise_numbers:
             self.logger.warning("Aucun numéro d'entreprise fourni. Spider arrêté.")
             return
+        record_stats(self.crawler.stats, self.numbers_report)
+        rows = zip(self.enterprise_numbers, self.url_numbers, self.priorities)
+        if self.negative_cache is not None:
+            # Résultats vides récents : pas de requête avant la date du prochain contrôle
+            rows = self.negative_cache.filter_due(self.name, rows)
+
+        for numero, numero_clean, priority in rows:
+            yield self.enterprise_request(numero, numero_clean, priority)
 
-        for numero in self.enterprise_numbers:
-            numero_clean = numero.replace(".", "").strip()
-            api_url = (
-                "https://consult.cbso.nbb.be/api/rs-consult/published-deposits"
-                f"?page=0&size=50&enterpriseNumber={numero_clean}"
-                "&sort=periodEndDate,desc&sort=depositDate,desc"
-            )
-            yield scrapy.Request(
-                api_url,
-                callback=self.parse_api,
-                meta={"enterprise_number": numero, "url": api_url},
-                errback=self.errback,
-            )
+    def enterprise_request(self, numero, numero_clean=None, priority=0):
+        """Dépôts d'une entreprise (aussi pour relancer un échec)"""
+        numero_clean = numero_clean or url_form(numero, self.name)
+        api_url = (
+            "https://consult.cbso.nbb.be/api/rs-consult/published-deposits"
+            f"?page=0&size=50&enterpriseNumber={numero_clean}"
+            "&sort=periodEndDate,desc&sort=depositDate,desc"
+        )
+        meta = {"enterprise_number": numero, "url": api_url}
+        if self.dead_letters is not None:
+            # Les échecs partent dans la file au lieu d'être réessayés tout de suite
+            meta["dont_retry"] = True
+        return scrapy.Request(
+            api_url,
+            callback=self.parse_api,
+            meta=meta,
+            priority=priority,
+            errback=self.errback,
+        )
 
     def parse_api(self, response):
         enterprise_number = response.meta["enterprise_number"]
@@ -61,13 +78,23 @@ class ConsultSpider(scrapy.Spider):
                 "language": dep.get("language", "").strip(),
             })
 
-        item = KboScraperItem()
-        item["enterprise_number"] = enterprise_number
-        item["url"] = response.meta["url"]
-        item["deposits"] = deposits
+        if self.dead_letters is not None:
+            self.dead_letters.resolve(self.name, enterprise_number)
+        if self.negative_cache is not None:
+            self.negative_cache.record(self.name, enterprise_number, bool(deposits), "no_deposits")
 
-        yield item
+        yield ConsultRecord(
+            enterprise_number=enterprise_number,
+            url=response.meta["url"],
+            deposits=deposits,
+        )
 
     def errback(self, failure):
         request = failure.request
-        self.logger.error(f"Erreur pour {request.url}: {repr(failure.value)}")
\ No newline at end of file
+        self.logger.error(f"Erreur pour {request.url}: {repr(failure.value)}")
+        if self.dead_letters is not None:
+            # Module déjà chargé par DeadLetterExtension (pymongo) quand la file est active
+            from kbo_scraper.dead_letters import failure_reason
+
+            self.dead_letters.push(self.name, request.meta["enterprise_number"], request.url,
+                                   failure_reason(failure))
\ No newline at end of file
@@ -1,13 +1,28 @@
 import scrapy
 import re
 import json
-from urllib.parse import urljoin
+
+from kbo_scraper import extractors
+from kbo_scraper.enterprise_numbers import format_report, from_spider_args, record_stats, schedule, url_form
+from kbo_scraper.items import PublicationContentRecord, PublicationRecord
+from kbo_scraper.moniteur_pdf import publication_key
 
 
 class EjusticeSpider(scrapy.Spider):
     name = "ejustice_spider"
     allowed_domains = ["www.ejustice.just.fgov.be", "ejustice.just.fgov.be"]
 
+    # Renseigné par ExtractionPoolExtension quand EXTRACTION_POOL_WORKERS > 0
+    extraction_pool = None
+    # Renseigné par NegativeCacheExtension quand NEGATIVE_CACHE_ENABLED
+    negative_cache = None
+    # Renseigné par DeadLetterExtension quand DEAD_LETTER_ENABLED
+    dead_letters = None
+    # Renseigné par MoniteurPdfExtension quand MONITEUR_PDF_DIR
+    pdf_extractor = None
+    # Backend de parsing HTML (HTML_PARSER_BACKEND), lu au démarrage
+    html_parser = "parsel"
+
     custom_settings = {
         'ROBOTSTXT_OBEY': False,
         'DOWNLOAD_DELAY': 2.0,
@@ -16,45 +31,74 @@ class EjusticeSpider(scrapy.Spider):
         'LOG_LEVEL': 'INFO',
     }
 
-    def __init__(self, enterprise_numbers=None, *args, **kwargs):
+    def __init__(self, enterprise_numbers=None, enterprise_numbers_file=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        # Accepter les numéros d'entreprise en paramètre
-        if enterprise_numbers:
-            if isinstance(enterprise_numbers, str):
-                # Si c'est une string, on assume que c'est séparé par des virgules
-                self.enterprise_numbers = [num.strip() for num in enterprise_numbers.split(',')]
-            elif isinstance(enterprise_numbers, list):
-                self.enterprise_numbers = enterprise_numbers
-            else:
-                self.enterprise_numbers = []
-        else:
-            self.enterprise_numbers = []
+        # Numéros en paramètre (liste séparée par des virgules) ou fichier .npz (numéros et
+        # priorités) préparé par le runner ; seuls les numéros valides (clé de contrôle), sans
+        # doublons, sont gardés, dans l'ordre de priorité calculé par le runner
+        prepared = from_spider_args(enterprise_numbers, enterprise_numbers_file)
+        self.numbers_report = prepared.report
+        self.enterprise_numbers, self.url_numbers, self.priorities = schedule(prepared, self.name)
+        if prepared.rejected or prepared.report["duplicates"]:
+            self.logger.warning(format_report(prepared.report))
 
         self.logger.info(f"Spider initialisé avec {len(self.enterprise_numbers)} numéros d'entreprise")
 
     def start_requests(self):
+        self.html_parser = extractors.check_parser_backend(self.settings.get("HTML_PARSER_BACKEND", "parsel"))
         if not self.enterprise_numbers:
             self.logger.warning("Aucun numéro d'entreprise fourni. Spider arrêté.")
             return
-
-        for numero in self.enterprise_numbers:
-            numero_clean = numero.replace(".", "").strip()
-            if numero_clean.startswith("0"):
-                numero_clean = numero_clean[1:]
-            url = f"https://www.ejustice.just.fgov.be/cgi_tsv/list.pl?btw={numero_clean}"
-            yield scrapy.Request(
-                url,
-                callback=self.parse_list,
-                meta={
-                    "enterprise_number": numero,
-                    # publications_acc est l'accumulateur qui va suivre toutes les pages
-                    "publications_acc": []
-                },
-                dont_filter=True,
-            )
+        record_stats(self.crawler.stats, self.numbers_report)
+        rows = zip(self.enterprise_numbers, self.url_numbers, self.priorities)
+        if self.negative_cache is not None:
+            # Résultats vides récents : pas de requête avant la date du prochain contrôle
+            rows = self.negative_cache.filter_due(self.name, rows)
+
+        for numero, numero_clean, priority in rows:
+            yield self.enterprise_request(numero, numero_clean, priority)
+
+    def enterprise_request(self, numero, numero_clean=None, priority=0):
+        """Première page de résultats d'une entreprise (aussi pour relancer un échec)"""
+        numero_clean = numero_clean or url_form(numero, self.name)
+        url = f"https://www.ejustice.just.fgov.be/cgi_tsv/list.pl?btw={numero_clean}"
+        return scrapy.Request(
+            url,
+            callback=self.parse_list,
+            errback=self.errback,
+            meta={
+                "enterprise_number": numero,
+                # publications_acc est l'accumulateur qui va suivre toutes les pages
+                "publications_acc": [],
+                **self.retry_meta(),
+            },
+            priority=priority,
+            dont_filter=True,
+        )
+
+    def retry_meta(self):
+        # Avec la file des échecs, pas de réessai immédiat qui garderait l'unique slot
+        return {"dont_retry": True} if self.dead_letters is not None else {}
 
     def parse_list(self, response):
+        enterprise_number = response.meta["enterprise_number"]
+        if self.extraction_pool is not None:
+            return self.parse_list_offloaded(response, enterprise_number)
+        sel = extractors.response_selector(response, "publication_list", self.html_parser)
+        page = extractors.extract_publication_list(sel, response.url, enterprise_number)
+        return self.follow_list(response, page)
+
+    async def parse_list_offloaded(self, response, enterprise_number):
+        """Même extraction, exécutée dans le pool de processus (EXTRACTION_POOL_WORKERS)"""
+        page = await self.extraction_pool.extract(
+            extractors.extract_publication_list_from_body, response, enterprise_number, self.html_parser
+        )
+        for result in self.follow_list(response, page):
+            yield result
+
+    def follow_list(self, response, page):
+        """Accumule les publications de la page et suit la pagination"""
         enterprise_number = response.meta["enterprise_number"]
         publications_acc = response.meta.get("publications_acc", [])
         visited_pages = response.meta.get("visited_pages", set())
@@ -65,62 +109,19 @@ class EjusticeSpider(scrapy.Spider):
         visited_pages.add(current_page)
 
         # Récupération des publications
-        items = response.xpath('//div[@class="list-item"]')
-        if not items:
+        if not page["publications"]:
             self.logger.info(f"Page vide détectée -> fin pagination pour {enterprise_number}")
+            self.record_result(enterprise_number, publications_acc)
             if publications_acc:
-                yield {
-                    "enterprise_number": enterprise_number,
-                    "moniteur_publications": json.dumps(publications_acc, ensure_ascii=False),
-                }
+                yield from self.publication_results(enterprise_number, publications_acc)
             return
 
-        for item in items:
-            content = item.xpath('.//div[@class="list-item--content"]')
-
-            subtitle_text = content.xpath('.//p[contains(@class,"list-item--subtitle")]//text()').getall()
-            subtitle_text = [t.strip() for t in subtitle_text if t.strip()]
-            publication_code = subtitle_text[-1] if subtitle_text else None
-
-            title_lines = content.xpath('.//a[contains(@class,"list-item--title")]//text()').getall()
-            title_lines = [line.strip() for line in title_lines if line.strip()]
-
-            address = title_lines[0] if len(title_lines) > 0 else None
-            type_pub = title_lines[2] if len(title_lines) > 2 else None
-
-            date_ref_match = re.search(r'(\d{4}-\d{2}-\d{2})\s*/\s*(\d+)', ' '.join(title_lines))
-            publication_date, publication_ref = (date_ref_match.groups() if date_ref_match else (None, None))
-
-            pdf_href = content.xpath('.//a[@class="standard"]/@href').get()
-            pdf_url = urljoin(response.url, pdf_href) if pdf_href else None
-
-            detail_link = content.xpath('.//a[contains(@class,"read-more")]/@href').get()
-            detail_url = urljoin(response.url, detail_link) if detail_link else None
-
-            title = type_pub or ' - '.join(title_lines) or publication_code or address or ""
-            publication_number = publication_ref or publication_code or None
-
-            publications_acc.append({
-                "enterprise_number": enterprise_number,
-                "title": title,
-                "publication_number": publication_number,
-                "publication_date": publication_date,
-                "address": address,
-                "type_publication": type_pub,
-                "publication_code": publication_code,
-                "publication_ref": publication_ref,
-                "pdf_url": pdf_url,
-                "detail_url": detail_url
-            })
+        publications_acc.extend(page["publications"])
 
         # Pagination
-        next_page = response.xpath(
-            '//div[contains(@class,"pagination-container")]//a[contains(@class,"pagination-next")]/@href'
-        ).get()
-
-        if next_page:
-            next_url = urljoin(response.url, next_page)
+        next_url = page["next_page"]
 
+        if next_url:
             # Numéro de la prochaine page
             next_match = re.search(r'page=(\d+)', next_url)
             next_num = int(next_match.group(1)) if next_match else None
@@ -132,20 +133,102 @@ class EjusticeSpider(scrapy.Spider):
                 yield scrapy.Request(
                     next_url,
                     callback=self.parse_list,
+                    errback=self.errback,
                     meta={
                         "enterprise_number": enterprise_number,
                         "publications_acc": publications_acc,
-                        "visited_pages": visited_pages
+                        "visited_pages": visited_pages,
+                        **self.retry_meta(),
                     },
+                    priority=response.request.priority,
                     dont_filter=True
                 )
                 return
 
         # Si pas de next_page OU boucle détectée → yield final
+        self.record_result(enterprise_number, publications_acc)
         if publications_acc:
-            yield {
-                "enterprise_number": enterprise_number,
-                "moniteur_publications": json.dumps(publications_acc, ensure_ascii=False),
-            }
+            yield from self.publication_results(enterprise_number, publications_acc)
         else:
-            self.logger.info(f"Aucune publication trouvée pour {enterprise_number} (toutes pages).")
\ No newline at end of file
+            self.logger.info(f"Aucune publication trouvée pour {enterprise_number} (toutes pages).")
+
+    def publication_results(self, enterprise_number, publications):
+        """Item des publications, puis textes et requêtes des PDF absents de moniteur_contents
+        (MONITEUR_PDF_DIR)"""
+        followups = []
+        if self.pdf_extractor is not None:
+            keyed = [(publication_key(publication), publication) for publication in publications
+                     if publication.get("pdf_url")]
+            keyed = [(key, publication) for key, publication in keyed if key]
+            written = self.pdf_extractor.written_keys(enterprise_number, [key for key, _ in keyed])
+            self.pdf_extractor.inc("skipped", len(written))
+            for key, publication in keyed:
+                if key in written:
+                    continue
+                # Déjà extrait dans le dépôt mais pas dans Mongo : renvoyé sans téléchargement
+                text = self.pdf_extractor.stored_text(key)
+                if text is not None:
+                    followups.append(PublicationContentRecord(
+                        enterprise_number=enterprise_number,
+                        pdf_url=publication["pdf_url"],
+                        publication_key=key,
+                        full_content=text,
+                    ))
+                elif self.pdf_extractor.wanted(key, enterprise_number):
+                    followups.append(self.pdf_request(publication["pdf_url"], key))
+
+        yield PublicationRecord(
+            enterprise_number=enterprise_number,
+            moniteur_publications=json.dumps(publications, ensure_ascii=False),
+        )
+        yield from followups
+
+    def pdf_request(self, pdf_url, key):
+        # Après les pages de liste : le PDF ne retarde pas les publications suivantes
+        return scrapy.Request(
+            pdf_url,
+            callback=self.parse_pdf,
+            errback=self.pdf_errback,
+            meta={"publication_key": key, "pdf_url": pdf_url},
+            priority=-100,
+            dont_filter=True,
+        )
+
+    async def parse_pdf(self, response):
+        key = response.meta["publication_key"]
+        numbers = self.pdf_extractor.release(key)
+        if not response.body.startswith(b"%PDF"):
+            self.logger.warning(f"Pas un PDF ({response.headers.get('Content-Type')}): {response.url}")
+            self.crawler.stats.inc_value("moniteur_pdf/not_pdf")
+            return
+        text = await self.pdf_extractor.process(key, response.body, response.url)
+        for enterprise_number in numbers:
+            yield PublicationContentRecord(
+                enterprise_number=enterprise_number,
+                pdf_url=response.meta["pdf_url"],
+                publication_key=key,
+                full_content=text,
+            )
+
+    def pdf_errback(self, failure):
+        # Pas de file des échecs : le PDF sera redemandé au prochain passage sur l'entreprise
+        self.pdf_extractor.release(failure.request.meta["publication_key"])
+        self.crawler.stats.inc_value("moniteur_pdf/failed")
+        self.logger.error(f"Erreur PDF pour {failure.request.url}: {repr(failure.value)}")
+
+    def record_result(self, enterprise_number, publications):
+        if self.dead_letters is not None:
+            self.dead_letters.resolve(self.name, enterprise_number)
+        if self.negative_cache is not None:
+            self.negative_cache.record(self.name, enterprise_number, bool(publications), "no_publications")
+
+    def errback(self, failure):
+        request = failure.request
+        self.logger.error(f"Erreur pour {request.url}: {repr(failure.value)}")
+        # Échec sur une page suivante : l'entreprise sera reprise depuis la première page
+        if self.dead_letters is not None:
+            # Module déjà chargé par DeadLetterExtension (pymongo) quand la file est active
+            from kbo_scraper.dead_letters import failure_reason
+
+            self.dead_letters.push(self.name, request.meta["enterprise_number"], request.url,
+                                   failure_reason(failure))
@@ -6,39 +6,164 @@ Usage:
   python run_spiders.py --spider ejustice_spider --limit 5
   python run_spiders.py --spider consult_spider --limit 20
   python run_spiders.py --spider all --limit 10
+  python run_spiders.py --spider all --limit 1000 --workers 4 --host-rate 2
+  python run_spiders.py --spider ejustice_spider --recheck-empty
+  python run_spiders.py --spider all --retry-failed
   python run_spiders.py --spider kbo_spider --diagnose
+  python run_spiders.py --migrate-schema --batch-size 1000
+  python run_spiders.py --import-open-data ./KboOpenData --spider kbo_spider --complement
+  python run_spiders.py --spider all --feed-dir ./exports --feed-format parquet,jsonl.zst
+  python run_spiders.py --export ./exports --feed-format parquet
+  python run_spiders.py --spider all --change-log ./changes
+  python run_spiders.py --change-log ./changes --read-changes mon_abonne --limit 500
+  python run_spiders.py --serve-api 8700 --change-log ./changes
+  python run_spiders.py --spider all --search-index ./search
+  python run_spiders.py --search-index ./search --rebuild-search-index
+  python run_spiders.py --search-index ./search --search "veneco" --search-mode fuzzy
+  python run_spiders.py --spider kbo_spider --graph-index ./graph
+  python run_spiders.py --graph-index ./graph --rebuild-graph-index
+  python run_spiders.py --graph-index ./graph --graph "0200.065.765" --hops 2
+  python run_spiders.py --spider ejustice_spider --moniteur-pdf ./moniteur_pdf --moniteur-pdf-workers 4
 """
 import argparse
+import json
+import logging
 import pymongo
+import re
 import subprocess
 import sys
 import os
+import threading
 import time
-from typing import List, Optional
+from collections import deque
+from datetime import datetime
+from decimal import Decimal
+from logging.handlers import RotatingFileHandler
+from typing import List, Optional, Tuple
+
+from kbo_scraper.api import ReadAPI
+from kbo_scraper.changes import CHANGE_OFFSETS_COLLECTION, ChangeConsumer, purge_segments
+from kbo_scraper.dead_letters import DEAD_LETTERS_COLLECTION, EXHAUSTED, DeadLetterQueue
+from kbo_scraper.enterprise_numbers import format_report, prepare, split_shards
+from kbo_scraper.enterprise_numbers import save as save_numbers
+from kbo_scraper.feeds import check_formats, export_collection
+from kbo_scraper.graph import KIND_NAMES, GraphIndex
+from kbo_scraper.graph import rebuild as rebuild_graph_index
+from kbo_scraper.indexes import (
+    ENTERPRISE_NUMBERS_HINT,
+    ENTERPRISE_NUMBERS_PROJECTION,
+    ENTERPRISE_NUMBERS_QUERY,
+    IndexCreationError,
+    describe_plan,
+    ensure_indexes,
+)
+from kbo_scraper.normalize import type_registry
+from kbo_scraper.opendata import KBO_PAGE_PENDING, LEGACY_PENDING_QUERY, import_documents, iter_documents
+from kbo_scraper.priority import (
+    CANDIDATE_FACTOR,
+    priority_projection,
+    refresh_index,
+    spider_timestamp_field,
+    top_numbers,
+)
+from kbo_scraper.ratelimit import RateCoordinator
+from kbo_scraper.schema import SCHEMA_VERSION, migrate_document
+from kbo_scraper.search import FIELDS as SEARCH_FIELDS, SearchIndex
+from kbo_scraper.search import rebuild as rebuild_search_index
+
+
+# Ligne périodique de l'extension LogStats de Scrapy
+LOGSTATS_RE = re.compile(
+    r"Crawled (\d+) pages \(at (\d+) pages/min\), scraped (\d+) items \(at (\d+) items/min\)"
+)
+
+
+def load_stats(stats_path: str) -> dict:
+    try:
+        with open(stats_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def merge_stats(all_stats: List[dict]) -> dict:
+    """Additionne les compteurs des workers ; durée = celle du plus long"""
+    merged = {}
+    for stats in all_stats:
+        for key, value in stats.items():
+            if key == "elapsed_time_seconds":
+                merged[key] = max(merged.get(key, 0), value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                merged[key] = merged.get(key, 0) + value
+            elif key == "finish_reason":
+                merged.setdefault(key, value)
+                if value != merged[key]:
+                    merged[key] = "mixed"
+    return merged
+
+
+def spider_host_rate(spider_name: str) -> float:
+    """Débit par hôte du spider lancé seul (1 / DOWNLOAD_DELAY, ou le délai de départ
+    d'AutoThrottle sans DOWNLOAD_DELAY), que le coordinateur garde pour N workers"""
+    from scrapy.spiderloader import SpiderLoader
+    from scrapy.utils.project import get_project_settings
+
+    settings = get_project_settings()
+    spidercls = SpiderLoader.from_settings(settings).load(spider_name)
+    spidercls.update_settings(settings)
+    delay = settings.getfloat("DOWNLOAD_DELAY")
+    if delay <= 0 and settings.getbool("AUTOTHROTTLE_ENABLED"):
+        delay = settings.getfloat("AUTOTHROTTLE_START_DELAY")
+    return 1.0 / delay if delay > 0 else 1.0
 
 
 class SpiderRunner:
-    def __init__(self, mongo_uri: str = "mongodb://localhost:27017", mongo_db: str = "kbo_db"):
+    def __init__(self, mongo_uri: str = "mongodb://localhost:27017", mongo_db: str = "kbo_db",
+                 run_dir: Optional[str] = None, progress_interval: int = 15,
+                 workers: int = 1, host_rate: Optional[float] = None, negative_cache: bool = True,
+                 feed_dir: Optional[str] = None, feed_formats: Optional[List[str]] = None,
+                 change_log: Optional[str] = None, search_index: Optional[str] = None,
+                 graph_index: Optional[str] = None, moniteur_pdf: Optional[str] = None,
+                 moniteur_pdf_workers: int = 2):
         self.mongo_uri = mongo_uri
         self.mongo_db = mongo_db
-
-    def test_mongodb_connection(self) -> bool:
+        # Un dossier par exécution : logs rotatifs et stats de chaque spider
+        self.run_dir = run_dir or os.path.join("runs", datetime.now().strftime("%Y%m%d_%H%M%S"))
+        self.progress_interval = progress_interval
+        self.workers = workers
+        self.host_rate = host_rate
+        self.negative_cache = negative_cache
+        self.feed_dir = feed_dir
+        self.feed_formats = feed_formats or ["parquet", "jsonl.zst"]
+        self.change_log = change_log
+        self.search_index = search_index
+        self.graph_index = graph_index
+        self.moniteur_pdf = moniteur_pdf
+        self.moniteur_pdf_workers = moniteur_pdf_workers
+        self.log_max_bytes = 50 * 1024 * 1024
+        self.log_backups = 5
+        self.tail_lines = 50
+        self.results = {}
+        self.number_reports = {}
+
+    def test_mongodb_connection(self, out=None) -> bool:
         """Test la connexion à MongoDB"""
+        out = out or sys.stdout
         try:
             client = pymongo.MongoClient(self.mongo_uri, serverSelectionTimeoutMS=5000)
             client.server_info()  # Force une connexion
             client.close()
-            print("✅ Connexion MongoDB réussie")
+            print("✅ Connexion MongoDB réussie", file=out)
             return True
         except Exception as e:
-            print(f"❌ Impossible de se connecter à MongoDB: {e}")
-            print(f"🔍 Vérifiez que MongoDB est démarré et accessible sur {self.mongo_uri}")
+            print(f"❌ Impossible de se connecter à MongoDB: {e}", file=out)
+            print(f"🔍 Vérifiez que MongoDB est démarré et accessible sur {self.mongo_uri}", file=out)
             return False
 
-    def diagnose_database(self) -> None:
-        """Diagnostic de la base de données"""
+    def diagnose_database(self) -> bool:
+        """Diagnostic de la base de données (False si les index ne peuvent pas être créés)"""
         try:
-            client = pymongo.MongoClient(self.mongo_uri)
+            client = pymongo.MongoClient(self.mongo_uri, type_registry=type_registry())
             db = client[self.mongo_db]
 
             print(f"\n🔍 Diagnostic de la base '{self.mongo_db}':")
@@ -49,8 +174,8 @@ class SpiderRunner:
             print(f"Collections trouvées: {collections}")
 
             if "entreprises" in collections:
-                count = db.entreprises.count_documents({})
-                print(f"📊 Nombre d'entreprises: {count}")
+                count = db.entreprises.estimated_document_count()
+                print(f"📊 Nombre d'entreprises (estimation): {count}")
 
                 if count > 0:
                     # Échantillon de données
@@ -61,152 +186,762 @@ class SpiderRunner:
                             print(f"📝 Exemple de numéro: {sample['enterprise_number']}")
                 else:
                     print("⚠️  Collection vide")
+
+                ensure_indexes(db.entreprises)
+                self.diagnose_indexes(db.entreprises)
             else:
                 print("❌ Collection 'entreprises' non trouvée")
 
             client.close()
             print("-" * 40)
 
+        except IndexCreationError as e:
+            print(f"❌ {e}")
+            return False
         except Exception as e:
             print(f"❌ Erreur lors du diagnostic: {e}")
-
-    def get_enterprise_numbers(self, limit: Optional[int] = None) -> List[str]:
-        """Récupère les numéros d'entreprise depuis MongoDB"""
+        return True
+
+    def diagnose_indexes(self, collection) -> None:
+        """Affiche les index présents et le plan des requêtes du runner et du pipeline"""
+        indexes = sorted(collection.index_information())
+        print(f"🗂️  Index: {indexes}")
+
+        sample = collection.find_one(ENTERPRISE_NUMBERS_QUERY, ENTERPRISE_NUMBERS_PROJECTION)
+        sample_number = sample["enterprise_number"] if sample else ""
+
+        numbers_cursor = collection.find(ENTERPRISE_NUMBERS_QUERY, ENTERPRISE_NUMBERS_PROJECTION)
+        if ENTERPRISE_NUMBERS_HINT in indexes:
+            numbers_cursor = numbers_cursor.hint(ENTERPRISE_NUMBERS_HINT)
+
+        queries = {
+            "liste des numéros (runner)": numbers_cursor,
+            "upsert par numéro (pipeline)": collection.find(
+                {"enterprise_number": sample_number}, {"_id": 1}
+            ),
+            "plus anciens last_scraped (priorité kbo)": collection.find(
+                ENTERPRISE_NUMBERS_QUERY, priority_projection("kbo_spider")
+            ).sort("last_scraped", 1).limit(100),
+            "entreprises à compléter (--complement)": collection.find(
+                {KBO_PAGE_PENDING: True}, priority_projection("kbo_spider")
+            ).limit(100),
+            "actives fondées avant 1970": collection.find(
+                {"status": "Actif", "start_date": {"$lt": datetime(1970, 1, 1)}}, {"enterprise_number": 1, "_id": 0}
+            ),
+            "actives au capital > 1 M EUR": collection.find(
+                {"status": "Actif", "financial_data.capital.amount": {"$gt": Decimal("1000000")}},
+                {"enterprise_number": 1, "_id": 0},
+            ),
+        }
+
+        for label, cursor in queries.items():
+            try:
+                plan = describe_plan(cursor.explain())
+            except Exception as e:
+                print(f"   ❌ {label}: explain impossible ({e})")
+                continue
+            marker = "✅ couverte" if plan["covered"] else "⚠️  lit les documents"
+            print(f"   {label}: {plan['stages']} - {marker} "
+                  f"(clés: {plan['keys_examined']}, documents: {plan['docs_examined']})")
+
+    def get_prioritized_numbers(self, spider_name: str,
+                                limit: Optional[int] = None) -> Tuple[List[str], List[int]]:
+        """Numéros d'entreprise classés par intérêt à rafraîchir pour `spider_name` (statut,
+        ancienneté du dernier passage, changements récents) ; avec `limit`, seuls les
+        `limit` premiers sont retenus (budget de requêtes)"""
         try:
             client = pymongo.MongoClient(self.mongo_uri)
-            db = client[self.mongo_db]
-
-            # Vérifier d'abord si la collection existe et contient des données
-            if "entreprises" not in db.list_collection_names():
-                print("❌ Collection 'entreprises' n'existe pas dans MongoDB")
-                client.close()
-                return []
-
-            # Compter le nombre total de documents
-            total_count = db.entreprises.count_documents({})
-            print(f"📊 {total_count} entreprises trouvées dans la base")
-
-            if total_count == 0:
-                print("❌ Aucune entreprise trouvée dans la collection")
-                client.close()
-                return []
-
-            # Récupérer les numéros d'entreprise
-            query = {"enterprise_number": {"$exists": True, "$ne": None}}
-            projection = {"enterprise_number": 1}
-
+            collection = client[self.mongo_db].entreprises
+            indexes = ensure_indexes(collection)
+            # Plus anciens passages d'abord, lus dans l'index `refresh_<champ>` (requête couverte) ;
+            # avec une limite, le score ne départage que les CANDIDATE_FACTOR * limit plus anciens
+            field = spider_timestamp_field(spider_name)
+            index_name, _ = refresh_index(field)
+            cursor = collection.find(ENTERPRISE_NUMBERS_QUERY, priority_projection(spider_name),
+                                     batch_size=10000).sort(field, 1)
+            if index_name in indexes:
+                cursor = cursor.hint(index_name)
             if limit:
-                cursor = db.entreprises.find(query, projection).limit(limit)
-                print(f"🔍 Récupération de {limit} numéros d'entreprise maximum...")
-            else:
-                cursor = db.entreprises.find(query, projection)
-                print(f"🔍 Récupération de tous les numéros d'entreprise...")
+                cursor = cursor.limit(limit * CANDIDATE_FACTOR)
+            enterprise_numbers, priorities = top_numbers(cursor, spider_name, limit)
+            client.close()
+        except Exception as e:
+            print(f"❌ Erreur lors de la récupération des données MongoDB: {e}")
+            return [], []
+
+        if enterprise_numbers:
+            print(f"✅ {len(enterprise_numbers)} numéros d'entreprise retenus pour {spider_name} "
+                  f"(priorité {max(priorities)} à {min(priorities)})")
+        else:
+            print("⚠️  Aucun numéro d'entreprise valide trouvé")
+        return enterprise_numbers, priorities
+
+    def get_failed_enterprise_numbers(self, spider_name: str, limit: Optional[int] = None) -> List[str]:
+        """Numéros de la file des échecs (dead_letters) dont le réessai est dû"""
+        client = pymongo.MongoClient(self.mongo_uri)
+        collection = client[self.mongo_db][DEAD_LETTERS_COLLECTION]
+        enterprise_numbers = DeadLetterQueue(collection).due(spider_name, limit=limit or 0)
+        exhausted = collection.count_documents({"spider": spider_name, "status": EXHAUSTED})
+        client.close()
+
+        print(f"📮 {spider_name}: {len(enterprise_numbers)} requêtes en échec à relancer"
+              + (f" ({exhausted} abandonnées après trop d'essais)" if exhausted else ""))
+        return enterprise_numbers
+
+    def retry_failed(self, spider_names: List[str], limit: Optional[int] = None,
+                     extra_args: Optional[List[str]] = None) -> bool:
+        """Vide la file des échecs : relance les entrées dues de chaque spider"""
+        all_success = True
+        for spider_name in spider_names:
+            enterprise_numbers = self.get_failed_enterprise_numbers(spider_name, limit)
+            if enterprise_numbers:
+                extra = extra_args if spider_name == "kbo_spider" else None
+                all_success = self.run_spider(spider_name, enterprise_numbers, extra) and all_success
+        return all_success
+
+    def migrate_schema(self, batch_size: int = 1000) -> int:
+        """Réécrit par lots les documents d'un ancien schéma vers la version courante"""
+        # Montants typés écrits en Decimal128 (kbo_scraper/normalize.py)
+        client = pymongo.MongoClient(self.mongo_uri, type_registry=type_registry())
+        collection = client[self.mongo_db].entreprises
+        ensure_indexes(collection)
+
+        # Curseur en flux : seuls `batch_size` documents sont en mémoire à la fois
+        cursor = collection.find(
+            {"schema_version": {"$ne": SCHEMA_VERSION}}, batch_size=batch_size
+        )
+        operations = []
+        migrated = 0
+        start = time.time()
+
+        for doc in cursor:
+            migration = migrate_document(doc)
+            if migration is None:
+                continue
+            to_set, to_unset = migration
+            update = {"$set": to_set}
+            if to_unset:
+                update["$unset"] = to_unset
+            operations.append(pymongo.UpdateOne({"_id": doc["_id"]}, update))
+
+            if len(operations) >= batch_size:
+                migrated += collection.bulk_write(operations, ordered=False).modified_count
+                operations = []
+                print(f"🔄 {migrated} documents migrés ({time.time() - start:.1f}s)")
+
+        if operations:
+            migrated += collection.bulk_write(operations, ordered=False).modified_count
+
+        client.close()
+        print(f"✅ Migration vers le schéma v{SCHEMA_VERSION} terminée: {migrated} documents")
+        return migrated
+
+    def import_open_data(self, directory: str, batch_size: int = 1000) -> dict:
+        """Importe le dump CSV de KBO Open Data (jointure en flux, upserts par lots)"""
+        client = pymongo.MongoClient(self.mongo_uri)
+        collection = client[self.mongo_db].entreprises
+        ensure_indexes(collection)
+
+        print(f"📥 Import de KBO Open Data depuis {directory}...")
+        start = time.time()
+        counts = import_documents(collection, iter_documents(directory), batch_size)
+        # Entreprises importées avant l'indicateur kbo_page_pending : posé une fois ici
+        backfilled = collection.update_many(LEGACY_PENDING_QUERY, {"$set": {KBO_PAGE_PENDING: True}}).modified_count
+        if backfilled:
+            print(f"🏷️  {backfilled} entreprises importées auparavant marquées à compléter")
+        outdated = collection.count_documents({"schema_version": {"$ne": SCHEMA_VERSION}})
+        client.close()
+
+        print(f"✅ Import terminé en {time.time() - start:.1f}s: {counts['read']} entreprises lues, "
+              f"{counts['inserted']} créées, {counts['modified']} mises à jour")
+        if outdated:
+            print(f"⚠️  {outdated} documents d'un schéma antérieur à v{SCHEMA_VERSION} : "
+                  f"lancez --migrate-schema")
+        return counts
+
+    def export_feeds(self, directory: str, batch_size: int = 1000) -> dict:
+        """Exporte la collection entreprises en Parquet / Arrow / JSONL zstd (curseur par lots)"""
+        try:
+            check_formats(self.feed_formats)
+        except (ValueError, ImportError) as e:
+            print(f"❌ Export impossible: {e}")
+            return {}
 
-            enterprise_numbers = []
-            for doc in cursor:
-                if "enterprise_number" in doc and doc["enterprise_number"]:
-                    enterprise_numbers.append(doc["enterprise_number"])
+        client = pymongo.MongoClient(self.mongo_uri)
+        collection = client[self.mongo_db].entreprises
 
+        print(f"📦 Export de {collection.full_name} vers {directory} ({', '.join(self.feed_formats)})...")
+        start = time.time()
+        try:
+            rows, files = export_collection(collection, directory, self.feed_formats, batch_size)
+        finally:
             client.close()
 
-            print(f"✅ {len(enterprise_numbers)} numéros d'entreprise valides récupérés depuis MongoDB")
+        details = ", ".join(f"{table}: {count}" for table, count in sorted(rows.items())) or "aucune ligne"
+        print(f"✅ Export terminé en {time.time() - start:.1f}s: {len(files)} fichier(s) ({details})")
+        return rows
 
-            if len(enterprise_numbers) == 0:
-                print("⚠️  Aucun numéro d'entreprise valide trouvé")
-                print("💡 Vérifiez que le champ 'enterprise_number' existe et n'est pas vide")
+    def read_changes(self, consumer_name: str, limit: Optional[int] = None) -> int:
+        """Écrit sur stdout (JSONL) les modifications pas encore lues par `consumer_name`,
+        avance sa position puis supprime les segments lus par tous les consommateurs"""
+        client = pymongo.MongoClient(self.mongo_uri)
+        offsets = client[self.mongo_db][CHANGE_OFFSETS_COLLECTION]
+        consumer = ChangeConsumer(self.change_log, offsets, consumer_name)
+        try:
+            records = consumer.poll(limit or 1000)
+            for record in records:
+                print(json.dumps(record, ensure_ascii=False))
+            if records:
+                consumer.commit(records[-1]["offset"] + 1)
+            purged = purge_segments(self.change_log, offsets)
+        finally:
+            client.close()
 
-            return enterprise_numbers
+        # Sur stderr : stdout ne contient que les enregistrements
+        print(f"📜 {len(records)} modification(s) lue(s) par {consumer_name}, "
+              f"{purged} segment(s) purgé(s)", file=sys.stderr)
+        return len(records)
 
-        except Exception as e:
-            print(f"❌ Erreur lors de la récupération des données MongoDB: {e}")
-            print(f"🔍 Détails: {str(e)}")
+    def rebuild_search_index(self, batch_size: int = 1000) -> int:
+        """Reconstruit l'index de recherche depuis la collection entreprises (curseur par lots)"""
+        client = pymongo.MongoClient(self.mongo_uri)
+        print(f"🔎 Reconstruction de l'index de recherche dans {self.search_index}...")
+        start = time.time()
+        try:
+            count = rebuild_search_index(client[self.mongo_db].entreprises, self.search_index, batch_size)
+        finally:
+            client.close()
+        print(f"✅ Index reconstruit en {time.time() - start:.1f}s: {count} entreprises")
+        return count
+
+    def search(self, query: str, field: str = "name", mode: str = "fuzzy", limit: Optional[int] = None) -> list:
+        """Recherche dans l'index local (approchée ou par préfixe) et affiche les résultats"""
+        index = SearchIndex(self.search_index)
+        start = time.perf_counter()
+        find = index.prefix if mode == "prefix" else index.search
+        results = find(query, field=field, limit=limit or 10)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"🔎 {len(results)} résultat(s) pour « {query} » ({field}, {mode}) en {elapsed:.1f} ms")
+        for result in results:
+            print(f"   {result['enterprise_number']}  {result['score']:.3f}  {result['text']}")
+        return results
+
+    def rebuild_graph_index(self, batch_size: int = 1000) -> Tuple[int, int]:
+        """Reconstruit l'index de graphe depuis la collection entreprises (curseur par lots)"""
+        client = pymongo.MongoClient(self.mongo_uri)
+        print(f"🕸️ Reconstruction de l'index de graphe dans {self.graph_index}...")
+        start = time.time()
+        try:
+            nodes, edges = rebuild_graph_index(client[self.mongo_db].entreprises, self.graph_index, batch_size)
+        finally:
+            client.close()
+        print(f"✅ Graphe reconstruit en {time.time() - start:.1f}s: {nodes} nœuds, {edges} arêtes")
+        return nodes, edges
+
+    def query_graph(self, key: str, hops: int = 1, kind: Optional[str] = None, limit: Optional[int] = None) -> list:
+        """Voisins (hops=1) ou nœuds à `hops` sauts d'une entreprise ou d'une personne"""
+        index = GraphIndex(self.graph_index)
+        start = time.perf_counter()
+        if hops == 1 and kind is None:
+            results = index.neighbors(key)
+        else:
+            results = index.k_hop(key, hops, kind, limit or 1000)
+        elapsed = (time.perf_counter() - start) * 1e6
+        if results is None:
+            print(f"❌ {key} absent du graphe")
             return []
+        print(f"🕸️ {len(results)} nœud(s) pour « {key} » ({hops} saut(s)) en {elapsed:.0f} µs")
+        for result in results:
+            if "role" in result:
+                detail = f"{result['role']} ({result['direction']})"
+            else:
+                detail = f"distance {result['distance']}"
+            print(f"   {result['kind']:<10}  {result['label']}  {detail}")
+        return results
+
+    def serve_api(self, port: int, host: str = "127.0.0.1", cache_size: int = 10_000, ttl: float = 300.0):
+        """Sert l'API de lecture locale jusqu'à Ctrl+C (cache invalidé par --change-log)"""
+        client = pymongo.MongoClient(self.mongo_uri)
+        api = ReadAPI(client[self.mongo_db].entreprises, host, port, cache_size, ttl, self.change_log,
+                      search_index=self.search_index, graph_index=self.graph_index)
+        invalidation = f"journal {self.change_log}" if self.change_log else f"expiration après {ttl:g}s"
+        print(f"🌐 API de lecture sur {api.address} (cache {cache_size} entrées, invalidation: {invalidation})")
+        if self.search_index:
+            print(f"🔎 Recherche sur {api.address}/search ({api.search_index.size} entreprises indexées)")
+        if self.graph_index:
+            print(f"🕸️ Graphe sur {api.address}/graph/<numéro ou nom> ({api.graph_index.size} nœuds)")
+        try:
+            api.serve_forever()
+        except KeyboardInterrupt:
+            print("🛑 API arrêtée")
+        finally:
+            client.close()
 
-    def run_spider(self, spider_name: str, enterprise_numbers: List[str]) -> bool:
-        """Exécute un spider avec les numéros d'entreprise fournis"""
+    def get_incomplete_enterprise_numbers(self, limit: Optional[int] = None) -> Tuple[List[str], List[int]]:
+        """Entreprises importées depuis l'open data dont les champs propres à la page KBO
+        n'ont jamais été scrapés"""
+        client = pymongo.MongoClient(self.mongo_uri)
+        collection = client[self.mongo_db].entreprises
+        indexes = ensure_indexes(collection)
+        # Indicateur posé par l'import et retiré par le spider KBO : lu dans l'index creux
+        cursor = collection.find({KBO_PAGE_PENDING: True}, priority_projection("kbo_spider"))
+        if KBO_PAGE_PENDING in indexes:
+            cursor = cursor.hint(KBO_PAGE_PENDING)
+        # Jamais scrapées : le statut seul départage (entreprises actives d'abord)
+        enterprise_numbers, priorities = top_numbers(cursor, "kbo_spider", limit)
+        client.close()
+
+        print(f"✅ {len(enterprise_numbers)} entreprises à compléter depuis la page KBO")
+        return enterprise_numbers, priorities
+
+    def run_kbo_complement(self, limit: Optional[int] = None) -> bool:
+        """Spider KBO limité aux entreprises de l'open data encore incomplètes"""
+        enterprise_numbers, priorities = self.get_incomplete_enterprise_numbers(limit)
+        if not enterprise_numbers:
+            print("✅ Aucune entreprise à compléter")
+            return True
+        return self.run_spider("kbo_spider", enterprise_numbers, ["-s", "KBO_OPEN_DATA_COMPLEMENT=True"],
+                               priorities)
+
+    def run_spider(self, spider_name: str, enterprise_numbers: List[str],
+                   extra_args: Optional[List[str]] = None, priorities: Optional[List[int]] = None) -> bool:
+        """Exécute un spider avec les numéros d'entreprise fournis (et leur priorité éventuelle)"""
         if not enterprise_numbers:
             print(f"⚠️  Aucun numéro d'entreprise à traiter pour {spider_name}")
             return False
 
-        # Joindre les numéros avec des virgules
-        numbers_str = ",".join(enterprise_numbers)
-
-        # Commande Scrapy
-        cmd = [
-            "scrapy", "crawl", spider_name,
-            "-a", f"enterprise_numbers={numbers_str}"
-        ]
-
-        print(f"🚀 Lancement de {spider_name} avec {len(enterprise_numbers)} numéros...")
-        print(f"Commande: {' '.join(cmd)}")
-
-        try:
-            # Exécuter le spider
-            result = subprocess.run(cmd, capture_output=True, text=True, cwd=os.getcwd())
-
-            if result.returncode == 0:
-                print(f"✅ {spider_name} terminé avec succès")
-                return True
-            else:
-                print(f"❌ {spider_name} a échoué:")
-                print(f"STDOUT: {result.stdout}")
-                print(f"STDERR: {result.stderr}")
-                return False
-
-        except Exception as e:
-            print(f"❌ Erreur lors de l'exécution de {spider_name}: {e}")
+        # Validation (clé de contrôle) et dédoublonnage avant toute requête
+        prepared = prepare(enterprise_numbers, priorities)
+        print(f"🧮 {format_report(prepared.report)}")
+        if not len(prepared.values):
+            print(f"⚠️  Aucun numéro valide à traiter pour {spider_name}")
             return False
 
+        # Un fichier .npz par worker (un seul processus par défaut) : pas de liste géante en argument
+        os.makedirs(self.run_dir, exist_ok=True)
+        worker_args = []
+        for index, (shard, shard_priorities) in enumerate(split_shards(prepared, self.workers)):
+            if not len(shard):
+                continue
+            path = os.path.join(self.run_dir, f"{spider_name}-{index}-numbers.npz")
+            save_numbers(path, shard, shard_priorities)
+            worker_args.append(["-a", f"enterprise_numbers_file={path}", *(extra_args or [])])
+
+        self.number_reports[spider_name] = prepared.report
+        print(f"🚀 Lancement de {spider_name} avec {len(prepared.values)} numéros "
+              f"({len(worker_args)} processus)...")
+        return self.run_crawl(spider_name, worker_args)
+
     def run_kbo_spider_with_csv(self, limit: Optional[int] = None) -> bool:
         """Exécute le spider KBO (qui utilise déjà un CSV)"""
-        cmd = ["scrapy", "crawl", "kbo_spider"]
         if limit:
             print(f"⚠️  Note: kbo_spider utilise son propre fichier CSV, le paramètre limit est ignoré")
 
-        print(f"🚀 Lancement de kbo_spider...")
+        # kbo_spider lit lui-même son CSV : chaque worker filtre sur son shard
+        if self.workers > 1:
+            worker_args = [["-a", f"shard={i}/{self.workers}"] for i in range(self.workers)]
+        else:
+            worker_args = [[]]
+
+        print(f"🚀 Lancement de kbo_spider ({len(worker_args)} processus)...")
+        return self.run_crawl("kbo_spider", worker_args)
+
+    def run_crawl(self, spider_name: str, worker_args: List[List[str]]) -> bool:
+        """Lance un `scrapy crawl` par worker et suit leurs sorties en flux : log rotatif par
+        worker, progression affichée en direct, stats Scrapy relues à la fin pour le rapport.
+
+        Avec plusieurs workers, un coordinateur local répartit les créneaux par hôte
+        pour que le débit cumulé reste celui de --host-rate (par défaut, celui du spider
+        lancé seul : 1 / DOWNLOAD_DELAY).
+        """
+        os.makedirs(self.run_dir, exist_ok=True)
+        coordinator = None
+        common_args = ["-s", "LOG_FILE=", "-s", f"LOGSTATS_INTERVAL={self.progress_interval}"]
+        if self.negative_cache:
+            common_args += ["-s", "NEGATIVE_CACHE_ENABLED=True"]
+        # Échecs mis de côté (file dead_letters) plutôt que réessayés en occupant les slots
+        common_args += ["-s", "DEAD_LETTER_ENABLED=True"]
+        if self.feed_dir:
+            common_args += ["-s", f"FEED_EXPORT_DIR={self.feed_dir}",
+                            "-s", f"FEED_EXPORT_FORMATS={','.join(self.feed_formats)}"]
+        if self.change_log:
+            common_args += ["-s", f"CHANGE_LOG_DIR={self.change_log}"]
+        if self.search_index:
+            common_args += ["-s", f"SEARCH_INDEX_DIR={self.search_index}"]
+        if self.graph_index:
+            common_args += ["-s", f"GRAPH_INDEX_DIR={self.graph_index}"]
+        if self.moniteur_pdf:
+            common_args += ["-s", f"MONITEUR_PDF_DIR={self.moniteur_pdf}",
+                            "-s", f"MONITEUR_PDF_WORKERS={self.moniteur_pdf_workers}"]
+
+        if len(worker_args) > 1:
+            host_rate = self.host_rate or spider_host_rate(spider_name)
+            coordinator = RateCoordinator(host_rate)
+            address = coordinator.start()
+            print(f"🚦 Coordinateur de débit sur {address} ({host_rate:.2f} req/s par hôte)")
+            # Le coordinateur remplace les délais locaux, qui ne voient qu'un worker
+            common_args += [
+                "-s", f"RATE_COORDINATOR={address}",
+                "-s", f"RATE_LIMIT_FALLBACK_DELAY={len(worker_args) / host_rate}",
+                "-s", "DOWNLOAD_DELAY=0",
+                "-s", "AUTOTHROTTLE_ENABLED=False",
+            ]
+
+        start = time.time()
+        result = {"spider": spider_name, "status": "FAILED", "error": None, "workers": len(worker_args)}
+        workers = []
 
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, cwd=os.getcwd())
-
-            if result.returncode == 0:
-                print(f"✅ kbo_spider terminé avec succès")
-                return True
+            for index, args in enumerate(worker_args):
+                tag = spider_name if len(worker_args) == 1 else f"{spider_name}-{index}"
+                # File du scheduler sur disque (un JOBDIR par worker) plutôt qu'en mémoire
+                jobdir = os.path.join(self.run_dir, "queues", tag)
+                workers.append(self.start_worker(spider_name, tag, args + common_args + ["-s", f"JOBDIR={jobdir}"],
+                                                 start))
+
+            failed = []
+            for worker in workers:
+                returncode = worker["process"].wait()
+                worker["reader"].join()
+                if returncode != 0:
+                    failed.append(worker)
+                    print(f"❌ {worker['tag']} a échoué (code {returncode}) - dernières lignes:")
+                    print("\n".join(worker["tail"]))
+
+            if failed:
+                result["error"] = ", ".join(
+                    f"{w['tag']}: exit code {w['process'].returncode}" for w in failed
+                )
             else:
-                print(f"❌ kbo_spider a échoué:")
-                print(f"STDOUT: {result.stdout}")
-                print(f"STDERR: {result.stderr}")
-                return False
+                print(f"✅ {spider_name} terminé avec succès")
+                result["status"] = "SUCCESS"
 
         except Exception as e:
-            print(f"❌ Erreur lors de l'exécution de kbo_spider: {e}")
-            return False
+            print(f"❌ Erreur lors de l'exécution de {spider_name}: {e}")
+            result["error"] = str(e)
+            for worker in workers:
+                if worker["process"].poll() is None:
+                    worker["process"].terminate()
+
+        finally:
+            if coordinator:
+                coordinator.stop()
+
+        result["duration"] = time.time() - start
+        result["log_files"] = [w["log_path"] for w in workers]
+        result["stats"] = self.summarize_stats(
+            merge_stats([load_stats(w["stats_path"]) for w in workers]), result["duration"]
+        )
+        # Numéros préparés par le runner : son décompte inclut les rejets
+        if spider_name in self.number_reports:
+            result["stats"]["numbers"] = self.number_reports[spider_name]
+        self.results[spider_name] = result
+        return result["status"] == "SUCCESS"
+
+    def start_worker(self, spider_name: str, tag: str, args: List[str], start: float) -> dict:
+        """Démarre un processus `scrapy crawl` et un thread qui relaie sa sortie"""
+        log_path = os.path.join(self.run_dir, f"{tag}.log")
+        stats_path = os.path.join(self.run_dir, f"{tag}-stats.json")
+
+        # LOG_FILE vide : le log du spider part sur stderr, que le runner lit en flux
+        cmd = ["scrapy", "crawl", spider_name, *args, "-s", f"STATS_DUMP_FILE={stats_path}"]
+        print(f"Commande: {' '.join(cmd if len(' '.join(cmd)) < 300 else cmd[:3] + ['...'])}")
+        print(f"📝 Log: {log_path}")
+
+        process = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, bufsize=1, cwd=os.getcwd()
+        )
+        worker = {
+            "tag": tag,
+            "process": process,
+            "log_path": log_path,
+            "stats_path": stats_path,
+            "tail": deque(maxlen=self.tail_lines),
+        }
+        worker["reader"] = threading.Thread(target=self.relay_output, args=(worker, start), daemon=True)
+        worker["reader"].start()
+        return worker
+
+    def relay_output(self, worker: dict, start: float) -> None:
+        child_log = self.child_logger(worker["tag"], worker["log_path"])
+        try:
+            for line in worker["process"].stdout:
+                line = line.rstrip("\n")
+                child_log.info(line)
+                worker["tail"].append(line)
+                self.show_progress(worker["tag"], line, start)
+        finally:
+            for handler in list(child_log.handlers):
+                handler.close()
+                child_log.removeHandler(handler)
+
+    def child_logger(self, spider_name: str, log_path: str) -> logging.Logger:
+        child_log = logging.getLogger(f"run_spiders.{spider_name}")
+        child_log.setLevel(logging.INFO)
+        child_log.propagate = False
+        handler = RotatingFileHandler(
+            log_path, maxBytes=self.log_max_bytes, backupCount=self.log_backups, encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        child_log.addHandler(handler)
+        return child_log
+
+    def show_progress(self, spider_name: str, line: str, start: float) -> None:
+        """Affiche la ligne LogStats du spider sous forme de progression"""
+        match = LOGSTATS_RE.search(line)
+        if match:
+            pages, pages_rate, items, items_rate = match.groups()
+            print(f"   ⏱️  {spider_name} [{time.time() - start:7.0f}s] "
+                  f"{pages} pages ({pages_rate}/min), {items} items ({items_rate}/min)", flush=True)
+        elif " ERROR: " in line or "Traceback" in line:
+            print(f"   ⚠️  {line[:200]}", flush=True)
+
+    @staticmethod
+    def summarize_stats(stats: dict, duration: float) -> dict:
+        """Résumé des stats Scrapy écrites par les workers (STATS_DUMP_FILE)"""
+        if not stats:
+            return {}
+
+        items = stats.get("item_scraped_count", 0)
+        hits = stats.get("httpcache/hit", 0)
+        misses = stats.get("httpcache/miss", 0)
+        elapsed = stats.get("elapsed_time_seconds") or duration
+        return {
+            "finish_reason": stats.get("finish_reason"),
+            "items": items,
+            "items_dropped": stats.get("item_dropped_count", 0),
+            "requests": stats.get("downloader/request_count", 0),
+            "responses": stats.get("downloader/response_count", 0),
+            "cache_hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+            "retries": stats.get("retry/count", 0),
+            "errors": stats.get("log_count/ERROR", 0),
+            "bytes": stats.get("downloader/response_bytes", 0),
+            "items_per_second": round(items / elapsed, 3) if elapsed else None,
+            "mongo": {k.split("/", 1)[1]: v for k, v in stats.items() if k.startswith("mongo/")},
+            "rate_limit_wait_seconds": round(stats.get("ratelimit/wait_seconds", 0), 1),
+            "dead_letters": {k.split("/", 1)[1]: v for k, v in stats.items() if k.startswith("dead_letters/")},
+            "negative_cache": {k.split("/", 1)[1]: v for k, v in stats.items() if k.startswith("negative_cache/")},
+            "numbers": {k.split("/", 1)[1]: v for k, v in stats.items() if k.startswith("numbers/")},
+            "connections": SpiderRunner.summarize_connections(stats),
+            "dns": {k.split("/", 1)[1]: v for k, v in stats.items() if k.startswith("dns/")},
+            "feeds": {k.split("/", 1)[1]: v for k, v in stats.items() if k.startswith("feeds/")},
+            "search_index_items": stats.get("search_index/items", 0),
+            "graph_index": {k.split("/", 1)[1]: v for k, v in stats.items() if k.startswith("graph_index/")},
+            "moniteur_pdf": SpiderRunner.summarize_moniteur_pdf(stats, elapsed),
+        }
+
+    @staticmethod
+    def summarize_moniteur_pdf(stats: dict, elapsed: float) -> dict:
+        """PDF du Moniteur (kbo_scraper/moniteur_pdf.py) : compteurs, débit d'extraction et
+        profondeur maximale de la file du pool"""
+        summary = {k.split("/", 1)[1]: v for k, v in stats.items() if k.startswith("moniteur_pdf/")}
+        if not summary:
+            return {}
+        extracted = summary.get("extracted", 0)
+        summary["extract_seconds"] = round(summary.get("extract_seconds", 0), 1)
+        summary["pdf_per_second"] = round(extracted / elapsed, 3) if elapsed else None
+        summary["pages_per_worker_second"] = (
+            round(summary.get("pages", 0) / summary["extract_seconds"], 1) if summary["extract_seconds"] else None
+        )
+        return summary
+
+    @staticmethod
+    def summarize_connections(stats: dict) -> dict:
+        """Par hôte : connexions ouvertes / réutilisées, reprises de session TLS et durée
+        moyenne des poignées de main (kbo_scraper/connections.py)"""
+        hosts = {}
+        for key, value in stats.items():
+            parts = key.split("/", 2)
+            if len(parts) == 3 and parts[0] in ("connections", "tls"):
+                hosts.setdefault(parts[2], {})[f"{parts[0]}/{parts[1]}"] = value
+
+        summary = {}
+        for host, values in sorted(hosts.items()):
+            new = values.get("connections/new", 0)
+            reused = values.get("connections/reused", 0)
+            handshakes = values.get("tls/handshakes", 0)
+            summary[host] = {
+                "new": new,
+                "reused": reused,
+                "reuse_rate": round(reused / (new + reused), 3) if new + reused else None,
+                "tls_handshakes": handshakes,
+                "tls_resumed": values.get("tls/resumed", 0),
+                "handshake_ms": (round(values.get("tls/handshake_seconds", 0) / handshakes * 1000, 1)
+                                 if handshakes else None),
+                "connect_ms": (round(values.get("connections/connect_seconds", 0) / new * 1000, 1)
+                               if new else None),
+            }
+        return summary
+
+    def write_report(self, mode: str, limit: Optional[int]) -> str:
+        """Écrit spider_report_<date>.json avec le résumé de chaque spider"""
+        path = f"spider_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        report = {
+            "timestamp": datetime.now().isoformat(),
+            "mode": mode,
+            "limit": limit,
+            "run_dir": self.run_dir,
+            "results": self.results,
+            "summary": {
+                "total_spiders": len(self.results),
+                "successful": sum(1 for r in self.results.values() if r["status"] == "SUCCESS"),
+                "total_duration": sum(r["duration"] for r in self.results.values()),
+                "total_items": sum(r["stats"].get("items", 0) for r in self.results.values()),
+            },
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"📄 Rapport écrit dans {path}")
+        return path
 
 
 def main():
     parser = argparse.ArgumentParser(description="Exécuteur de spiders KBO")
     parser.add_argument("--spider", choices=["kbo_spider", "ejustice_spider", "consult_spider", "all"],
-                        required=True, help="Spider à exécuter")
-    parser.add_argument("--limit", type=int, help="Nombre maximum d'entreprises à traiter")
+                        help="Spider à exécuter")
+    parser.add_argument("--limit", type=int,
+                        help="Nombre maximum d'entreprises à traiter (les plus utiles à rafraîchir)")
     parser.add_argument("--mongo-uri", default="mongodb://localhost:27017", help="URI MongoDB")
     parser.add_argument("--mongo-db", default="kbo_db", help="Base de données MongoDB")
     parser.add_argument("--diagnose", action="store_true", help="Effectuer un diagnostic de la base de données")
+    parser.add_argument("--migrate-schema", action="store_true",
+                        help="Migrer les documents existants vers le schéma courant")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Taille des lots de migration et d'import")
+    parser.add_argument("--import-open-data", metavar="DOSSIER",
+                        help="Importer le dump CSV de KBO Open Data (enterprise.csv, denomination.csv...)")
+    parser.add_argument("--complement", action="store_true",
+                        help="kbo_spider ne scrape que les entreprises de l'open data encore incomplètes")
+    parser.add_argument("--progress-interval", type=int, default=15,
+                        help="Intervalle (s) d'affichage de la progression des spiders")
+    parser.add_argument("--run-dir", help="Dossier des logs et stats de l'exécution (défaut: runs/<date>)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Nombre de processus par spider (numéros répartis par shard)")
+    parser.add_argument("--host-rate", type=float,
+                        help="Débit maximal par hôte, tous workers confondus (requêtes/s ; "
+                             "défaut : 1 / DOWNLOAD_DELAY du spider)")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Relancer les requêtes en échec mises de côté (file dead_letters)")
+    parser.add_argument("--recheck-empty", action="store_true",
+                        help="Redemander aussi les entreprises sans publication/dépôt vérifiées récemment")
+    parser.add_argument("--feed-dir", help="Écrire aussi les items en Parquet / Arrow / JSONL zstd dans ce dossier")
+    parser.add_argument("--feed-format", default="parquet,jsonl.zst",
+                        help="Formats d'export séparés par des virgules: parquet, arrow, jsonl.zst")
+    parser.add_argument("--export", metavar="DOSSIER",
+                        help="Exporter la collection entreprises (hors crawl) dans les formats --feed-format")
+    parser.add_argument("--change-log", metavar="DOSSIER",
+                        help="Journal des modifications de la collection entreprises (écrit pendant le crawl)")
+    parser.add_argument("--read-changes", metavar="CONSOMMATEUR",
+                        help="Afficher (JSONL) les modifications pas encore lues par ce consommateur (--limit par lot)")
+    parser.add_argument("--serve-api", type=int, metavar="PORT",
+                        help="Servir l'API de lecture locale (HTTP/JSON) sur ce port")
+    parser.add_argument("--api-cache-size", type=int, default=10_000, help="Entrées du cache de l'API")
+    parser.add_argument("--api-ttl", type=float, default=300.0, help="Durée de vie (s) des entrées du cache de l'API")
+    parser.add_argument("--search-index", metavar="DOSSIER",
+                        help="Index de recherche local (alimenté pendant le crawl, servi par --serve-api)")
+    parser.add_argument("--rebuild-search-index", action="store_true",
+                        help="Reconstruire l'index de recherche depuis la collection entreprises")
+    parser.add_argument("--search", metavar="TEXTE", help="Rechercher dans l'index local (--limit résultats)")
+    parser.add_argument("--search-field", choices=list(SEARCH_FIELDS), default="name",
+                        help="Champ recherché par --search")
+    parser.add_argument("--search-mode", choices=["fuzzy", "prefix"], default="fuzzy",
+                        help="Recherche approchée (trigrammes) ou par préfixe (autocomplétion)")
+    parser.add_argument("--graph-index", metavar="DOSSIER",
+                        help="Index de graphe dirigeants / entreprises (alimenté pendant le crawl, servi par --serve-api)")
+    parser.add_argument("--rebuild-graph-index", action="store_true",
+                        help="Reconstruire l'index de graphe depuis la collection entreprises")
+    parser.add_argument("--graph", metavar="NUMERO_OU_NOM",
+                        help="Voisins d'une entreprise ou d'une personne dans l'index de graphe")
+    parser.add_argument("--hops", type=int, default=1, help="Nombre de sauts parcourus par --graph")
+    parser.add_argument("--graph-kind", choices=list(KIND_NAMES), help="Ne garder que ce type de nœud (--graph)")
+    parser.add_argument("--moniteur-pdf", metavar="DOSSIER",
+                        help="Télécharger les PDF des publications (une fois) et en extraire le texte (requiert pypdf)")
+    parser.add_argument("--moniteur-pdf-workers", type=int, default=2,
+                        help="Processus d'extraction du texte des PDF")
 
     args = parser.parse_args()
-
-    runner = SpiderRunner(args.mongo_uri, args.mongo_db)
+    if args.workers < 1 or (args.host_rate is not None and args.host_rate <= 0):
+        parser.error("--workers doit être >= 1 et --host-rate > 0")
+
+    runner = SpiderRunner(args.mongo_uri, args.mongo_db, args.run_dir, args.progress_interval,
+                          args.workers, args.host_rate, negative_cache=not args.recheck_empty,
+                          feed_dir=args.feed_dir,
+                          feed_formats=[fmt.strip() for fmt in args.feed_format.split(",") if fmt.strip()],
+                          change_log=args.change_log, search_index=args.search_index,
+                          graph_index=args.graph_index, moniteur_pdf=args.moniteur_pdf,
+                          moniteur_pdf_workers=args.moniteur_pdf_workers)
+    if (args.rebuild_search_index or args.search) and not args.search_index:
+        parser.error("--rebuild-search-index et --search nécessitent --search-index")
+    if (args.rebuild_graph_index or args.graph) and not args.graph_index:
+        parser.error("--rebuild-graph-index et --graph nécessitent --graph-index")
+
+    # Recherche locale : ni Mongo ni réseau
+    if args.search:
+        runner.search(args.search, args.search_field, args.search_mode, args.limit)
+        return
+    if args.graph:
+        runner.query_graph(args.graph, args.hops, args.graph_kind, args.limit)
+        return
 
     # Test de la connexion MongoDB
-    if not runner.test_mongodb_connection():
+    # --read-changes écrit les enregistrements sur stdout : messages sur stderr
+    if not runner.test_mongodb_connection(sys.stderr if args.read_changes else None):
         sys.exit(1)
 
     # Diagnostic si demandé
     if args.diagnose:
-        runner.diagnose_database()
+        if not runner.diagnose_database():
+            sys.exit(1)
+        return
+
+    if args.migrate_schema:
+        runner.migrate_schema(args.batch_size)
+        return
+
+    if args.serve_api:
+        runner.serve_api(args.serve_api, cache_size=args.api_cache_size, ttl=args.api_ttl)
         return
 
+    if args.read_changes:
+        if not args.change_log:
+            parser.error("--read-changes nécessite --change-log")
+        runner.read_changes(args.read_changes, args.limit)
+        return
+
+    if args.export:
+        runner.export_feeds(args.export, args.batch_size)
+        return
+
+    if args.rebuild_search_index:
+        runner.rebuild_search_index(args.batch_size)
+        return
+
+    if args.rebuild_graph_index:
+        runner.rebuild_graph_index(args.batch_size)
+        return
+
+    if args.import_open_data:
+        runner.import_open_data(args.import_open_data, args.batch_size)
+        if not args.spider:
+            return
+
+    if not args.spider:
+        parser.error("--spider est requis")
+
+    if args.retry_failed:
+        spiders = ["kbo_spider", "ejustice_spider", "consult_spider"] if args.spider == "all" else [args.spider]
+        extra_args = ["-s", "KBO_OPEN_DATA_COMPLEMENT=True"] if args.complement else None
+        success = runner.retry_failed(spiders, args.limit, extra_args)
+        runner.write_report(f"{args.spider} (retry-failed)", args.limit)
+        sys.exit(0 if success else 1)
+
     if args.spider == "kbo_spider":
-        # KBO spider utilise son propre CSV
-        success = runner.run_kbo_spider_with_csv(args.limit)
+        # KBO spider utilise son propre CSV, ou complète l'open data
+        if args.complement:
+            success = runner.run_kbo_complement(args.limit)
+        else:
+            success = runner.run_kbo_spider_with_csv(args.limit)
+        runner.write_report(args.spider, args.limit)
         sys.exit(0 if success else 1)
 
     elif args.spider == "all":
@@ -214,37 +949,41 @@ def main():
         print("\n" + "=" * 50)
         print("Phase 1: KBO Spider - Récupération des données de base")
         print("=" * 50)
-        kbo_success = runner.run_kbo_spider_with_csv()
+        if args.complement:
+            kbo_success = runner.run_kbo_complement(args.limit)
+        else:
+            kbo_success = runner.run_kbo_spider_with_csv()
 
         if not kbo_success:
             print("❌ Échec du spider KBO - Arrêt de l'exécution")
+            runner.write_report("all", args.limit)
             sys.exit(1)
 
         print("✅ KBO Spider terminé - Attente de 5 secondes pour la synchronisation...")
         time.sleep(5)
 
-        # Phase 2: Récupérer les numéros d'entreprise APRÈS l'exécution de KBO
-        print("\n📋 Récupération des numéros d'entreprise depuis la base mise à jour...")
-        enterprise_numbers = runner.get_enterprise_numbers(args.limit)
-
-        if not enterprise_numbers:
-            print("❌ Aucun numéro d'entreprise trouvé après l'exécution de KBO")
-            print("💡 Vérifiez que le spider KBO a bien inséré des données")
-            sys.exit(1)
-
-        # Phase 3: Exécuter les autres spiders avec les numéros récupérés
+        # Phase 2 et 3: Récupérer les numéros d'entreprise APRÈS l'exécution de KBO, classés
+        # pour chaque spider selon l'ancienneté de ses propres passages, puis l'exécuter
         spiders_to_run = ["ejustice_spider", "consult_spider"]
         all_success = True
 
         for spider in spiders_to_run:
+            print(f"\n📋 Récupération des numéros d'entreprise depuis la base mise à jour ({spider})...")
+            enterprise_numbers, priorities = runner.get_prioritized_numbers(spider, args.limit)
+
+            if not enterprise_numbers:
+                print("❌ Aucun numéro d'entreprise trouvé après l'exécution de KBO")
+                print("💡 Vérifiez que le spider KBO a bien inséré des données")
+                runner.write_report("all", args.limit)
+                sys.exit(1)
+
             print("\n" + "=" * 50)
             print(f"Phase: {spider} - Traitement de {len(enterprise_numbers)} entreprises")
             print("=" * 50)
-            success = runner.run_spider(spider, enterprise_numbers)
+            success = runner.run_spider(spider, enterprise_numbers, priorities=priorities)
             all_success = all_success and success
 
             if success:
-                print(f"✅ {spider} terminé avec succès")
                 # Petite pause entre les spiders
                 if spider != spiders_to_run[-1]:  # Pas de pause après le dernier
                     print("⏳ Pause de 3 secondes avant le spider suivant...")
@@ -255,17 +994,20 @@ def main():
         print("\n" + "=" * 60)
         print(f"🏁 Exécution terminée - Succès global: {'✅' if all_success else '⚠️'}")
         print("=" * 60)
+        runner.write_report("all", args.limit)
         sys.exit(0 if all_success else 1)
 
     else:
-        # Spider individuel (ejustice ou consult)
-        enterprise_numbers = runner.get_enterprise_numbers(args.limit)
+        # Spider individuel (ejustice ou consult) : les entreprises les plus utiles à rafraîchir
+        # d'abord, dans la limite de --limit
+        enterprise_numbers, priorities = runner.get_prioritized_numbers(args.spider, args.limit)
 
         if not enterprise_numbers:
             print("❌ Impossible de récupérer les numéros d'entreprise")
             sys.exit(1)
 
-        success = runner.run_spider(args.spider, enterprise_numbers)
+        success = runner.run_spider(args.spider, enterprise_numbers, priorities=priorities)
+        runner.write_report(args.spider, args.limit)
         sys.exit(0 if success else 1)
 
 